@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-17 19:50
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_auto_20210324_2116'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='refresh_token_hash',
+        ),
+    ]
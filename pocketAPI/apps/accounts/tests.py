@@ -1,10 +1,29 @@
+import base64
+import json
+import os
+import tempfile
 from unittest.mock import patch
 
+import jwt
+from asgiref.sync import async_to_sync
+
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
 from django.shortcuts import resolve_url
-from django.test import TestCase
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from async_helpers import async_authenticate
+from jwt_helper import sessions
+from jwt_helper.keys import reset_key_ring
+from jwt_helper.token import AccessToken, DecodedTokenCache, decoded_tokens
+from jwt_helper.user_cache import get_cached_user_data, get_user_cache_key, invalidate_cached_user
+from redis_helper import get_redis, make_key, save_to_redis
+from throttling import RedisRateThrottle, check_rate
 
 
+@override_settings(LIST_CACHE_TTL=0, RATE_LIMITS={})
 class AccountsTest(TestCase):
     def setUp(self) -> None:
         self.UserModel = get_user_model()
@@ -83,7 +102,251 @@ class AccountsTest(TestCase):
         self.assertContains(response, 'access_token')
         self.assertContains(response, 'refresh_token')
 
+    def get_access_token(self):
+        url = resolve_url('accounts:login')
+        response = self.client.post(url, {'username': self.confirmed_user.username, 'password': '123'})
+        return response.json()['access_token']
+
+    @override_settings(JWT_STATELESS_USER=True)
+    def test_stateless_authentication_does_not_query_user(self):
+        access_token = self.get_access_token()
+        # only query for pockets
+        with self.assertNumQueries(1):
+            response = self.client.get(resolve_url('pocket:pocket-list'), HTTP_ACCESS_TOKEN=access_token)
+        self.assertEquals(response.status_code, 200)
+
+    def test_decoded_token_is_cached(self):
+        access_token = self.get_access_token()
+        decoded_tokens.clear()
+        AccessToken.get_payload_from_token(access_token)
+        payload = AccessToken.get_payload_from_token(access_token)
+        self.assertEquals(payload['user_id'], self.confirmed_user.pk)
+        self.assertEquals(decoded_tokens.stats()['hits'], 1)
+        self.assertEquals(decoded_tokens.stats()['misses'], 1)
+
+    def test_decoded_token_cache_is_bounded_and_expired(self):
+        cache = DecodedTokenCache(max_size=2)
+        now = timezone.now().timestamp()
+        cache.set('first', {'expired_time': now + 60})
+        cache.set('second', {'expired_time': now - 1})
+        cache.set('third', {'expired_time': now + 60})
+        self.assertIsNone(cache.get('first'))
+        self.assertIsNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('third'))
+        self.assertEquals(cache.stats()['evictions'], 1)
+        cache.invalidate('third')
+        self.assertEquals(cache.stats()['size'], 0)
+
+
+@override_settings(LIST_CACHE_TTL=0, RATE_LIMITS={}, JWT_STATELESS_USER=False, JWT_USER_CACHE_TTL=60,
+                   REDIS_PREFIX='pocketapi-test')
+class CachedUserTest(TransactionTestCase):
+    """ Transaction test case: cached user is invalidated after commit """
+
+    def setUp(self) -> None:
+        self.confirmed_user = get_user_model().objects.create_user(username='confirmed_user', email='confirmed_user',
+                                                                   password='123', is_confirmed=True)
+        # database is flushed between tests, but cached users with the same ids stay in redis
+        invalidate_cached_user(self.confirmed_user.pk)
+
+    def get_access_token(self):
+        url = resolve_url('accounts:login')
+        response = self.client.post(url, {'username': self.confirmed_user.username, 'password': '123'})
+        return response.json()['access_token']
+
+    def test_cached_user_is_invalidated_on_save(self):
+        access_token = self.get_access_token()
+        url = resolve_url('pocket:pocket-list')
+        self.client.get(url, HTTP_ACCESS_TOKEN=access_token)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_ACCESS_TOKEN=access_token)
+        self.assertEquals(response.status_code, 200)
+
+        self.confirmed_user.is_active = False
+        self.confirmed_user.save()
+        response = self.client.get(url, HTTP_ACCESS_TOKEN=access_token)
+        self.assertEquals(response.status_code, 401)
+
+    def test_async_authenticate_uses_cached_user(self):
+        request = AsyncRequestFactory().get('/', **{'access-token': self.get_access_token()})
+        # not cached user is left to sync view
+        self.assertIsNone(async_to_sync(async_authenticate)(request))
+        get_cached_user_data(self.confirmed_user.pk)
+        self.assertEquals(async_to_sync(async_authenticate)(request).pk, self.confirmed_user.pk)
+
+        self.confirmed_user.is_active = False
+        self.confirmed_user.save()
+        get_cached_user_data(self.confirmed_user.pk)
+        self.assertIsNone(async_to_sync(async_authenticate)(request))
+
+    def test_user_is_invalidated_after_commit(self):
+        old_data = get_cached_user_data(self.confirmed_user.pk)
+        with transaction.atomic():
+            self.confirmed_user.is_active = False
+            self.confirmed_user.save()
+            # concurrent request reads row which is not committed yet and caches it again
+            save_to_redis(get_user_cache_key(self.confirmed_user.pk), json.dumps(old_data), time=60)
+        self.assertFalse(get_cached_user_data(self.confirmed_user.pk)['is_active'])
+
+
+class KeyRingTest(TestCase):
+    def setUp(self) -> None:
+        self.keys_dir = tempfile.TemporaryDirectory()
+        self.add_key('2021-03')
+        self.user = get_user_model().objects.create_user(username='user', email='user', password='123',
+                                                         is_confirmed=True)
+        self.settings_override = override_settings(JWT_ALGORITHM='RS256', JWT_KEYS_DIR=self.keys_dir.name)
+        self.settings_override.enable()
+        reset_key_ring()
+        decoded_tokens.clear()
+
+    def tearDown(self) -> None:
+        self.settings_override.disable()
+        self.keys_dir.cleanup()
+        reset_key_ring()
+        decoded_tokens.clear()
+
+    def add_key(self, kid):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        with open(os.path.join(self.keys_dir.name, f'{kid}.pem'), 'wb') as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                      serialization.NoEncryption()))
+
+    @staticmethod
+    def get_kid(token):
+        return jwt.get_unverified_header(base64.b64decode(token).decode())['kid']
+
+    def test_token_is_signed_with_last_key(self):
+        token = AccessToken.for_user(self.user).b64_encoded.decode()
+        self.assertEquals(self.get_kid(token), '2021-03')
+        self.assertEquals(AccessToken.get_user_from_token(token).pk, self.user.pk)
+
+    def test_rotated_key_verifies_old_tokens(self):
+        old_token = AccessToken.for_user(self.user).b64_encoded.decode()
+        self.add_key('2021-04')
+        reset_key_ring()
+        decoded_tokens.clear()
+        new_token = AccessToken.for_user(self.user).b64_encoded.decode()
+        self.assertEquals(self.get_kid(new_token), '2021-04')
+        self.assertEquals(AccessToken.get_user_from_token(old_token).pk, self.user.pk)
+
+        response = self.client.get(resolve_url('jwt:keys'))
+        self.assertEquals([key['kid'] for key in response.json()['keys']], ['2021-03', '2021-04'])
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_key_set_verifies_token(self):
+        token = AccessToken.for_user(self.user).value
+        jwk = self.client.get(resolve_url('jwt:keys')).json()['keys'][0]
+        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(jwk)
+        self.assertEquals(jwt.decode(token, key=public_key, algorithms=['RS256'])['user_id'], self.user.pk)
+
+    def test_keys_dir_is_required(self):
+        reset_key_ring()
+        with override_settings(JWT_KEYS_DIR=None), patch('os.listdir') as listdir:
+            with self.assertRaises(ImproperlyConfigured):
+                AccessToken.for_user(self.user)
+        listdir.assert_not_called()
+
+
+@override_settings(REDIS_PREFIX='pocketapi-test', RATE_LIMITS={})
+class RefreshSessionsTest(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username='user', email='user', password='123',
+                                                         is_confirmed=True)
+        sessions.revoke_user_sessions(self.user.pk)
+
+    def login(self):
+        response = self.client.post(resolve_url('accounts:login'), {'username': 'user', 'password': '123'})
+        return response.json()['refresh_token']
+
+    def update_tokens(self, refresh_token):
+        return self.client.post(resolve_url('jwt:update-tokens'), {'refresh_token': refresh_token})
+
+    def test_login_does_not_update_user(self):
+        # only select of user
+        with self.assertNumQueries(1):
+            self.login()
+
+    def test_refresh_token_is_rotated(self):
+        refresh_token = self.login()
+        response = self.update_tokens(refresh_token)
+        self.assertEquals(response.status_code, 200)
+        new_refresh_token = response.json()['refresh_token']
+        self.assertNotEquals(new_refresh_token, refresh_token)
+        self.assertEquals(self.update_tokens(new_refresh_token).status_code, 200)
+
+    def test_reused_refresh_token_revokes_session(self):
+        refresh_token = self.login()
+        other_device_token = self.login()
+        new_refresh_token = self.update_tokens(refresh_token).json()['refresh_token']
+
+        self.assertEquals(self.update_tokens(refresh_token).status_code, 400)
+        self.assertEquals(self.update_tokens(new_refresh_token).status_code, 400)
+        self.assertEquals(self.update_tokens(other_device_token).status_code, 200)
+        self.assertEquals(len(sessions.get_user_sessions(self.user.pk)), 1)
+
+    def test_revoke_tokens(self):
+        refresh_token = self.login()
+        other_device_token = self.login()
+        self.assertEquals(len(sessions.get_user_sessions(self.user.pk)), 2)
+
+        response = self.client.post(resolve_url('jwt:revoke-tokens'), {'refresh_token': refresh_token})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(self.update_tokens(refresh_token).status_code, 400)
+
+        response = self.client.post(resolve_url('jwt:revoke-tokens'), {'refresh_token': other_device_token,
+                                                                       'all_sessions': True})
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(sessions.get_user_sessions(self.user.pk), [])
+
+
+@override_settings(REDIS_PREFIX='pocketapi-test', RATE_LIMITS={'login': '2/min', 'email-token': '1/min'})
+class RateLimitTest(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username='user', email='user', password='123',
+                                                         is_confirmed=True)
+        get_redis().delete(*(make_key(RedisRateThrottle.cache_format % {'scope': scope, 'ident': '127.0.0.1'})
+                             for scope in ('login', 'email-token', 'test')))
+
+    def login(self, password='123'):
+        return self.client.post(resolve_url('accounts:login'), {'username': 'user', 'password': password})
 
+    def test_login_is_limited_per_ip(self):
+        self.assertEquals(self.login(password='wrong').status_code, 400)
+        self.assertEquals(self.login().status_code, 200)
+        # password is not checked for throttled request
+        with patch('jwt_helper.serializers.authenticate') as authenticate:
+            response = self.login()
+        self.assertFalse(authenticate.called)
+        self.assertEquals(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
 
+    def test_forwarded_for_does_not_reset_limit(self):
+        for i in range(2):
+            self.client.post(resolve_url('accounts:login'), {'username': 'user', 'password': '123'},
+                             HTTP_X_FORWARDED_FOR='10.0.0.{}'.format(i))
+        response = self.client.post(resolve_url('accounts:login'), {'username': 'user', 'password': '123'},
+                                    HTTP_X_FORWARDED_FOR='10.0.0.3')
+        self.assertEquals(response.status_code, 429)
 
+    def test_scopes_are_limited_separately(self):
+        self.login()
+        self.login()
+        response = self.client.post(resolve_url('accounts:confirm_email'), {'username': 'user', 'password': '123'})
+        self.assertNotEquals(response.status_code, 429)
+        response = self.client.post(resolve_url('accounts:confirm_email'), {'username': 'user', 'password': '123'})
+        self.assertEquals(response.status_code, 429)
 
+    def test_check_rate(self):
+        self.assertEquals(check_rate('test', '127.0.0.1', 2, 60), 0)
+        # script is loaded again if redis lost it
+        get_redis().script_flush()
+        self.assertEquals(check_rate('test', '127.0.0.1', 2, 60), 0)
+        wait_ms = check_rate('test', '127.0.0.1', 2, 60)
+        self.assertTrue(0 < wait_ms <= 60 * 1000)
+        key = make_key(RedisRateThrottle.cache_format % {'scope': 'test', 'ident': '127.0.0.1'})
+        # denied request is not recorded, key expires with window
+        self.assertEquals(get_redis().zcard(key), 2)
+        self.assertTrue(0 < get_redis().pttl(key) <= 60 * 1000)
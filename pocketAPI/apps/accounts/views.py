@@ -6,6 +6,7 @@ from rest_framework.views import APIView
 from accounts.serializer import UserSerializer, EmailTokenSerializer, ResendEmailTokenSerializer
 from jwt_helper.serializers import JWTSerializer, AuthenticateUserToken
 from serializers_helpers import MessageSerializer
+from throttling import RedisRateThrottle
 
 
 class CreateUserView(CreateAPIView):
@@ -20,6 +21,8 @@ class LoginView(APIView):
         Login and get access and refresh tokens
     """
     serializer_class = AuthenticateUserToken
+    throttle_classes = [RedisRateThrottle]
+    throttle_scope = 'login'
 
     def get_serializer(self):
         return self.serializer_class()
@@ -36,6 +39,8 @@ class SendEmailToken(APIView):
         Send confirmation email again
     """
     serializer_class = ResendEmailTokenSerializer
+    throttle_classes = [RedisRateThrottle]
+    throttle_scope = 'email-token'
 
     def get_serializer(self):
         return self.serializer_class()
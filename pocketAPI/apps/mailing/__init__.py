@@ -0,0 +1 @@
+default_app_config = 'mailing.apps.MailingConfig'
\ No newline at end of file
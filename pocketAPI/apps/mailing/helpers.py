@@ -0,0 +1,15 @@
+from enum import IntEnum
+
+
+class EmailStatus(IntEnum):
+    PENDING = 1
+    SENT = 2
+    FAILED = 3
+
+    @classmethod
+    def choices(cls):
+        return tuple((obj.value, obj.name) for obj in cls)
+
+    @classmethod
+    def dict(cls):
+        return dict(cls.choices())
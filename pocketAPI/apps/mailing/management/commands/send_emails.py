@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mailing.models import OutgoingEmail
+
+
+class Command(BaseCommand):
+    help = 'Send emails from outbox. Works until it is stopped, or sends all ready emails with --once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='send ready emails and exit')
+        parser.add_argument('--batch-size', type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE,
+                            help='how many emails are sent through one smtp connection')
+        parser.add_argument('--interval', type=float, default=settings.EMAIL_OUTBOX_POLL_INTERVAL,
+                            help='seconds to sleep when outbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = OutgoingEmail.send_batch(options['batch_size'])
+            if processed:
+                self.stdout.write('processed {} emails'.format(processed))
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+# Generated by Django 3.1.7 on 2026-10-17 19:43
+
+from django.db import migrations, models
+import django.utils.timezone
+import mailing.helpers
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=512, verbose_name='subject')),
+                ('message', models.TextField(verbose_name='message')),
+                ('html_message', models.TextField(blank=True, null=True, verbose_name='html message')),
+                ('from_email', models.CharField(max_length=256, verbose_name='from')),
+                ('recipients', models.TextField(help_text='one email address per line', verbose_name='recipients')),
+                ('status', models.PositiveIntegerField(choices=[(1, 'PENDING'), (2, 'SENT'), (3, 'FAILED')], default=mailing.helpers.EmailStatus['PENDING'], verbose_name='status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='last error')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='next attempt')),
+                ('date_sent', models.DateTimeField(blank=True, null=True, verbose_name='date sent')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outgoingemail',
+            index=models.Index(condition=models.Q(status=mailing.helpers.EmailStatus['PENDING']), fields=['next_attempt_at'], name='outgoing_email_pending_idx'),
+        ),
+    ]
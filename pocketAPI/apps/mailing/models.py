@@ -0,0 +1,121 @@
+from typing import List
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from .helpers import EmailStatus
+
+
+class OutgoingEmailQuerySet(models.QuerySet):
+    def pending(self):
+        return self.filter(status=EmailStatus.PENDING)
+
+    def ready(self):
+        return self.pending().filter(next_attempt_at__lte=timezone.now())
+
+    def enqueue(self, subject, message, recipient_list, from_email=None, html_message=None):
+        return self.create(subject=str(subject), message=str(message), recipients='\n'.join(recipient_list),
+                           from_email=from_email or settings.DEFAULT_FROM_EMAIL, html_message=html_message)
+
+
+class OutgoingEmail(models.Model):
+    """
+        Email which waits for sending by send_emails worker.
+    """
+    subject = models.CharField(_('subject'), max_length=512)
+    message = models.TextField(_('message'))
+    html_message = models.TextField(_('html message'), blank=True, null=True)
+    from_email = models.CharField(_('from'), max_length=256)
+    recipients = models.TextField(_('recipients'), help_text=_('one email address per line'))
+    status = models.PositiveIntegerField(_('status'), choices=EmailStatus.choices(), default=EmailStatus.PENDING)
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    last_error = models.TextField(_('last error'), blank=True, null=True)
+    date_created = models.DateTimeField(_('date created'), auto_now_add=True)
+    next_attempt_at = models.DateTimeField(_('next attempt'), default=timezone.now)
+    date_sent = models.DateTimeField(_('date sent'), blank=True, null=True)
+
+    objects = OutgoingEmailQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='outgoing_email_pending_idx',
+                         condition=models.Q(status=EmailStatus.PENDING)),
+        ]
+
+    @property
+    def recipient_list(self) -> List[str]:
+        return self.recipients.splitlines()
+
+    def to_message(self, connection=None) -> EmailMultiAlternatives:
+        message = EmailMultiAlternatives(subject=self.subject, body=self.message, from_email=self.from_email,
+                                         to=self.recipient_list, connection=connection)
+        if self.html_message:
+            message.attach_alternative(self.html_message, 'text/html')
+        return message
+
+    def mark_sent(self):
+        self.status = EmailStatus.SENT
+        self.attempts += 1
+        self.date_sent = timezone.now()
+        self.last_error = None
+
+    def mark_failed(self, error: str):
+        """
+            Schedule next attempt with exponential backoff or mark email as failed after last attempt.
+        """
+        self.attempts += 1
+        self.last_error = error
+        if self.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            self.status = EmailStatus.FAILED
+        else:
+            delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (self.attempts - 1)
+            self.next_attempt_at = timezone.now() + timezone.timedelta(seconds=delay)
+
+    @classmethod
+    def claim_batch(cls, batch_size: int) -> List['OutgoingEmail']:
+        """
+            Take ready emails for sending and move their next attempt by EMAIL_OUTBOX_CLAIM_TIMEOUT,
+            so other workers skip them after commit. Rows are locked with SKIP LOCKED only while they are claimed.
+            If worker dies during sending, claimed emails become ready again after timeout.
+        """
+        with transaction.atomic():
+            emails = cls.objects.ready().select_for_update(skip_locked=True).order_by('next_attempt_at')
+            emails = list(emails[:batch_size])
+            claimed_until = timezone.now() + timezone.timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+            cls.objects.filter(pk__in=[email.pk for email in emails]).update(next_attempt_at=claimed_until)
+        return emails
+
+    @classmethod
+    def send_batch(cls, batch_size: int) -> int:
+        """
+            Send batch of ready emails through one smtp connection.
+            Emails are claimed in short transaction and sent outside of it, so no locks are held during smtp session
+            and several workers can drain outbox at the same time.
+            Return number of processed emails.
+        """
+        emails = cls.claim_batch(batch_size)
+        if not emails:
+            return 0
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as exc:
+            for email in emails:
+                email.mark_failed(str(exc))
+        else:
+            try:
+                for email in emails:
+                    try:
+                        connection.send_messages([email.to_message(connection)])
+                    except Exception as exc:
+                        email.mark_failed(str(exc))
+                    else:
+                        email.mark_sent()
+            finally:
+                connection.close()
+        with transaction.atomic():
+            cls.objects.bulk_update(emails, ['status', 'attempts', 'last_error', 'next_attempt_at', 'date_sent'])
+        return len(emails)
@@ -0,0 +1,83 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.core import mail
+from django.core.management import call_command
+from django.template.loader import get_template
+from django.test import TestCase, override_settings
+
+from email_helpers import send_email, create_email_templates, get_render_stats
+from mailing.helpers import EmailStatus
+from mailing.models import OutgoingEmail
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_USE_OUTBOX=True,
+                   EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_DELAY=0)
+class OutboxTest(TestCase):
+    def send_test_email(self, subject='subject'):
+        send_email(subject=subject, message='message', recipient_list=['test@test.com'],
+                   from_email='from@test.com', html_message='<b>message</b>')
+
+    def test_send_email_puts_email_to_outbox(self):
+        self.send_test_email()
+        self.assertEquals(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEquals(email.status, EmailStatus.PENDING)
+        self.assertEquals(email.recipient_list, ['test@test.com'])
+
+    @override_settings(EMAIL_USE_OUTBOX=False)
+    def test_send_email_without_outbox(self):
+        self.send_test_email()
+        self.assertEquals(len(mail.outbox), 1)
+        self.assertEquals(OutgoingEmail.objects.count(), 0)
+
+    def test_worker_sends_all_emails(self):
+        for i in range(3):
+            self.send_test_email(subject=str(i))
+        call_command('send_emails', once=True, batch_size=2, stdout=StringIO())
+        self.assertEquals(sorted(message.subject for message in mail.outbox), ['0', '1', '2'])
+        self.assertEquals(mail.outbox[0].alternatives, [('<b>message</b>', 'text/html')])
+        self.assertEquals(OutgoingEmail.objects.filter(status=EmailStatus.SENT).count(), 3)
+
+    def test_worker_retries_and_fails(self):
+        self.send_test_email()
+        with patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('smtp error')):
+            OutgoingEmail.send_batch(batch_size=10)
+            email = OutgoingEmail.objects.get()
+            self.assertEquals(email.status, EmailStatus.PENDING)
+            self.assertEquals(email.attempts, 1)
+
+            OutgoingEmail.send_batch(batch_size=10)
+            email.refresh_from_db()
+            self.assertEquals(email.status, EmailStatus.FAILED)
+            self.assertEquals(email.last_error, 'smtp error')
+        self.assertEquals(OutgoingEmail.send_batch(batch_size=10), 0)
+
+    def test_sending_email_is_claimed(self):
+        self.send_test_email()
+        processed_during_sending = []
+
+        def send_messages(messages):
+            processed_during_sending.append(OutgoingEmail.send_batch(batch_size=10))
+            return len(messages)
+
+        with patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=send_messages):
+            self.assertEquals(OutgoingEmail.send_batch(batch_size=10), 1)
+        self.assertEquals(processed_during_sending, [0])
+        self.assertEquals(OutgoingEmail.objects.get().status, EmailStatus.SENT)
+
+
+class EmailTemplatesTest(TestCase):
+    template_name = 'transactions/emails/confirmation_code_email.html'
+
+    def test_template_is_compiled_once(self):
+        # cached template loader is used when DEBUG is False
+        self.assertIs(get_template(self.template_name).template, get_template(self.template_name).template)
+
+    def test_batch_render(self):
+        count = get_render_stats().get(self.template_name, {}).get('count', 0)
+        messages = create_email_templates(self.template_name, [{'uuid': 1, 'code': '11111'},
+                                                               {'uuid': 2, 'code': '22222'}])
+        self.assertIn('11111', messages[0])
+        self.assertIn('22222', messages[1])
+        self.assertEquals(get_render_stats()[self.template_name]['count'], count + 2)
@@ -16,15 +16,16 @@ def generate_code(length):
     return code
 
 
-def save_deletion_pocket_code(pocket_uuid, code):
+def get_deletion_pocket_key(pocket_uuid):
     key = f'deletion-pocket:{pocket_uuid}:{settings.SECRET_KEY}'
-    key_hash = hashlib.md5(key.encode('utf-8')).hexdigest()
-    save_to_redis(key_hash, code, time=settings.VALIDATION_CODE_LIFETIME)
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def save_deletion_pocket_code(pocket_uuid, code):
+    save_to_redis(get_deletion_pocket_key(pocket_uuid), code, time=settings.VALIDATION_CODE_LIFETIME)
 
 
 def get_deletion_pocket_code(pocket_uuid):
-    key = f'deletion-pocket:{pocket_uuid}:{settings.SECRET_KEY}'
-    key_hash = hashlib.md5(key.encode('utf-8')).hexdigest()
-    value = get_from_redis(key_hash)
+    value = get_from_redis(get_deletion_pocket_key(pocket_uuid))
     return value.decode('utf-8') if value is not None else None
 
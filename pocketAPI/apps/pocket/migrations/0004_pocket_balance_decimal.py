@@ -0,0 +1,19 @@
+# Generated by Django 3.1.7 on 2026-10-17 19:36
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pocket', '0003_pocket_balance'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pocket',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-17 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pocket', '0004_pocket_balance_decimal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pocket',
+            index=models.Index(condition=models.Q(is_archived=False), fields=['user'], name='pocket_user_active_idx'),
+        ),
+    ]
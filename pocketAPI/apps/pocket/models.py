@@ -1,12 +1,20 @@
+from decimal import Decimal
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
 from django.core.validators import MinValueValidator
-from django.db import models, transaction
+from django.db import models, connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
 import uuid
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
-from email_helpers import create_email_template
+from email_helpers import create_email_template, send_email
+from http_cache import invalidate_lists
+from money import MONEY_DECIMAL_PLACES, MONEY_MAX_DIGITS, to_money
+from transactions.helpers import invalidate_analytics
 
 UserModel = get_user_model()
 
@@ -19,11 +27,18 @@ class PocketManager(models.QuerySet):
         return self.filter(is_archived=True)
 
     def delete(self):
+        user_ids = set(self.values_list('user_id', flat=True))
         self.update(is_archived=True)
+        invalidate_lists([Pocket.list_version_name, 'transactions'], user_ids)
+        transaction.on_commit(lambda: invalidate_analytics(user_ids))
 
     def hard_delete(self):
         return super(PocketManager, self).delete()
 
+    def total_balance(self) -> Decimal:
+        """ Sum of balances calculated by database """
+        return self.aggregate(total=Coalesce(Sum('balance'), 0, output_field=models.DecimalField()))['total']
+
 
 class Pocket(models.Model):
     user = models.ForeignKey(UserModel, related_name='pockets', on_delete=models.CASCADE, db_index=True,)
@@ -32,45 +47,85 @@ class Pocket(models.Model):
     date_updated = models.DateTimeField(auto_now=True)
     name = models.CharField(_('name of pocket'), max_length=128)
     description = models.TextField(_('description of pocket'), max_length=512, blank=True, null=True)
-    balance = models.FloatField(default=0, validators=[MinValueValidator(0), ])
+    balance = models.DecimalField(max_digits=MONEY_MAX_DIGITS, decimal_places=MONEY_DECIMAL_PLACES,
+                                  default=0, validators=[MinValueValidator(0), ])
 
     # we will not delete pockets, just put them to archive
     is_archived = models.BooleanField(_('in archive'), default=False)
 
     objects = PocketManager.as_manager()
 
+    # name of version of pockets list of user, see http_cache
+    list_version_name = 'pockets'
+
     class Meta:
         verbose_name = _('Pocket')
         verbose_name_plural = _('Pockets')
+        indexes = [
+            models.Index(fields=['user'], name='pocket_user_active_idx', condition=models.Q(is_archived=False)),
+        ]
 
     def send_confirmation_delete_code(self, code):
         """
             Send confirmation code for deleting pocket
         """
         current_site = Site.objects.get_current()
-        self.user.email_user(fail_silently=True,
-                             subject=_('Confirm deletion pocket in {domain}'.format(domain=current_site.domain)),
-                             message='email confirmation',
-                             from_email=settings.EMAIL_HOST_USER,
-                             html_message=create_email_template(
-                                 template_name='pocket/emails/confirmation_code_email.html',
-                                 context={
-                                     'uuid': self.uuid,
-                                     'current_site': current_site,
-                                     'code': code
-                                 }))
+        send_email(recipient_list=[self.user.email],
+                   fail_silently=True,
+                   subject=_('Confirm deletion pocket in {domain}'.format(domain=current_site.domain)),
+                   message='email confirmation',
+                   from_email=settings.EMAIL_HOST_USER,
+                   html_message=create_email_template(
+                       template_name='pocket/emails/confirmation_code_email.html',
+                       context={
+                           'uuid': self.uuid,
+                           'current_site': current_site,
+                           'code': code
+                       }))
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        super().save(force_insert, force_update, using, update_fields)
+        invalidate_lists([self.list_version_name], [self.user_id])
 
     def delete(self, using=None, keep_parents=False):
         self.is_archived = True
-        self.save()
+        self.save(update_fields=['is_archived', 'date_updated'])
+        # transactions of archived pocket are not listed and not counted in analytics
+        invalidate_lists(['transactions'], [self.user_id])
+        transaction.on_commit(lambda: invalidate_analytics([self.user_id]))
 
-    @transaction.atomic()
-    def refill(self, value: float):
-        self.balance += value
-
-    @transaction.atomic()
-    def debit(self, value: float):
-        if self.balance >= value:
-            self.balance -= value
-        else:
+    def add_to_balance(self, value: Decimal):
+        """
+            Add value to balance with one conditional UPDATE ... RETURNING.
+            Balance is changed on database side only if it stays non negative,
+            so concurrent requests for the same pocket do not lose updates.
+            Return new balance or None if balance is not enough.
+        """
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {table} SET balance = balance + %s, date_updated = %s '
+                'WHERE id = %s AND balance + %s >= 0 RETURNING balance'.format(
+                    table=connection.ops.quote_name(self._meta.db_table)
+                ),
+                [value, now, self.pk, value]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        self.balance = row[0]
+        self.date_updated = now
+        invalidate_lists([self.list_version_name], [self.user_id])
+        return self.balance
+
+    def refill(self, value: Decimal) -> Decimal:
+        balance = self.add_to_balance(to_money(value))
+        if balance is None:
+            raise ValueError('pocket does not exist')
+        return balance
+
+    def debit(self, value: Decimal) -> Decimal:
+        balance = self.add_to_balance(-to_money(value))
+        if balance is None:
             raise ValueError('debit value is more than balance')
+        return balance
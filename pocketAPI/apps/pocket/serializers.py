@@ -2,6 +2,7 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from django.conf import settings
 
+from money import MoneySerializerField
 from .helpers import get_deletion_pocket_code
 from .models import Pocket
 
@@ -9,12 +10,19 @@ from .models import Pocket
 class PocketSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     uuid = serializers.UUIDField(read_only=True)
-    balance = serializers.FloatField(read_only=True)
+    balance = MoneySerializerField(read_only=True)
 
     class Meta:
         model = Pocket
         fields = ('id', 'uuid', 'name', 'description', 'user', 'balance')
 
+    def update(self, instance, validated_data):
+        # save only edited fields, balance is changed only by transactions
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data.keys(), 'date_updated'])
+        return instance
+
 
 class ConfirmDeletionSerializer(serializers.Serializer):
     code = serializers.CharField(min_length=settings.VALIDATION_CODE_LENGTH, max_length=settings.VALIDATION_CODE_LENGTH)
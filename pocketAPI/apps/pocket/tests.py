@@ -1,15 +1,28 @@
 import time
 from unittest.mock import patch
 
+from asgiref.sync import async_to_sync
+
 from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
 from django.shortcuts import resolve_url
-from django.test import override_settings
-from rest_framework.test import APITestCase
-
+from django.test import AsyncRequestFactory, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from async_helpers import async_view, cached_list_fast_path
+from http_cache import invalidate_lists
+from jwt_helper.token import AccessToken
+from mailing.models import OutgoingEmail
+from pocket.helpers import get_deletion_pocket_code
 from pocket.models import Pocket
+from pocket.views import PocketAPIView, SendConfirmationDeleteCode, send_deletion_code_fast_path
+from profiling import metrics
+from test_helpers import QueryCountMixin
 
 
-@override_settings(REDIS_PREFIX='pocketapi-test')
+@override_settings(REDIS_PREFIX='pocketapi-test', LIST_CACHE_TTL=0, RATE_LIMITS={})
 class PocketTest(APITestCase):
     fixtures = ['pocket/pockets.json', ]
 
@@ -27,7 +40,7 @@ class PocketTest(APITestCase):
         self.client.force_authenticate(self.user_1)
         url = resolve_url('pocket:pocket-list')
         response = self.client.get(url)
-        self.assertEquals([1, 2], list(p['id'] for p in response.json()))
+        self.assertEquals([2, 1], list(p['id'] for p in response.json()['results']))
 
     def test_get_pocket_owner(self):
         self.client.force_authenticate(self.user_1)
@@ -133,9 +146,145 @@ class PocketTest(APITestCase):
         self.assertEquals(response.status_code, 204)
 
         response = self.client.get(resolve_url('pocket:pocket-list'))
-        self.assertEquals(len(response.json()), 1)
-        self.assertEquals(response.json()[0]['id'], 2)
+        self.assertEquals(len(response.json()['results']), 1)
+        self.assertEquals(response.json()['results'][0]['id'], 2)
 
 
         
 
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', REDIS_PREFIX='pocketapi-test',
+                   LIST_CACHE_TTL=0, RATE_LIMITS={})
+class PocketQueriesTest(QueryCountMixin, APITestCase):
+    fixtures = ['pocket/pockets.json', ]
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.get(pk=1)
+        self.client.force_authenticate(self.user)
+        Site.objects.get_current()
+
+    def add_pockets(self, count):
+        Pocket.objects.bulk_create(Pocket(user=self.user, name=str(i)) for i in range(count))
+        self.pocket = Pocket.objects.filter(user=self.user).latest('id')
+
+    def test_list_queries(self):
+        url = resolve_url('pocket:pocket-list')
+        self.assertConstantQueries(lambda: self.client.get(url), self.add_pockets, num=1)
+
+    def test_send_deletion_code_queries(self):
+        # select with owner, outbox insert
+        self.assertConstantQueries(
+            lambda: self.client.get(resolve_url('pocket:send-deletion-code', uuid=self.pocket.uuid)),
+            self.add_pockets, num=2)
+
+
+@override_settings(REDIS_PREFIX='pocketapi-test')
+class PocketConditionalGetTest(APITransactionTestCase):
+    """ Transaction test case: versions of lists are changed on commit """
+    fixtures = ['pocket/pockets.json', ]
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.get(pk=1)
+        self.pocket = Pocket.objects.get(pk=1)
+        self.client.force_authenticate(self.user)
+        # database is flushed between tests, but cached lists of the same user stay in redis
+        invalidate_lists([Pocket.list_version_name], [self.user.pk])
+
+    def test_retrieve_not_modified(self):
+        url = resolve_url('pocket:pocket-detail', uuid=self.pocket.uuid)
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEquals(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        self.client.patch(url, {'name': 'new name'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()['name'], 'new name')
+
+    def test_not_modified_since(self):
+        # date_updated with microseconds is compared with whole seconds of If-Modified-Since
+        Pocket.objects.filter(pk=self.pocket.pk).update(date_updated=timezone.now().replace(microsecond=654321))
+        for url in (resolve_url('pocket:pocket-detail', uuid=self.pocket.uuid), resolve_url('pocket:pocket-list')):
+            last_modified = self.client.get(url)['Last-Modified']
+            self.assertEquals(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_list_not_modified(self):
+        url = resolve_url('pocket:pocket-list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(response['ETag'], etag)
+        # other page is other resource
+        self.assertEquals(self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.client.post(url, {'name': 'name'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_other_user_list_is_not_changed(self):
+        url = resolve_url('pocket:pocket-list')
+        etag = self.client.get(url)['ETag']
+        Pocket.objects.create(user=get_user_model().objects.get(pk=2), name='name')
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_list_cache(self):
+        url = resolve_url('pocket:pocket-list')
+        metrics.clear()
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEquals(self.client.get(url).json(), response.json())
+        self.assertEquals(metrics.get_counter('pocket:pocket-list', 'list_cache_hits'), 1)
+        self.assertEquals(metrics.get_counter('pocket:pocket-list', 'list_cache_misses'), 1)
+
+        self.pocket.delete()
+        self.assertNotIn(self.pocket.id, [pocket['id'] for pocket in self.client.get(url).json()['results']])
+
+
+@override_settings(REDIS_PREFIX='pocketapi-test', JWT_STATELESS_USER=True, RATE_LIMITS={})
+class PocketAsyncViewsTest(APITransactionTestCase):
+    """ Transaction test case: sync part of async views uses other database connection """
+    fixtures = ['pocket/pockets.json', ]
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.get(pk=1)
+        self.pocket = Pocket.objects.get(pk=1)
+        self.token = AccessToken.for_user(self.user).b64_encoded.decode()
+        invalidate_lists([Pocket.list_version_name], [self.user.pk])
+
+    def call(self, view, url, **headers):
+        # extra arguments of async factory are headers
+        request = AsyncRequestFactory().get(url, **{'access-token': self.token, **headers})
+        request.resolver_match = match = resolve(url)
+        return async_to_sync(view)(request, **match.kwargs)
+
+    def test_list(self):
+        view = async_view(PocketAPIView.as_view({'get': 'list'}), cached_list_fast_path(Pocket.list_version_name))
+        url = resolve_url('pocket:pocket-list')
+        response = self.call(view, url)
+        self.assertEquals(response.status_code, 200)
+        content = response.render().content
+        # database is not used at all
+        with patch.object(PocketAPIView, 'list', side_effect=AssertionError('sync view is called')):
+            response = self.call(view, url, **{'if-none-match': response['ETag']})
+            self.assertEquals(response.status_code, 304)
+            self.assertEquals(self.call(view, url).content, content)
+            response = self.call(view, url, **{'if-modified-since': response['Last-Modified']})
+            self.assertEquals(response.status_code, 304)
+
+    @override_settings(EMAIL_USE_OUTBOX=True)
+    def test_send_deletion_code(self):
+        view = async_view(SendConfirmationDeleteCode.as_view(), send_deletion_code_fast_path)
+        response = self.call(view, resolve_url('pocket:send-deletion-code', uuid=self.pocket.uuid))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(len(get_deletion_pocket_code(self.pocket.uuid)), 5)
+        self.assertEquals(OutgoingEmail.objects.count(), 1)
+
+        # errors are the same as of sync view
+        other_pocket = Pocket.objects.get(pk=3)
+        response = self.call(view, resolve_url('pocket:send-deletion-code', uuid=other_pocket.uuid))
+        self.assertEquals(response.status_code, 403)
@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework import routers
 
-from .views import PocketAPIView, SendConfirmationDeleteCode
+from async_helpers import async_urlpatterns, cached_list_fast_path
+from .models import Pocket
+from .views import PocketAPIView, SendConfirmationDeleteCode, send_deletion_code_fast_path
 
 app_name = 'pocket'
 
@@ -14,3 +17,10 @@ urlpatterns = [
 ]
 
 urlpatterns += router.urls
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = async_urlpatterns(urlpatterns, names=('pocket-list', 'pocket-detail', 'send-deletion-code'),
+                                    fast_paths={
+                                        'pocket-list': cached_list_fast_path(Pocket.list_version_name),
+                                        'send-deletion-code': send_deletion_code_fast_path,
+                                    })
@@ -1,21 +1,27 @@
 from django.conf import settings
+from django.http import JsonResponse
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import permissions
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
+from async_helpers import accepts_json, async_allow_request, async_authenticate, async_save_to_redis, \
+    database_sync_to_async
+from http_cache import ConditionalGetMixin
 from serializers_helpers import MessageSerializer
+from throttling import RedisRateThrottle
 from transactions.serializers import TransactionSerializer
-from .helpers import generate_code, save_deletion_pocket_code
+from .helpers import generate_code, save_deletion_pocket_code, get_deletion_pocket_key
 from .models import Pocket
 from .serializers import PocketSerializer, ConfirmDeletionSerializer
 import pocket.permissions as pocket_permissions
 
 
-class PocketAPIView(ModelViewSet):
+class PocketAPIView(ConditionalGetMixin, ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, pocket_permissions.IsOwner]
     serializer_class = PocketSerializer
+    list_version_name = Pocket.list_version_name
     lookup_field = 'uuid'
     lookup_url_kwarg = 'uuid'
 
@@ -44,12 +50,15 @@ class SendConfirmationDeleteCode(GenericAPIView):
         Send code for confirm deleting pocket with uuid.
     """
     permission_classes = [permissions.IsAuthenticated, pocket_permissions.IsOwner]
+    throttle_classes = [RedisRateThrottle]
+    throttle_scope = 'deletion-code'
     serializer_class = MessageSerializer
     lookup_field = 'uuid'
     lookup_url_kwarg = 'uuid'
 
     def get_queryset(self):
-        return Pocket.objects.active()
+        # email of owner is needed for sending code
+        return Pocket.objects.active().select_related('user')
 
     def get(self, request, uuid):
         # send confirmation code for confirm deletion
@@ -59,3 +68,23 @@ class SendConfirmationDeleteCode(GenericAPIView):
         instance.send_confirmation_delete_code(confirmation_code)
         return Response({'message': "We sent confirmation code to your email"})
 
+
+async def send_deletion_code_fast_path(request, uuid):
+    """
+        SendConfirmationDeleteCode for ASGI: code is saved with async redis client, queries are run in thread pool.
+        Requests of not found or not owned pockets are left to sync view, so errors are the same.
+    """
+    if not accepts_json(request):
+        return None
+    user = await async_authenticate(request)
+    if user is None:
+        return None
+    queryset = Pocket.objects.active().select_related('user').filter(uuid=uuid, user=user.pk)
+    instance = await database_sync_to_async(queryset.first)()
+    if instance is None or not await async_allow_request(SendConfirmationDeleteCode.throttle_scope, user.pk):
+        return None
+    confirmation_code = generate_code(length=settings.VALIDATION_CODE_LENGTH)
+    await async_save_to_redis(get_deletion_pocket_key(instance.uuid), confirmation_code,
+                              lifetime=settings.VALIDATION_CODE_LIFETIME)
+    await database_sync_to_async(instance.send_confirmation_delete_code)(confirmation_code)
+    return JsonResponse(MessageSerializer({'message': "We sent confirmation code to your email"}).data)
@@ -0,0 +1,67 @@
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from filters import CustomFilterBackend
+from jwt_helper.token import AccessToken
+from transactions.models import PocketTransaction, ActionTransactions, TransactionStatus
+from transactions.serializers import TransactionSerializer
+from transactions.views import TransactionViewSet
+
+# times depend on machine, so baseline is saved locally with `benchmark --save-baseline` and ignored by git
+BASELINE_PATH = Path(__file__).resolve().parent / 'benchmarks_baseline.json'
+# numbers of rows serialized by serializer benchmarks
+SERIALIZER_SIZES = (1000, 10000)
+
+
+class Benchmarks:
+    """
+        Hot model-level functions of transaction requests, timed without HTTP, middlewares and views.
+        Every benchmark is (function, setup), setup builds fresh arguments of function for every round.
+        Objects are created in database, so benchmarks have to run in transaction which is rolled back.
+    """
+
+    def __init__(self, users: list):
+        self.user = users[0]
+        self.pocket = self.user.pockets.filter(is_archived=False).first()
+        self.rows = list(PocketTransaction.objects.filter(pocket__user__in=users)
+                         .order_by('pk')[:max(SERIALIZER_SIZES)])
+
+    def create_transaction(self, status: TransactionStatus, action: ActionTransactions = ActionTransactions.REFILL):
+        return PocketTransaction.objects.create(pocket=self.pocket, sum=Decimal(10), action=action, status=status)
+
+    def get_benchmarks(self) -> Dict[str, Tuple[Callable, Optional[Callable]]]:
+        token = AccessToken.for_user(self.user).b64_encoded.decode()
+        request = Request(APIRequestFactory().get('/transactions/', {'pocket__uuid': str(self.pocket.uuid)}))
+        benchmarks = {
+            'PocketTransaction.activate': (
+                PocketTransaction.activate, lambda: (self.create_transaction(TransactionStatus.CONFIRMED), )
+            ),
+            'PocketTransaction.cancel': (
+                PocketTransaction.cancel, lambda: (self.create_transaction(TransactionStatus.CREATED), )
+            ),
+            'PocketTransaction.refund': (
+                PocketTransaction.refund,
+                lambda: (self.create_transaction(TransactionStatus.FINISHED, ActionTransactions.DEBIT), )
+            ),
+            'StatusMixin.change_status': (
+                PocketTransaction.change_status,
+                lambda: (self.create_transaction(TransactionStatus.CREATED), TransactionStatus.IN_PROCESS)
+            ),
+            'AccessToken.get_user_from_token': (AccessToken.get_user_from_token, lambda: (token, )),
+            # filter is lazy, so only building of filtered queryset is timed
+            'CustomFilterBackend.filter_queryset': (
+                CustomFilterBackend().filter_queryset,
+                lambda: (request, PocketTransaction.objects.visible(), TransactionViewSet())
+            ),
+        }
+        for size in SERIALIZER_SIZES:
+            rows = self.rows[:size]
+            benchmarks['TransactionSerializer x {}'.format(size)] = (
+                lambda items: TransactionSerializer(items, many=True).data, lambda rows=rows: (rows, )
+            )
+        return benchmarks
+
@@ -1,34 +1,95 @@
 import hashlib
+import json
 from enum import IntEnum
 
 from django.conf import settings
 from django.db import transaction, models
 from django.utils.translation import ugettext_lazy as _
 
-from pocket.helpers import save_to_redis
-from redis_helper import get_from_redis
+from redis_helper import save_to_redis, get_from_redis, delete_from_redis, get_version, bump_versions
 from transactions.exceptions import TransactionError
 
 
+def get_confirmation_transaction_key(transaction_uuid):
+    key = f'confirm-transaction:{transaction_uuid}:{settings.SECRET_KEY}'
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
 def save_confirmation_transaction_code(transaction_uuid, code):
     """
         Save code confirmation transaction in redis
     """
-    key = f'confirm-transaction:{transaction_uuid}:{settings.SECRET_KEY}'
-    key_hash = hashlib.md5(key.encode('utf-8')).hexdigest()
-    save_to_redis(key_hash, code, time=settings.VALIDATION_CODE_LIFETIME)
+    save_to_redis(get_confirmation_transaction_key(transaction_uuid), code, time=settings.VALIDATION_CODE_LIFETIME)
 
 
 def get_confirmation_transaction_code(transaction_uuid):
     """
         Get confirmation transactopn code from redis
     """
-    key = f'confirm-transaction:{transaction_uuid}:{settings.SECRET_KEY}'
-    key_hash = hashlib.md5(key.encode('utf-8')).hexdigest()
-    value = get_from_redis(key_hash)
+    value = get_from_redis(get_confirmation_transaction_key(transaction_uuid))
     return value.decode('utf-8') if value is not None else None
 
 
+def get_confirmation_batch_key(batch_uuid):
+    key = f'confirm-transactions-batch:{batch_uuid}:{settings.SECRET_KEY}'
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def save_confirmation_batch(batch_uuid, code, transaction_uuids):
+    """
+        Save code and uuids of transactions for confirmation of batch in redis
+    """
+    value = json.dumps({'code': code, 'transactions': [str(uuid) for uuid in transaction_uuids]})
+    save_to_redis(get_confirmation_batch_key(batch_uuid), value, time=settings.VALIDATION_CODE_LIFETIME)
+
+
+def get_confirmation_batch(batch_uuid):
+    """
+        Get code and uuids of transactions of batch from redis: {'code': str, 'transactions': [str, ...]}
+    """
+    value = get_from_redis(get_confirmation_batch_key(batch_uuid))
+    return json.loads(value.decode('utf-8')) if value is not None else None
+
+
+def delete_confirmation_batch(batch_uuid):
+    """
+        Delete used code of batch, so it can not be replayed
+    """
+    delete_from_redis(get_confirmation_batch_key(batch_uuid))
+
+
+def get_analytics_version_key(user_id):
+    key = f'transactions-analytics-version:{user_id}:{settings.SECRET_KEY}'
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def get_analytics_key(user_id, params):
+    """
+        Key of cached analytics result for user and query params.
+        Key contains version of user analytics, so results are invalidated by changing version.
+    """
+    version = get_version(get_analytics_version_key(user_id))
+    params = json.dumps(params, sort_keys=True, default=str)
+    key = f'transactions-analytics:{user_id}:{version}:{params}:{settings.SECRET_KEY}'
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def save_analytics(key, data: str):
+    save_to_redis(key, data, time=settings.ANALYTICS_CACHE_TTL)
+
+
+def get_analytics(key):
+    value = get_from_redis(key)
+    return value.decode('utf-8') if value is not None else None
+
+
+def invalidate_analytics(user_ids):
+    """
+        Invalidate cached analytics of users, e.g. after transactions were finished or cancelled
+    """
+    bump_versions(get_analytics_version_key(user_id) for user_id in user_ids)
+
+
 class ActionTransactions(IntEnum):
     REFILL = 1  # пополнение
     DEBIT = 2  # списание
@@ -68,6 +129,8 @@ class StatusMixin(models.Model):
         choices=TransactionStatus.choices(),
         default=TransactionStatus.CREATED
     )
+    # fields which are saved after changing status
+    status_update_fields = ('status', )
 
     class Meta:
         abstract = True
@@ -81,7 +144,10 @@ class StatusMixin(models.Model):
             return
         change_status_method = getattr(self, 'set_{}'.format(new_status.name.lower()))
         change_status_method()
-        self.save()
+        self.save_status()
+
+    def save_status(self):
+        self.save(update_fields=self.status_update_fields)
 
     def set_created(self):
         raise TransactionError('Created status is set automatically')
@@ -0,0 +1,222 @@
+import http.client
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.shortcuts import resolve_url
+
+from transactions.helpers import ActionTransactions, get_confirmation_transaction_code
+from transactions.models import PocketTransaction
+
+LATENCY_PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """ Nearest-rank percentile of sorted values """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class LoadTestError(Exception):
+    pass
+
+
+class Client:
+    """ Keep-alive HTTP client of one load test thread, records latency of every request by name """
+
+    def __init__(self, base_url: str, recorder: 'Recorder'):
+        url = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.recorder = recorder
+        self.token = None
+        self.connection = None
+
+    def request(self, name: str, method: str, path: str, data: Optional[dict] = None, expected: int = 200):
+        """ Send request and return json of response. Raises LoadTestError if status is not expected """
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers[settings.AUTH_HEADER_NAME] = self.token
+        body = json.dumps(data) if data is not None else None
+        if self.connection is None:
+            self.connection = self.connection_class(self.netloc, timeout=30)
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException) as exc:
+            self.connection.close()
+            self.connection = None
+            self.recorder.record(name, time.perf_counter() - start, ok=False)
+            raise LoadTestError('{} {}: {}'.format(method, path, exc))
+        ok = response.status == expected
+        self.recorder.record(name, time.perf_counter() - start, ok=ok)
+        if response.will_close:
+            self.connection.close()
+            self.connection = None
+        if not ok:
+            raise LoadTestError('{} {}: {} {}'.format(method, path, response.status, content[:200]))
+        return json.loads(content) if content else None
+
+
+class Recorder:
+    """ Latencies and errors of requests by name, shared by threads """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, name: str, seconds: float, ok: bool = True):
+        with self._lock:
+            if ok:
+                self.latencies[name].append(seconds)
+            else:
+                self.errors[name] += 1
+
+    def summary(self, duration: float) -> Dict[str, dict]:
+        """ name: requests, errors, rps and latencies in milliseconds """
+        results = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies[name])
+            result = {
+                'requests': len(latencies),
+                'errors': self.errors[name],
+                'rps': round(len(latencies) / duration, 2),
+                'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+                'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            }
+            result.update({'p{}_ms'.format(p): round(percentile(latencies, p) * 1000, 3)
+                           for p in LATENCY_PERCENTILES})
+            results[name] = result
+        return results
+
+
+class UserState:
+    """ Tokens and data of one seeded user, used by one thread at a time """
+
+    def __init__(self, user, password: str):
+        self.user = user
+        self.password = password
+        self.access_token = None
+        self.refresh_token = None
+        self.pocket_ids = list(user.pockets.filter(is_archived=False).order_by('pk').values_list('pk', flat=True))
+        # seeded finished transactions which can be cancelled with refund
+        self.finished = [str(uuid) for uuid in PocketTransaction.objects.finished().filter(pocket__user=user)
+                         .values_list('uuid', flat=True)]
+
+    def set_tokens(self, tokens: dict):
+        self.access_token = tokens['access_token']
+        self.refresh_token = tokens['refresh_token']
+
+
+def login(client: Client, state: UserState):
+    client.token = None
+    state.set_tokens(client.request('login', 'POST', resolve_url('accounts:login'),
+                                    {'username': state.user.username, 'password': state.password}))
+
+
+def refresh(client: Client, state: UserState):
+    client.token = None
+    state.set_tokens(client.request('refresh', 'POST', resolve_url('jwt:update-tokens'),
+                                    {'refresh_token': state.refresh_token}))
+
+
+def pocket_list(client: Client, state: UserState):
+    client.request('pocket-list', 'GET', resolve_url('pocket:pocket-list'))
+
+
+def transaction_list(client: Client, state: UserState):
+    client.request('transaction-list', 'GET', resolve_url('transactions:transactions-list') + '?' +
+                   urlencode({'page_size': 50}))
+
+
+def lifecycle(client: Client, state: UserState):
+    """ Create refill, send confirmation code and confirm it with code read from redis """
+    transaction = client.request('create', 'POST', resolve_url('transactions:transactions-list'), {
+        'pocket': state.pocket_ids[0],
+        'action': ActionTransactions.REFILL,
+        'sum': 1,
+    }, expected=201)
+    client.request('send-code', 'GET', resolve_url('transactions:send-confirm-code', uuid=transaction['uuid']))
+    code = get_confirmation_transaction_code(transaction['uuid'])
+    client.request('confirm', 'POST', resolve_url('transactions:confirm-transaction', uuid=transaction['uuid']),
+                   {'code': code})
+    state.finished.append(transaction['uuid'])
+
+
+def cancel_refund(client: Client, state: UserState):
+    """ Delete finished transaction, its sum is returned to pocket """
+    if not state.finished:
+        raise LoadTestError('No finished transactions of {} to cancel'.format(state.user.username))
+    transaction_uuid = state.finished.pop()
+    client.request('cancel-refund', 'DELETE', resolve_url('transactions:transactions-detail', uuid=transaction_uuid),
+                   expected=204)
+
+
+SCENARIOS = {
+    'login': login,
+    'refresh': refresh,
+    'pocket-list': pocket_list,
+    'transaction-list': transaction_list,
+    'lifecycle': lifecycle,
+    'cancel-refund': cancel_refund,
+}
+
+
+def run_scenario(scenario: Callable, base_url: str, states: List[UserState], concurrency: int,
+                 duration: float) -> Dict[str, dict]:
+    """
+        Run scenario in concurrency threads for duration seconds.
+        Every thread uses own users, so tokens and transactions of user are not shared between threads.
+        Return summary of requests of scenario by name.
+    """
+    recorder = Recorder()
+    stop_at = time.monotonic() + duration
+
+    def worker(thread_states: List[UserState]):
+        client = Client(base_url, recorder)
+        index = 0
+        while time.monotonic() < stop_at:
+            state = thread_states[index % len(thread_states)]
+            index += 1
+            client.token = state.access_token
+            try:
+                scenario(client, state)
+            except LoadTestError:
+                pass
+
+    threads = [threading.Thread(target=worker, args=(states[i::concurrency], ))
+               for i in range(min(concurrency, len(states)))]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.monotonic() - start)
+
+
+def run_load_test(base_url: str, users: Iterable, password: str, scenarios: Iterable[str], concurrency: int,
+                  duration: float) -> Dict[str, dict]:
+    """
+        Log in every user and run scenarios one by one.
+        Return {request name: summary}.
+    """
+    states = [UserState(user, password) for user in users]
+    setup = Client(base_url, Recorder())
+    for state in states:
+        login(setup, state)
+    results = {}
+    for name in scenarios:
+        results.update(run_scenario(SCENARIOS[name], base_url, states, concurrency, duration))
+    return results
+
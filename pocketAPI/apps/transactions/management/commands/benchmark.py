@@ -0,0 +1,80 @@
+import json
+import platform
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from benchmark import find_regressions, load_baseline, run_benchmark, save_baseline
+from transactions.benchmarks import BASELINE_PATH, Benchmarks
+from transactions.management.commands.loadtest import git_commit
+from transactions.seed import seed_transactions
+
+
+class Command(BaseCommand):
+    help = 'Time hot model-level functions on seeded data and compare minimal times with stored baseline. ' \
+           'Fails if any benchmark is slower than baseline by more than threshold. Seeded data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--pockets', type=int, default=10, help='pockets per user')
+        parser.add_argument('--transactions', type=int, default=100, help='transactions per pocket')
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2, help='rounds which are not counted')
+        parser.add_argument('--benchmark', action='append', dest='benchmarks',
+                            help='name of benchmark to run, can be repeated, all by default')
+        parser.add_argument('--baseline', default=str(BASELINE_PATH),
+                            help='json file with baseline results, it is machine specific and is not committed')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='allowed slowdown against baseline, 0.25 is 25%%')
+        parser.add_argument('--save-baseline', action='store_true', help='write results to baseline file')
+        parser.add_argument('--output', help='file for json results')
+
+    def handle(self, *args, **options):
+        results = {}
+        with transaction.atomic():
+            users = seed_transactions(options['users'], options['pockets'], options['transactions'])
+            benchmarks = Benchmarks(users).get_benchmarks()
+            names = options['benchmarks'] or list(benchmarks)
+            unknown = set(names) - set(benchmarks)
+            if unknown:
+                raise CommandError('Unknown benchmarks: {}. Available: {}'.format(
+                    ', '.join(sorted(unknown)), ', '.join(benchmarks)
+                ))
+            for name in names:
+                func, setup = benchmarks[name]
+                results[name] = run_benchmark(func, setup, options['rounds'], options['warmup'])
+            transaction.set_rollback(True)
+
+        meta = {
+            'commit': git_commit(),
+            'date': timezone.now().isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'rounds': options['rounds'],
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'meta': meta, 'results': results}, output, indent=2)
+
+        baseline = load_baseline(options['baseline'])
+        if not baseline and not options['save_baseline']:
+            self.stdout.write(self.style.WARNING(
+                'There is no baseline in {}, save it on this machine with --save-baseline'.format(options['baseline'])
+            ))
+        regressions = find_regressions(results, baseline, options['threshold'])
+        for name, result in results.items():
+            line = '{}: min {:.4f} ms, median {:.4f} ms'.format(name, result['min_ms'], result['median_ms'])
+            if name in baseline:
+                line += ', baseline min {:.4f} ms'.format(baseline[name]['min_ms'])
+            style = self.style.ERROR if name in regressions else self.style.SUCCESS
+            self.stdout.write(style(line))
+
+        if options['save_baseline']:
+            save_baseline(options['baseline'], {**baseline, **results}, meta)
+            self.stdout.write('Baseline is saved to {}'.format(options['baseline']))
+        elif regressions:
+            raise CommandError('Slower than baseline by more than {:.0%}: {}'.format(
+                options['threshold'], ', '.join('{} (x{})'.format(name, ratio) for name, ratio in regressions.items())
+            ))
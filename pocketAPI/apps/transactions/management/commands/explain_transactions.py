@@ -0,0 +1,121 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from pagination import KeysetPagination
+from transactions.models import PocketTransaction
+from transactions.seed import seed_transactions
+
+QUERYSET_METHODS = ('visible', 'active', 'created', 'in_progress', 'finished', 'cancelled')
+
+
+def explain_analyze(queryset) -> dict:
+    """
+        Run EXPLAIN ANALYZE for queryset and return json plan.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql, params)
+        return cursor.fetchone()[0][0]
+
+
+def find_seq_scans(plan: dict):
+    """
+        Return names of relations which are read with sequential scan in json plan.
+    """
+    relations = []
+    if plan.get('Node Type') == 'Seq Scan':
+        relations.append(plan.get('Relation Name'))
+    for subplan in plan.get('Plans', []):
+        relations.extend(find_seq_scans(subplan))
+    return relations
+
+
+def find_index_conditions(plan: dict):
+    """
+        Return index conditions of all index scans in json plan.
+    """
+    conditions = [plan['Index Cond']] if 'Index Cond' in plan else []
+    for subplan in plan.get('Plans', []):
+        conditions.extend(find_index_conditions(subplan))
+    return conditions
+
+
+def get_keyset_page(pocket):
+    """
+        Page of pocket transactions after the newest one, selected as KeysetPagination selects next pages.
+    """
+    ordering = KeysetPagination.ordering
+    queryset = PocketTransaction.objects.visible().filter(pocket=pocket).order_by(*ordering)
+    first = queryset.first()
+    position = [str(getattr(first, field.lstrip('-'))) for field in ordering]
+    return queryset.filter(KeysetPagination.get_position_filter(ordering, position))[:KeysetPagination().page_size + 1]
+
+
+def format_plan(plan: dict, level: int = 0) -> str:
+    """
+        Render json plan as indented tree of nodes, close to text format of EXPLAIN ANALYZE.
+    """
+    node = plan['Node Type']
+    if 'Index Name' in plan:
+        node += ' using {}'.format(plan['Index Name'])
+    if 'Relation Name' in plan:
+        node += ' on {}'.format(plan['Relation Name'])
+    lines = ['{}{}  (actual time={:.3f}..{:.3f} rows={} loops={})'.format(
+        '  ' * level + ('->  ' if level else ''), node, plan['Actual Startup Time'], plan['Actual Total Time'],
+        plan['Actual Rows'], plan['Actual Loops']
+    )]
+    for condition in ('Index Cond', 'Filter', 'Hash Cond', 'Join Filter'):
+        if condition in plan:
+            lines.append('{}{}: {}'.format('  ' * (level + 2), condition, plan[condition]))
+    for subplan in plan.get('Plans', []):
+        lines.append(format_plan(subplan, level + 1))
+    return '\n'.join(lines)
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN ANALYZE for every TransactionQuerySet method on seeded data ' \
+           'and fail if any plan uses sequential scan or if keyset page does not use date as index condition. ' \
+           'Seeded data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--pockets', type=int, default=3, help='pockets per user')
+        parser.add_argument('--transactions', type=int, default=50, help='transactions per pocket')
+        parser.add_argument('--print-plans', action='store_true')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = seed_transactions(options['users'], options['pockets'], options['transactions'])
+            user = users[len(users) // 2]
+            failed = []
+            for method in QUERYSET_METHODS:
+                queryset = getattr(PocketTransaction.objects, method)().filter(pocket__user=user)
+                plan = explain_analyze(queryset)
+                seq_scans = find_seq_scans(plan['Plan'])
+                if options['print_plans']:
+                    self.stdout.write(format_plan(plan['Plan']))
+                if seq_scans:
+                    failed.append(method)
+                    self.stdout.write(self.style.ERROR(
+                        '{}: sequential scan on {}'.format(method, ', '.join(seq_scans))
+                    ))
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        '{}: {:.3f} ms'.format(method, plan['Execution Time'])
+                    ))
+
+            with connection.cursor() as cursor:
+                # sorting of few seeded rows is cheaper than ordered index scan, planner chooses index for big pockets
+                cursor.execute('SET LOCAL enable_sort = off')
+            plan = explain_analyze(get_keyset_page(user.pockets.first()))
+            if options['print_plans']:
+                self.stdout.write(format_plan(plan['Plan']))
+            if any('date_created' in condition for condition in find_index_conditions(plan['Plan'])):
+                self.stdout.write(self.style.SUCCESS('keyset page: {:.3f} ms'.format(plan['Execution Time'])))
+            else:
+                failed.append('keyset page')
+                self.stdout.write(self.style.ERROR('keyset page: date_created is not index condition'))
+            transaction.set_rollback(True)
+
+        if failed:
+            raise CommandError('Bad plans of: {}'.format(', '.join(failed)))
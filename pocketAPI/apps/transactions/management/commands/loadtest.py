@@ -0,0 +1,77 @@
+import json
+import platform
+import subprocess
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from transactions.loadtest import SCENARIOS, LoadTestError, run_load_test
+from transactions.seed import seed_transactions
+
+UserModel = get_user_model()
+
+SEED_PASSWORD = 'loadtest-password'
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+class Command(BaseCommand):
+    help = 'Seed users * pockets * transactions, run scenarios against running server and print ' \
+           'throughput and p50/p95/p99 latency of every request as json. ' \
+           'Confirmation codes are read from redis, so command has to use the same settings as server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://0.0.0.0:8000', help='base url of running server')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--pockets', type=int, default=3, help='pockets per user')
+        parser.add_argument('--transactions', type=int, default=100, help='transactions per pocket')
+        parser.add_argument('--concurrency', type=int, default=4, help='threads sending requests')
+        parser.add_argument('--duration', type=float, default=10, help='seconds per scenario')
+        parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), dest='scenarios',
+                            help='scenario to run, can be repeated, all by default')
+        parser.add_argument('--output', help='file for json results, stdout by default')
+        parser.add_argument('--keep-data', action='store_true', help='do not delete seeded users')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or list(SCENARIOS)
+        users = seed_transactions(options['users'], options['pockets'], options['transactions'],
+                                  password=SEED_PASSWORD)
+        try:
+            results = run_load_test(options['url'], users, SEED_PASSWORD, scenarios, options['concurrency'],
+                                    options['duration'])
+        except LoadTestError as exc:
+            raise CommandError('Load test failed: {}'.format(exc))
+        finally:
+            if not options['keep_data']:
+                UserModel.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'date': timezone.now().isoformat(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'url': options['url'],
+                'users': options['users'],
+                'pockets': options['pockets'],
+                'transactions': options['transactions'],
+                'concurrency': options['concurrency'],
+                'duration': options['duration'],
+                'scenarios': scenarios,
+            },
+            'results': results,
+        }
+        content = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content + '\n')
+        else:
+            self.stdout.write(content)
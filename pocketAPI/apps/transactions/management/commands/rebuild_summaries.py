@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from pocket.models import Pocket
+from transactions.models import PocketSummary
+
+
+class Command(BaseCommand):
+    help = 'Calculate summaries of pockets from transactions again, e.g. after changing transactions with raw SQL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pocket', action='append', dest='pockets', metavar='UUID',
+                            help='uuid of pocket, can be passed several times. All pockets by default')
+
+    def handle(self, *args, **options):
+        pockets = None
+        if options['pockets']:
+            pockets = Pocket.objects.filter(uuid__in=options['pockets'])
+        count = PocketSummary.objects.rebuild(pockets=pockets)
+        self.stdout.write(self.style.SUCCESS('{} summaries are rebuilt'.format(count)))
@@ -0,0 +1,19 @@
+# Generated by Django 3.1.7 on 2026-10-17 19:36
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0005_auto_20210328_1224'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pockettransaction',
+            name='sum',
+            field=models.DecimalField(decimal_places=2, max_digits=14, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100000)], verbose_name='sum'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.1.7 on 2026-10-17 19:37
+
+from django.db import migrations, models
+import transactions.helpers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_pockettransaction_sum_decimal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pockettransaction',
+            index=models.Index(fields=['pocket', 'status', 'date_created'], name='transaction_pocket_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pockettransaction',
+            index=models.Index(fields=['pocket', 'date_created', 'id'], name='transaction_pocket_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pockettransaction',
+            index=models.Index(condition=models.Q(status__in=(transactions.helpers.TransactionStatus['CREATED'], transactions.helpers.TransactionStatus['IN_PROCESS'])), fields=['pocket', 'date_created'], name='transaction_active_idx'),
+        ),
+    ]
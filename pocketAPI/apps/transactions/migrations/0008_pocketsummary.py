@@ -0,0 +1,53 @@
+# Generated by Django 3.1.7 on 2026-10-17 19:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# summaries of existing transactions, later they are rebuilt with rebuild_summaries command
+FILL_SUMMARIES_SQL = """
+INSERT INTO transactions_pocketsummary (pocket_id, refilled, debited, pending_refill, pending_debit,
+                                        created_count, in_process_count, confirmed_count, finished_count,
+                                        cancelled_count, date_updated)
+SELECT pocket_id,
+       COALESCE(SUM("sum") FILTER (WHERE action = 1 AND status = 4), 0),
+       COALESCE(SUM("sum") FILTER (WHERE action = 2 AND status = 4), 0),
+       COALESCE(SUM("sum") FILTER (WHERE action = 1 AND status IN (1, 2, 3)), 0),
+       COALESCE(SUM("sum") FILTER (WHERE action = 2 AND status IN (1, 2, 3)), 0),
+       COUNT(*) FILTER (WHERE status = 1),
+       COUNT(*) FILTER (WHERE status = 2),
+       COUNT(*) FILTER (WHERE status = 3),
+       COUNT(*) FILTER (WHERE status = 4),
+       COUNT(*) FILTER (WHERE status = 5),
+       NOW()
+FROM transactions_pockettransaction
+GROUP BY pocket_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pocket', '0005_pocket_user_active_idx'),
+        ('transactions', '0007_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PocketSummary',
+            fields=[
+                ('pocket', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='pocket.pocket', verbose_name='Pocket')),
+                ('refilled', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='refilled')),
+                ('debited', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='debited')),
+                ('pending_refill', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='pending refill')),
+                ('pending_debit', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='pending debit')),
+                ('created_count', models.IntegerField(default=0, verbose_name='created')),
+                ('in_process_count', models.IntegerField(default=0, verbose_name='in process')),
+                ('confirmed_count', models.IntegerField(default=0, verbose_name='confirmed')),
+                ('finished_count', models.IntegerField(default=0, verbose_name='finished')),
+                ('cancelled_count', models.IntegerField(default=0, verbose_name='cancelled')),
+                ('date_updated', models.DateTimeField(auto_now=True, verbose_name='date updated')),
+            ],
+        ),
+        migrations.RunSQL(FILL_SUMMARIES_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
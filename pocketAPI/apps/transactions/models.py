@@ -1,16 +1,26 @@
 import uuid
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional, Tuple
 
 from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models, transaction
-from django.db.models import Q
+from django.db import connection, models, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, Trunc
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
-from email_helpers import create_email_template
+from email_helpers import create_email_template, send_email
+from http_cache import invalidate_lists
+from money import MONEY_DECIMAL_PLACES, MONEY_MAX_DIGITS
 from pocket.models import Pocket
 from .exceptions import TransactionError
-from .helpers import StatusMixin, TransactionStatus, ActionTransactions
+from .helpers import StatusMixin, TransactionStatus, ActionTransactions, invalidate_analytics
+
+ACTIVE_STATUSES = (TransactionStatus.CREATED, TransactionStatus.IN_PROCESS)
+# statuses of transactions which can still change balance
+PENDING_STATUSES = (TransactionStatus.CREATED, TransactionStatus.IN_PROCESS, TransactionStatus.CONFIRMED)
 
 
 class TransactionQuerySet(models.QuerySet):
@@ -18,7 +28,7 @@ class TransactionQuerySet(models.QuerySet):
         return self.filter(pocket__is_archived=False)
 
     def active(self):
-        return self.visible().filter(Q(status=TransactionStatus.CREATED) | Q(status=TransactionStatus.IN_PROCESS))
+        return self.visible().filter(status__in=ACTIVE_STATUSES)
 
     def created(self):
         return self.visible().filter(status=TransactionStatus.CREATED)
@@ -32,6 +42,27 @@ class TransactionQuerySet(models.QuerySet):
     def cancelled(self):
         return self.visible().filter(status=TransactionStatus.CANCELLED)
 
+    def sum_by_action(self):
+        """
+            Return exact sums of transactions for every action, calculated by database:
+            {ActionTransactions.REFILL: Decimal, ActionTransactions.DEBIT: Decimal}
+        """
+        sums = self.aggregate(**{
+            action.name: Coalesce(Sum('sum', filter=Q(action=action)), 0, output_field=models.DecimalField())
+            for action in ActionTransactions
+        })
+        return {action: sums[action.name] for action in ActionTransactions}
+
+    def buckets(self, granularity: str):
+        """
+            Sums and counts of transactions per period, pocket and action, grouped by database with date_trunc.
+            granularity:    day, week or month
+        """
+        return self.annotate(period=Trunc('date_created', granularity))\
+            .values('period', 'pocket__uuid', 'action')\
+            .annotate(total=Sum('sum'), count=Count('id'))\
+            .order_by('period', 'pocket__uuid', 'action')
+
 
 class PocketTransaction(StatusMixin):
     """
@@ -39,7 +70,8 @@ class PocketTransaction(StatusMixin):
     """
     pocket = models.ForeignKey(Pocket, verbose_name=_('Pocket'), on_delete=models.CASCADE, related_name='transactions')
     uuid = models.UUIDField(_('UUID'), default=uuid.uuid4, unique=True)
-    sum = models.FloatField(_('sum'), validators=[MinValueValidator(0), MaxValueValidator(100000)])
+    sum = models.DecimalField(_('sum'), max_digits=MONEY_MAX_DIGITS, decimal_places=MONEY_DECIMAL_PLACES,
+                              validators=[MinValueValidator(0), MaxValueValidator(100000)])
     action = models.PositiveIntegerField(
         _('action'),
         choices=ActionTransactions.choices()
@@ -50,6 +82,21 @@ class PocketTransaction(StatusMixin):
 
     objects = TransactionQuerySet.as_manager()
 
+    status_update_fields = ('status', 'date_updated')
+
+    # name of version of transactions list of user, see http_cache
+    list_version_name = 'transactions'
+
+    class Meta:
+        indexes = [
+            # list of transactions of pocket(s) filtered by status and sorted by date
+            models.Index(fields=['pocket', 'status', 'date_created'], name='transaction_pocket_status_idx'),
+            models.Index(fields=['pocket', 'date_created', 'id'], name='transaction_pocket_date_idx'),
+            # transactions which can be confirmed or cancelled
+            models.Index(fields=['pocket', 'date_created'], name='transaction_active_idx',
+                         condition=Q(status__in=ACTIVE_STATUSES)),
+        ]
+
     @transaction.atomic()
     def delete(self, using=None, keep_parents=False):
         """
@@ -59,6 +106,7 @@ class PocketTransaction(StatusMixin):
         """
         if self.status != TransactionStatus.CANCELLED:
             self.cancel()
+        self.record_status_changes([(self, self.status, None)])
         super().delete(using, keep_parents)
 
     @property
@@ -81,23 +129,140 @@ class PocketTransaction(StatusMixin):
             raise TransactionError('Can not activate transaction for archived pocket')
 
         try:
-            if self.action == ActionTransactions.DEBIT:
-                self.pocket.debit(self.sum)
-            elif self.action == ActionTransactions.REFILL:
-                self.pocket.refill(self.sum)
+            with transaction.atomic():
+                if self.action == ActionTransactions.DEBIT:
+                    self.pocket.debit(self.sum)
+                elif self.action == ActionTransactions.REFILL:
+                    self.pocket.refill(self.sum)
+                self.set_finished()
+                self.save_status()
+        except TransactionError:
+            # transaction was changed by concurrent request, balance change is rolled back
+            self.refresh_from_db(fields=['status'])
+            raise
         except Exception as exc:
             self.set_cancelled()
-            self.save()
+            self.save_status()
             raise TransactionError(str(exc))
-        else:
-            self.pocket.save()
-            self.set_finished()
-            self.save()
+
+    def save_status(self):
+        """
+            Save status with conditional UPDATE ... WHERE status = <status which was read from database>,
+            so only one of concurrent requests can change status of the same transaction (and its balance,
+            which is changed in the same database transaction). Raise TransactionError if status was changed.
+        """
+        old_status = getattr(self, 'saved_status', None)
+        now = timezone.now()
+        updated = PocketTransaction.objects.filter(pk=self.pk, status=old_status).update(status=self.status,
+                                                                                         date_updated=now)
+        if not updated:
+            raise TransactionError('Transaction has been changed by another request')
+        self.date_updated = now
+        if old_status != self.status:
+            self.record_status_changes([(self, old_status, self.status)])
+            self.saved_status = self.status
+
+    @staticmethod
+    def record_status_changes(changes: Iterable[Tuple['PocketTransaction', Optional[int], Optional[int]]]):
+        """
+            Update data which depends on statuses of transactions: summaries of pockets, versions of
+            transactions lists and cached analytics.
+            changes:    (transaction, old status or None if transaction is created,
+                         new status or None if transaction is deleted)
+        """
+        changes = list(changes)
+        PocketSummary.objects.record_changes(changes)
+        invalidate_lists([PocketTransaction.list_version_name], (t.pocket.user_id for t, _, _ in changes))
+        # analytics are built from finished transactions
+        user_ids = {t.pocket.user_id for t, old_status, new_status in changes
+                    if TransactionStatus.FINISHED in (old_status, new_status)}
+        if user_ids:
+            transaction.on_commit(lambda: invalidate_analytics(user_ids))
+
+    @property
+    def signed_sum(self):
+        """ How transaction changes balance of pocket """
+        return -self.sum if self.action == ActionTransactions.DEBIT else self.sum
+
+    @classmethod
+    def activate_many(cls, transactions: Iterable['PocketTransaction']) -> Dict[int, Optional[str]]:
+        """
+            Activate many confirmed transactions in one database transaction.
+            Balance of every pocket is changed with one UPDATE by net sum of its transactions
+            and statuses are changed with one UPDATE per status.
+            If net sum can not be debited, transactions of this pocket are applied one by one,
+            so only transactions which do not fit in balance are cancelled.
+            Return {transaction pk: error message or None if transaction was activated}.
+        """
+        results = {}
+        by_pocket = defaultdict(list)
+        for pocket_transaction in transactions:
+            if pocket_transaction.status != TransactionStatus.CONFIRMED:
+                results[pocket_transaction.pk] = 'Can activate transaction only with status {}'.format(
+                    TransactionStatus.CONFIRMED.name
+                )
+            elif pocket_transaction.pocket.is_archived:
+                results[pocket_transaction.pk] = 'Can not activate transaction for archived pocket'
+            else:
+                by_pocket[pocket_transaction.pocket_id].append(pocket_transaction)
+
+        finished, cancelled = [], []
+        with transaction.atomic():
+            for pocket_transactions in by_pocket.values():
+                pocket = pocket_transactions[0].pocket
+                if pocket.add_to_balance(sum(t.signed_sum for t in pocket_transactions)) is not None:
+                    finished.extend(pocket_transactions)
+                    continue
+                for pocket_transaction in pocket_transactions:
+                    try:
+                        if pocket_transaction.action == ActionTransactions.DEBIT:
+                            pocket.debit(pocket_transaction.sum)
+                        else:
+                            pocket.refill(pocket_transaction.sum)
+                    except ValueError as exc:
+                        results[pocket_transaction.pk] = str(exc)
+                        cancelled.append(pocket_transaction)
+                    else:
+                        finished.append(pocket_transaction)
+
+            now = timezone.now()
+            for new_status, status_transactions in ((TransactionStatus.FINISHED, finished),
+                                                    (TransactionStatus.CANCELLED, cancelled)):
+                if not status_transactions:
+                    continue
+                cls.objects.filter(pk__in=[t.pk for t in status_transactions]).update(status=new_status,
+                                                                                      date_updated=now)
+                cls.record_status_changes((t, t.saved_status, new_status) for t in status_transactions)
+                for pocket_transaction in status_transactions:
+                    pocket_transaction.status = new_status
+                    pocket_transaction.saved_status = new_status
+                    pocket_transaction.date_updated = now
+
+        results.update((t.pk, None) for t in finished)
+        return results
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # status which is saved in database, it is needed for updating summary
+        instance.saved_status = instance.__dict__.get('status')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        self.saved_status = self.status
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         if self.pocket.is_archived:
             raise TransactionError('Can not create transaction for archived pocket')
-        super().save(force_insert, force_update, using, update_fields)
+        old_status = None if self._state.adding else getattr(self, 'saved_status', None)
+        with transaction.atomic(savepoint=False):
+            super().save(force_insert, force_update, using, update_fields)
+            if old_status != self.status and (update_fields is None or 'status' in update_fields):
+                self.record_status_changes([(self, old_status, self.status)])
+                self.saved_status = self.status
+            else:
+                invalidate_lists([self.list_version_name], [self.pocket.user_id])
 
     @transaction.atomic()
     def refund(self):
@@ -109,11 +274,9 @@ class PocketTransaction(StatusMixin):
         """
         if self.action == ActionTransactions.DEBIT:
             self.pocket.refill(self.sum)
-            self.pocket.save()
         elif self.action == ActionTransactions.REFILL:
             try:
                 self.pocket.debit(self.sum)
-                self.pocket.save()
             except ValueError:
                 raise TransactionError('Not enough money for refund')
 
@@ -128,21 +291,165 @@ class PocketTransaction(StatusMixin):
         if self.status == TransactionStatus.CANCELLED:
             raise TransactionError('Transaction has already cancelled')
         self.set_cancelled()
-        self.save()
+        self.save_status()
 
     def send_confirmation_code(self, code):
         """
             Send confirmation code for confirm transaction
         """
         current_site = Site.objects.get_current()
-        self.pocket.user.email_user(fail_silently=True,
-                                    subject=_('Confirm deletion pocket in {domain}'.format(domain=current_site.domain)),
-                                    message='email confirmation',
-                                    from_email=settings.EMAIL_HOST_USER,
-                                    html_message=create_email_template(
-                                        template_name='transactions/emails/confirmation_code_email.html',
-                                        context={
-                                            'uuid': self.uuid,
-                                            'current_site': current_site,
-                                            'code': code
-                                        }))
+        send_email(recipient_list=[self.pocket.user.email],
+                   fail_silently=True,
+                   subject=_('Confirm deletion pocket in {domain}'.format(domain=current_site.domain)),
+                   message='email confirmation',
+                   from_email=settings.EMAIL_HOST_USER,
+                   html_message=create_email_template(
+                       template_name='transactions/emails/confirmation_code_email.html',
+                       context={
+                           'uuid': self.uuid,
+                           'current_site': current_site,
+                           'code': code
+                       }))
+
+    @staticmethod
+    def send_batch_confirmation_code(user, batch_uuid, transactions, code):
+        """
+            Send one confirmation code for confirm batch of transactions
+        """
+        current_site = Site.objects.get_current()
+        send_email(recipient_list=[user.email],
+                   fail_silently=True,
+                   subject=_('Confirm transactions in {domain}'.format(domain=current_site.domain)),
+                   message='email confirmation',
+                   from_email=settings.EMAIL_HOST_USER,
+                   html_message=create_email_template(
+                       template_name='transactions/emails/batch_confirmation_code_email.html',
+                       context={
+                           'batch_uuid': batch_uuid,
+                           'transactions': transactions,
+                           'current_site': current_site,
+                           'code': code
+                       }))
+
+
+# totals can be bigger than one money value
+SUMMARY_MAX_DIGITS = MONEY_MAX_DIGITS + 4
+SUMMARY_AMOUNT_FIELDS = ('refilled', 'debited', 'pending_refill', 'pending_debit')
+SUMMARY_COUNT_FIELDS = {status: '{}_count'.format(status.name.lower()) for status in TransactionStatus}
+
+
+def get_summary_amount_field(action: int, status: int) -> Optional[str]:
+    """ Which amount of summary contains sum of transaction with action and status """
+    if status == TransactionStatus.FINISHED:
+        return 'refilled' if action == ActionTransactions.REFILL else 'debited'
+    if status in PENDING_STATUSES:
+        return 'pending_refill' if action == ActionTransactions.REFILL else 'pending_debit'
+    return None
+
+
+class PocketSummaryQuerySet(models.QuerySet):
+    def record_changes(self, changes: Iterable[Tuple[PocketTransaction, Optional[int], Optional[int]]]):
+        """
+            Apply changes of transactions statuses to summaries with one INSERT ... ON CONFLICT DO UPDATE.
+            changes:    (transaction, old status or None if transaction is created,
+                         new status or None if transaction is deleted)
+        """
+        deltas = defaultdict(lambda: defaultdict(int))
+        for pocket_transaction, old_status, new_status in changes:
+            delta = deltas[pocket_transaction.pocket_id]
+            for status, sign in ((old_status, -1), (new_status, 1)):
+                if status is None:
+                    continue
+                delta[SUMMARY_COUNT_FIELDS[status]] += sign
+                amount_field = get_summary_amount_field(pocket_transaction.action, status)
+                if amount_field:
+                    delta[amount_field] += sign * pocket_transaction.sum
+        if not deltas:
+            return
+
+        fields = SUMMARY_AMOUNT_FIELDS + tuple(SUMMARY_COUNT_FIELDS.values())
+        now = timezone.now()
+        params = []
+        # pockets are locked in the same order by all requests
+        for pocket_id in sorted(deltas):
+            params.extend([pocket_id, *(deltas[pocket_id][field] for field in fields), now])
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        row = '({})'.format(', '.join(['%s'] * (len(fields) + 2)))
+        sql = (
+            'INSERT INTO {table} (pocket_id, {columns}, date_updated) VALUES {rows} '
+            'ON CONFLICT (pocket_id) DO UPDATE SET {updates}, date_updated = EXCLUDED.date_updated'
+        ).format(
+            table=table,
+            columns=', '.join(fields),
+            rows=', '.join([row] * len(deltas)),
+            updates=', '.join('{field} = {table}.{field} + EXCLUDED.{field}'.format(field=field, table=table)
+                              for field in fields),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def rebuild(self, pockets=None) -> int:
+        """
+            Calculate summaries from transactions again.
+            pockets:    queryset or list of pocket ids, all pockets if None
+            Return number of saved summaries.
+        """
+        transactions = PocketTransaction.objects.all()
+        summaries = self.all()
+        if pockets is not None:
+            transactions = transactions.filter(pocket__in=pockets)
+            summaries = summaries.filter(pocket__in=pockets)
+        aggregates = {
+            field: Coalesce(Sum('sum', filter=Q(action=action, status__in=statuses)), 0,
+                            output_field=models.DecimalField())
+            for field, action, statuses in (
+                ('refilled', ActionTransactions.REFILL, [TransactionStatus.FINISHED]),
+                ('debited', ActionTransactions.DEBIT, [TransactionStatus.FINISHED]),
+                ('pending_refill', ActionTransactions.REFILL, PENDING_STATUSES),
+                ('pending_debit', ActionTransactions.DEBIT, PENDING_STATUSES),
+            )
+        }
+        aggregates.update({field: models.Count('id', filter=Q(status=status))
+                           for status, field in SUMMARY_COUNT_FIELDS.items()})
+        rows = transactions.order_by().values('pocket_id').annotate(**aggregates)
+        pockets_to_lock = Pocket.objects.all() if pockets is None else Pocket.objects.filter(pk__in=pockets)
+        with transaction.atomic():
+            # concurrent status changes wait until summaries are rebuilt: existing summary rows are locked by delete
+            # and inserting of new summary row takes key share lock of pocket, which conflicts with FOR UPDATE
+            list(pockets_to_lock.order_by('pk').select_for_update().values_list('pk', flat=True))
+            summaries.delete()
+            created = self.bulk_create((self.model(**row) for row in rows.iterator()), batch_size=1000)
+        return len(created)
+
+    def total(self) -> Dict[str, Any]:
+        """ Sum of summaries, e.g. for all pockets of user """
+        totals = {field: Coalesce(Sum(field), 0, output_field=models.DecimalField()) for field in SUMMARY_AMOUNT_FIELDS}
+        totals.update({field: Coalesce(Sum(field), 0) for field in SUMMARY_COUNT_FIELDS.values()})
+        return self.aggregate(**totals)
+
+
+class PocketSummary(models.Model):
+    """
+        Totals of pocket transactions, changed in the same database transaction as transactions.
+        refilled, debited:                  sums of finished transactions
+        pending_refill, pending_debit:      sums of transactions which are not finished or cancelled yet
+        <status>_count:                     number of transactions with status
+    """
+    pocket = models.OneToOneField(Pocket, verbose_name=_('Pocket'), on_delete=models.CASCADE, primary_key=True,
+                                  related_name='summary')
+    refilled = models.DecimalField(_('refilled'), max_digits=SUMMARY_MAX_DIGITS,
+                                   decimal_places=MONEY_DECIMAL_PLACES, default=0)
+    debited = models.DecimalField(_('debited'), max_digits=SUMMARY_MAX_DIGITS,
+                                  decimal_places=MONEY_DECIMAL_PLACES, default=0)
+    pending_refill = models.DecimalField(_('pending refill'), max_digits=SUMMARY_MAX_DIGITS,
+                                         decimal_places=MONEY_DECIMAL_PLACES, default=0)
+    pending_debit = models.DecimalField(_('pending debit'), max_digits=SUMMARY_MAX_DIGITS,
+                                        decimal_places=MONEY_DECIMAL_PLACES, default=0)
+    created_count = models.IntegerField(_('created'), default=0)
+    in_process_count = models.IntegerField(_('in process'), default=0)
+    confirmed_count = models.IntegerField(_('confirmed'), default=0)
+    finished_count = models.IntegerField(_('finished'), default=0)
+    cancelled_count = models.IntegerField(_('cancelled'), default=0)
+    date_updated = models.DateTimeField(_('date updated'), auto_now=True)
+
+    objects = PocketSummaryQuerySet.as_manager()
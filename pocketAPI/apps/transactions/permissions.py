@@ -3,4 +3,4 @@ from rest_framework.permissions import BasePermission
 
 class IsOwner(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return bool(request.user and request.user.is_authenticated and obj.pocket.user == request.user)
\ No newline at end of file
+        return bool(request.user and request.user.is_authenticated and obj.pocket.user_id == request.user.pk)
\ No newline at end of file
@@ -0,0 +1,60 @@
+import random
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+
+from pocket.models import Pocket
+from transactions.helpers import ActionTransactions, TransactionStatus
+from transactions.models import PocketSummary, PocketTransaction
+
+UserModel = get_user_model()
+
+
+def seed_transactions(users: int, pockets: int, transactions: int, archived_every: int = 3, batch_size: int = 1000,
+                      password: str = None):
+    """
+        Create users * pockets * transactions rows for measuring queries.
+        Every archived_every-th pocket is archived, statuses and actions of transactions are random,
+        dates of transactions are spread over last year.
+        Return list of created users.
+    """
+    prefix = uuid.uuid4().hex[:8]
+    # hashing password is slow, all seed users share the same hash (unusable if password is None)
+    password_hash = make_password(password)
+    new_users = [
+        UserModel(username=f'seed-{prefix}-{i}', email=f'seed-{prefix}-{i}@example.com', password=password_hash,
+                  is_confirmed=True)
+        for i in range(users)
+    ]
+    new_users = UserModel.objects.bulk_create(new_users, batch_size=batch_size)
+
+    new_pockets = [
+        Pocket(user=user, name=f'pocket {i}', balance=Decimal(1000000),
+               is_archived=(i % archived_every == archived_every - 1))
+        for user in new_users for i in range(pockets)
+    ]
+    new_pockets = Pocket.objects.bulk_create(new_pockets, batch_size=batch_size)
+
+    statuses = list(TransactionStatus)
+    actions = list(ActionTransactions)
+    PocketTransaction.objects.bulk_create(
+        (
+            PocketTransaction(pocket=pocket, sum=Decimal(random.randint(1, 100000)) / 100,
+                              action=random.choice(actions), status=random.choice(statuses))
+            for pocket in new_pockets for _ in range(transactions)
+        ),
+        batch_size=batch_size
+    )
+    PocketSummary.objects.rebuild(pockets=[pocket.pk for pocket in new_pockets])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE {table} SET date_created = date_created - (id %% 365) * interval \'1 day\' '
+            'WHERE pocket_id >= %s'.format(table=connection.ops.quote_name(PocketTransaction._meta.db_table)),
+            [new_pockets[0].pk]
+        )
+        for model in (UserModel, Pocket, PocketTransaction, PocketSummary):
+            cursor.execute('ANALYZE {}'.format(connection.ops.quote_name(model._meta.db_table)))
+    return new_users
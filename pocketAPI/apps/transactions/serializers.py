@@ -1,8 +1,14 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from money import MoneySerializerField
+from pocket.models import Pocket
+from serializers_helpers import MessageSerializer
 from transactions.helpers import get_confirmation_transaction_code
-from transactions.models import PocketTransaction, ActionTransactions
+from transactions.models import PocketTransaction, ActionTransactions, SUMMARY_MAX_DIGITS
 
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -11,6 +17,7 @@ class TransactionSerializer(serializers.ModelSerializer):
     """
     status = serializers.SerializerMethodField()
     uuid = serializers.UUIDField(read_only=True)
+    sum = MoneySerializerField(min_value=0, max_value=100000)
     action = serializers.ChoiceField(choices=ActionTransactions.choices(), default=ActionTransactions.REFILL,
                                      help_text=str(ActionTransactions.choices()))
     action_name = serializers.SerializerMethodField()
@@ -40,6 +47,146 @@ class TransactionSerializer(serializers.ModelSerializer):
                   'date_updated', 'comment', 'status', 'pocket')
 
 
+class ContextPocketField(serializers.PrimaryKeyRelatedField):
+    """
+        Pocket field which takes pockets from context['pockets'] ({pk: pocket}) instead of querying database.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.context['pockets'][pk]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class BulkTransactionSerializer(TransactionSerializer):
+    """
+        Serializer for one transaction from bulk request.
+    """
+    pocket = ContextPocketField(queryset=Pocket.objects.active())
+
+
+class BulkCreateTransactionsSerializer(serializers.Serializer):
+    """
+        Serializer for creating many transactions at once.
+        Pockets are loaded with one query, valid transactions are inserted with one bulk insert,
+        invalid ones are returned with errors.
+    """
+    transactions = serializers.ListField(child=serializers.DictField(), allow_empty=False,
+                                         max_length=settings.BULK_TRANSACTIONS_MAX_SIZE)
+
+    def get_pockets(self, items):
+        pocket_ids = set()
+        for item in items:
+            try:
+                pocket_ids.add(int(item.get('pocket')))
+            except (TypeError, ValueError):
+                pass
+        user = self.context['request'].user
+        return Pocket.objects.active().filter(user=user).in_bulk(pocket_ids)
+
+    def validate(self, attrs):
+        items = attrs['transactions']
+        context = dict(self.context, pockets=self.get_pockets(items))
+        self.item_serializers = [BulkTransactionSerializer(data=item, context=context) for item in items]
+        for serializer in self.item_serializers:
+            serializer.is_valid()
+        return attrs
+
+    @transaction.atomic()
+    def create(self, validated_data):
+        valid_serializers = [serializer for serializer in self.item_serializers if not serializer.errors]
+        transactions = PocketTransaction.objects.bulk_create(
+            [PocketTransaction(**serializer.validated_data) for serializer in valid_serializers]
+        )
+        PocketTransaction.record_status_changes((instance, None, instance.status) for instance in transactions)
+        for serializer, instance in zip(valid_serializers, transactions):
+            serializer.instance = instance
+        return transactions
+
+    @property
+    def results(self):
+        """
+            Result for every sent transaction in the same order.
+        """
+        results = []
+        for index, serializer in enumerate(self.item_serializers):
+            if serializer.errors:
+                results.append({'index': index, 'created': False, 'errors': serializer.errors})
+            else:
+                results.append({'index': index, 'created': True, 'transaction': serializer.data})
+        return results
+
+
+class ExportTransactionsFilterSerializer(serializers.Serializer):
+    """
+        Query params for filtering exported transactions.
+    """
+    pocket__uuid = serializers.UUIDField(required=False, help_text='uuid of pocket')
+    date_from = serializers.DateTimeField(required=False, help_text='include transactions created since date')
+    date_to = serializers.DateTimeField(required=False, help_text='include transactions created before date')
+
+    def validate(self, attrs):
+        if 'date_from' in attrs and 'date_to' in attrs and attrs['date_from'] > attrs['date_to']:
+            raise ValidationError('date_from must be less than date_to')
+        return attrs
+
+    def filter_queryset(self, queryset):
+        filters = {}
+        if 'pocket__uuid' in self.validated_data:
+            filters['pocket__uuid'] = self.validated_data['pocket__uuid']
+        if 'date_from' in self.validated_data:
+            filters['date_created__gte'] = self.validated_data['date_from']
+        if 'date_to' in self.validated_data:
+            filters['date_created__lt'] = self.validated_data['date_to']
+        return queryset.filter(**filters)
+
+
+class AnalyticsFilterSerializer(ExportTransactionsFilterSerializer):
+    """
+        Query params for analytics of transactions.
+    """
+    GRANULARITY_DAYS = {'day': 1, 'week': 7, 'month': 31}
+
+    granularity = serializers.ChoiceField(choices=tuple(GRANULARITY_DAYS), default='day')
+    date_from = serializers.DateTimeField(help_text='include transactions created since date')
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        days = ((attrs.get('date_to') or timezone.now()) - attrs['date_from']).days
+        if days / self.GRANULARITY_DAYS[attrs['granularity']] > settings.ANALYTICS_MAX_BUCKETS:
+            raise ValidationError('Too many periods, max is {}'.format(settings.ANALYTICS_MAX_BUCKETS))
+        return attrs
+
+
+class AnalyticsBucketSerializer(serializers.Serializer):
+    period = serializers.DateTimeField(help_text='start of period')
+    pocket = serializers.UUIDField(source='pocket__uuid')
+    action = serializers.IntegerField()
+    action_name = serializers.SerializerMethodField()
+    sum = MoneySerializerField(source='total', max_digits=SUMMARY_MAX_DIGITS)
+    count = serializers.IntegerField()
+
+    def get_action_name(self, obj):
+        return ActionTransactions.dict()[obj['action']]
+
+
+class AnalyticsSerializer(serializers.Serializer):
+    """
+        Finished transactions grouped by period, pocket and action.
+    """
+    granularity = serializers.CharField()
+    date_from = serializers.DateTimeField()
+    date_to = serializers.DateTimeField(allow_null=True)
+    buckets = AnalyticsBucketSerializer(many=True)
+
+
 class ConfirmTransactionSerializer(serializers.Serializer):
     """
         Serializer for confirm transaction with code.
@@ -66,3 +213,67 @@ class ConfirmTransactionSerializer(serializers.Serializer):
         else:
             self.transaction.set_confirmed()
         return attrs
+
+
+class BatchSendConfirmationCodeSerializer(serializers.Serializer):
+    """
+        Serializer for sending one confirmation code for many transactions.
+    """
+    transactions = serializers.ListField(child=serializers.UUIDField(), allow_empty=False,
+                                         max_length=settings.BULK_TRANSACTIONS_MAX_SIZE)
+
+
+class BatchMessageSerializer(MessageSerializer):
+    """
+        Response with uuid of batch for confirming it
+    """
+    batch_uuid = serializers.UUIDField()
+
+
+class ConfirmTransactionsBatchSerializer(serializers.Serializer):
+    """
+        Serializer for confirm batch of transactions with one code.
+    """
+    code = serializers.CharField()
+
+    def __init__(self, batch=None, *args, **kwargs):
+        self.batch = batch
+        super().__init__(*args, **kwargs)
+
+    def validate_code(self, value: str):
+        if not value.isnumeric():
+            raise ValidationError('Code must be numeric')
+        else:
+            return value
+
+    def validate(self, attrs):
+        if not self.batch:
+            raise ValidationError('batch is none')
+        if not self.batch['code'] == attrs['code']:
+            raise ValidationError('Invalid code')
+        return attrs
+
+
+class BatchTransactionResultSerializer(serializers.Serializer):
+    uuid = serializers.UUIDField()
+    confirmed = serializers.BooleanField()
+    error = serializers.CharField(allow_null=True)
+
+
+class SummarySerializer(serializers.Serializer):
+    """
+        Totals of transactions of pocket or of all user pockets.
+    """
+    refilled = MoneySerializerField(max_digits=SUMMARY_MAX_DIGITS, read_only=True,
+                                    help_text='sum of finished refills')
+    debited = MoneySerializerField(max_digits=SUMMARY_MAX_DIGITS, read_only=True,
+                                   help_text='sum of finished debits')
+    pending_refill = MoneySerializerField(max_digits=SUMMARY_MAX_DIGITS, read_only=True,
+                                          help_text='sum of refills which are not finished yet')
+    pending_debit = MoneySerializerField(max_digits=SUMMARY_MAX_DIGITS, read_only=True,
+                                         help_text='sum of debits which are not finished yet')
+    created_count = serializers.IntegerField(read_only=True)
+    in_process_count = serializers.IntegerField(read_only=True)
+    confirmed_count = serializers.IntegerField(read_only=True)
+    finished_count = serializers.IntegerField(read_only=True)
+    cancelled_count = serializers.IntegerField(read_only=True)
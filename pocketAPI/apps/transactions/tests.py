@@ -1,13 +1,46 @@
+import csv
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from decimal import Decimal
+from io import StringIO
 from unittest.mock import patch
 
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core.exceptions import PermissionDenied
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.shortcuts import resolve_url
-from django.test import override_settings
-from rest_framework.test import APITestCase
-
+from django.test import AsyncRequestFactory, LiveServerTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from redis import ConnectionError as RedisConnectionError
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from async_helpers import async_view
+from benchmark import find_regressions, save_baseline
 from pocket.models import Pocket
+from http_cache import invalidate_lists
+from jwt_helper.token import AccessToken
+from profiling import ProfilingMiddleware, metrics, metrics_view
+from redis_helper import get_pool_stats, get_redis, make_key
+from test_helpers import QueryCountMixin
+from throttling import RedisRateThrottle
 from transactions.exceptions import TransactionError
-from transactions.models import PocketTransaction, ActionTransactions, TransactionStatus
+from transactions.helpers import invalidate_analytics, get_confirmation_transaction_code, save_confirmation_batch
+from transactions.loadtest import percentile
+from transactions.management.commands.explain_transactions import QUERYSET_METHODS
+from transactions.models import PocketSummary, PocketTransaction, ActionTransactions, TransactionStatus, \
+    SUMMARY_AMOUNT_FIELDS, SUMMARY_COUNT_FIELDS
+from transactions.views import SendConfirmationCode, send_confirmation_code_fast_path
 
 
 class TestTransactionsModels(APITestCase):
@@ -22,6 +55,9 @@ class TestTransactionsModels(APITestCase):
         self.cancelled_transaction = PocketTransaction.objects.get(pk=5)
         self.debit_transaction = PocketTransaction.objects.get(pk=6)
 
+    def get_finished_count(self):
+        return PocketSummary.objects.filter(pocket=self.pocket).values_list('finished_count', flat=True).first() or 0
+
     def test_activate_created_transaction(self):
         with self.assertRaises(TransactionError) as exc:
             self.created_transaction.activate()
@@ -136,8 +172,56 @@ class TestTransactionsModels(APITestCase):
         self.assertEquals(self.pocket.balance, 0.0)
         self.assertEquals(self.cancelled_transaction.status, TransactionStatus.CANCELLED)
 
+    def test_concurrent_activation_changes_balance_once(self):
+        stale_transaction = PocketTransaction.objects.get(pk=self.confirmed_transaction.pk)
+        finished_count = self.get_finished_count()
+        self.confirmed_transaction.activate()
+        with self.assertRaises(TransactionError):
+            stale_transaction.activate()
+        self.pocket.refresh_from_db()
+        self.assertEquals(self.pocket.balance, self.confirmed_transaction.sum)
+        self.assertEquals(stale_transaction.status, TransactionStatus.FINISHED)
+        self.assertEquals(self.get_finished_count(), finished_count + 1)
+
+    def test_concurrent_cancel_refunds_once(self):
+        self.pocket.refill(1000)
+        stale_transaction = PocketTransaction.objects.get(pk=self.finished_transaction.pk)
+        self.finished_transaction.cancel()
+        with self.assertRaises(TransactionError):
+            stale_transaction.cancel()
+        self.pocket.refresh_from_db()
+        self.assertEquals(self.pocket.balance, 1000 - self.finished_transaction.sum)
+
+    def test_concurrent_balance_updates_are_not_lost(self):
+        other_pocket = Pocket.objects.get(pk=self.pocket.pk)
+        self.pocket.refill(100)
+        other_pocket.refill(50)
+        self.assertEquals(other_pocket.debit(30), 120)
+        self.pocket.refresh_from_db()
+        self.assertEquals(self.pocket.balance, 120)
+
+    def test_debit_more_than_balance_does_not_change_balance(self):
+        self.pocket.refill(10)
+        with self.assertRaises(ValueError):
+            self.pocket.debit(11)
+        self.pocket.refresh_from_db()
+        self.assertEquals(self.pocket.balance, 10)
+
+    def test_money_is_exact(self):
+        self.pocket.refill(0.1)
+        self.pocket.refill(0.2)
+        self.pocket.refresh_from_db()
+        self.assertEquals(self.pocket.balance, Decimal('0.3'))
+
+    def test_sum_by_action(self):
+        sums = PocketTransaction.objects.filter(pocket=self.pocket).sum_by_action()
+        refill_sum = sum(t.sum for t in PocketTransaction.objects.filter(action=ActionTransactions.REFILL))
+        debit_sum = sum(t.sum for t in PocketTransaction.objects.filter(action=ActionTransactions.DEBIT))
+        self.assertEquals(sums, {ActionTransactions.REFILL: refill_sum, ActionTransactions.DEBIT: debit_sum})
 
-@override_settings(EMAIL_BACKEND='django.core.mail.backends.console.EmailBackend', REDIS_PREFIX='pocketapi-test')
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.console.EmailBackend', REDIS_PREFIX='pocketapi-test',
+                   LIST_CACHE_TTL=0, RATE_LIMITS={})
 @patch('transactions.serializers.get_confirmation_transaction_code', return_value='11111')
 @patch('transactions.views.save_confirmation_transaction_code')
 class TestTransactions(APITestCase):
@@ -155,8 +239,27 @@ class TestTransactions(APITestCase):
         url = resolve_url('transactions:transactions-list')
         response = self.client.get(url)
         self.assertEquals(response.status_code, 200)
-        transactions_ids = [transaction['id'] for transaction in response.json()]
-        self.assertEquals(transactions_ids, list(self.user_1.transactions.visible().values_list('pk', flat=True)))
+        transactions_ids = [transaction['id'] for transaction in response.json()['results']]
+        self.assertEquals(transactions_ids, list(self.user_1.transactions.visible()
+                                                 .order_by('-date_created', '-id').values_list('pk', flat=True)))
+
+    def test_list_pagination(self, *mocks):
+        self.client.force_authenticate(self.user_1)
+        url = resolve_url('transactions:transactions-list') + '?page_size=2&count=true'
+        transactions_ids = []
+        while url:
+            response = self.client.get(url).json()
+            self.assertLessEqual(len(response['results']), 2)
+            self.assertEquals(response['count'], self.user_1.transactions.visible().count())
+            transactions_ids.extend(transaction['id'] for transaction in response['results'])
+            url = response['next']
+        self.assertEquals(transactions_ids, list(self.user_1.transactions.visible()
+                                                 .order_by('-date_created', '-id').values_list('pk', flat=True)))
+
+    def test_list_invalid_cursor(self, *mocks):
+        self.client.force_authenticate(self.user_1)
+        response = self.client.get(resolve_url('transactions:transactions-list') + '?cursor=123')
+        self.assertEquals(response.status_code, 404)
 
     def test_list_transaction_doesnt_show_archived_pocket(self, *mocks):
         self.client.force_authenticate(self.user_1)
@@ -165,7 +268,7 @@ class TestTransactions(APITestCase):
         url = resolve_url('transactions:transactions-list')
         response = self.client.get(url)
         self.assertEquals(response.status_code, 200)
-        transactions_ids = [transaction['id'] for transaction in response.json()]
+        transactions_ids = [transaction['id'] for transaction in response.json()['results']]
         for archived_transaction in list(archived_pocket.transactions.values_list('pk', flat=True)):
             self.assertNotIn(archived_transaction, transactions_ids)
 
@@ -175,9 +278,35 @@ class TestTransactions(APITestCase):
         url = resolve_url('transactions:transactions-list') + '?pocket__uuid={}'.format(pocket.uuid)
         response = self.client.get(url)
         self.assertEquals(response.status_code, 200)
-        transactions_ids = [transaction['id'] for transaction in response.json()]
+        transactions_ids = [transaction['id'] for transaction in response.json()['results']]
         self.assertEquals(transactions_ids,
-                          list(self.user_2.transactions.filter(pocket=pocket).values_list('pk', flat=True)))
+                          list(self.user_2.transactions.filter(pocket=pocket).order_by('-date_created', '-id')
+                               .values_list('pk', flat=True)))
+
+    def test_export_ndjson(self, *mocks):
+        self.client.force_authenticate(self.user_1)
+        response = self.client.get(resolve_url('transactions:export', file_format='ndjson'))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEquals([json.loads(line)['id'] for line in lines],
+                          list(self.user_1.transactions.visible().order_by('date_created', 'id')
+                               .values_list('pk', flat=True)))
+
+    def test_export_csv_filter_pocket(self, *mocks):
+        self.client.force_authenticate(self.user_2)
+        pocket = self.user_2.pockets.get(pk=3)
+        url = resolve_url('transactions:export', file_format='csv') + '?pocket__uuid={}'.format(pocket.uuid)
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, 200)
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEquals([int(row['id']) for row in rows],
+                          list(pocket.transactions.order_by('date_created', 'id').values_list('pk', flat=True)))
+
+    def test_export_invalid_filter(self, *mocks):
+        self.client.force_authenticate(self.user_1)
+        response = self.client.get(resolve_url('transactions:export', file_format='csv') + '?date_from=abc')
+        self.assertEquals(response.status_code, 400)
 
     def test_list_not_auth(self, *mocks):
         url = resolve_url('transactions:transactions-list')
@@ -228,6 +357,33 @@ class TestTransactions(APITestCase):
         self.assertEquals(json['comment'], 'test')
         self.assertEquals(pocket.balance, 0.0)
 
+    def test_bulk_create_transactions(self, *mocks):
+        self.client.force_authenticate(self.user_1)
+        pocket = self.user_1.pockets.first()
+        foreign_pocket = self.user_2.pockets.first()
+        transactions_count = PocketTransaction.objects.count()
+        url = resolve_url('transactions:bulk-create')
+        response = self.client.post(url, {'transactions': [
+            {'action': ActionTransactions.REFILL, 'sum': 400, 'comment': 'first', 'pocket': pocket.id},
+            {'action': ActionTransactions.DEBIT, 'sum': 400, 'pocket': pocket.id},
+            {'action': ActionTransactions.REFILL, 'sum': 10, 'pocket': foreign_pocket.id},
+            {'action': ActionTransactions.REFILL, 'sum': 20, 'pocket': pocket.id},
+        ]}, format='json')
+        self.assertEquals(response.status_code, 207)
+        results = response.json()['results']
+        self.assertEquals([result['created'] for result in results], [True, False, False, True])
+        self.assertEquals(results[0]['transaction']['comment'], 'first')
+        self.assertEquals(results[0]['transaction']['status'], TransactionStatus.CREATED.name)
+        self.assertIn('pocket', results[2]['errors'])
+        self.assertEquals(PocketTransaction.objects.count(), transactions_count + 2)
+
+    def test_bulk_create_transactions_all_invalid(self, *mocks):
+        self.client.force_authenticate(self.user_1)
+        url = resolve_url('transactions:bulk-create')
+        response = self.client.post(url, {'transactions': [{'action': 1, 'sum': -1, 'pocket': 'abc'}]}, format='json')
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(response.json()['results'][0]['created'], False)
+
     def test_send_confirm_code_for_created_transaction(self, *mocks):
         self.client.force_authenticate(self.user_1)
         pocket = self.user_1.pockets.first()
@@ -286,6 +442,56 @@ class TestTransactions(APITestCase):
         response = self.client.post(confirm_transaction_url, {'code': '11111'})
         self.assertEquals(response.status_code, 404)
 
+    @patch('transactions.views.generate_code', return_value='22222')
+    def test_batch_confirm_transactions(self, *mocks):
+        self.client.force_authenticate(self.user_1)
+        pocket = self.user_1.pockets.first()
+        pocket.refill(50)
+        refill = PocketTransaction.objects.create(pocket=pocket, action=ActionTransactions.REFILL, sum=100)
+        debit = PocketTransaction.objects.create(pocket=pocket, action=ActionTransactions.DEBIT, sum=120)
+        too_big_debit = PocketTransaction.objects.create(pocket=pocket, action=ActionTransactions.DEBIT, sum=1000)
+        batch = [refill, debit, too_big_debit]
+
+        response = self.client.post(resolve_url('transactions:batch-send-confirm-code'),
+                                    {'transactions': [str(t.uuid) for t in batch]}, format='json')
+        self.assertEquals(response.status_code, 200)
+        batch_uuid = response.json()['batch_uuid']
+        for transaction in batch:
+            transaction.refresh_from_db()
+            self.assertEquals(transaction.status, TransactionStatus.IN_PROCESS)
+
+        confirm_url = resolve_url('transactions:batch-confirm', batch_uuid=batch_uuid)
+        response = self.client.post(confirm_url, {'code': '11111'})
+        self.assertEquals(response.status_code, 400)
+
+        response = self.client.post(confirm_url, {'code': '22222'})
+        self.assertEquals(response.status_code, 200)
+        results = {result['uuid']: result for result in response.json()['results']}
+        self.assertTrue(results[str(refill.uuid)]['confirmed'])
+        self.assertTrue(results[str(debit.uuid)]['confirmed'])
+        self.assertEquals(results[str(too_big_debit.uuid)]['error'], 'debit value is more than balance')
+        pocket.refresh_from_db()
+        self.assertEquals(pocket.balance, 50 + 100 - 120)
+        statuses = [PocketTransaction.objects.get(pk=t.pk).status for t in batch]
+        self.assertEquals(statuses, [TransactionStatus.FINISHED, TransactionStatus.FINISHED,
+                                     TransactionStatus.CANCELLED])
+
+        # used code can not be replayed
+        self.assertEquals(self.client.post(confirm_url, {'code': '22222'}).status_code, 404)
+        # request which read code before it was deleted does not change balances again
+        save_confirmation_batch(batch_uuid, '22222', [t.uuid for t in batch])
+        response = self.client.post(confirm_url, {'code': '22222'})
+        self.assertFalse(any(result['confirmed'] for result in response.json()['results']))
+        pocket.refresh_from_db()
+        self.assertEquals(pocket.balance, 50 + 100 - 120)
+
+    def test_batch_send_code_not_owner(self, *mocks):
+        self.client.force_authenticate(self.user_1)
+        transaction = self.user_2.transactions.first()
+        response = self.client.post(resolve_url('transactions:batch-send-confirm-code'),
+                                    {'transactions': [str(transaction.uuid)]}, format='json')
+        self.assertEquals(response.status_code, 400)
+
     def test_delete_created_transaction(self, *mocks):
         self.client.force_authenticate(self.user_1)
         pocket = self.user_1.pockets.first()
@@ -314,3 +520,434 @@ class TestTransactions(APITestCase):
 
 
 
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', REDIS_PREFIX='pocketapi-test',
+                   LIST_CACHE_TTL=0, PROFILING_ENABLED=True,
+                   MIDDLEWARE=['profiling.ProfilingMiddleware'] + settings.MIDDLEWARE, RATE_LIMITS={})
+class TestProfiling(APITestCase):
+    fixtures = ['transactions/transactions_pockets.json', ]
+
+    def setUp(self) -> None:
+        metrics.clear()
+        self.user = get_user_model().objects.get(pk=1)
+        self.client.force_authenticate(self.user)
+
+    def test_request_cost_is_recorded_per_url_name(self):
+        transaction = self.user.pockets.first().transactions.first()
+        self.client.get(resolve_url('transactions:send-confirm-code', uuid=transaction.uuid))
+        self.client.get(resolve_url('transactions:send-confirm-code', uuid=transaction.uuid))
+
+        view = 'transactions:send-confirm-code'
+        self.assertEquals(metrics.get(view, 'request_duration_seconds').count, 2)
+        self.assertGreater(metrics.get(view, 'request_sql_queries').sum, 0)
+        self.assertGreater(metrics.get(view, 'request_redis_calls').sum, 0)
+        self.assertEquals(metrics.get(view, 'request_emails').sum, 2)
+
+        response = metrics_view(RequestFactory().get('/metrics/', REMOTE_ADDR='127.0.0.1'))
+        content = response.content.decode()
+        self.assertIn('# TYPE pocketapi_request_duration_seconds histogram', content)
+        self.assertIn('pocketapi_request_emails_count{view="transactions:send-confirm-code"} 2', content)
+        with self.assertRaises(PermissionDenied):
+            metrics_view(RequestFactory().get('/metrics/', REMOTE_ADDR='10.0.0.1'))
+
+    def test_sampled_request_is_profiled(self):
+        with tempfile.TemporaryDirectory() as dump_dir:
+            with override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_DUMP_DIR=dump_dir):
+                self.client.get(resolve_url('transactions:transactions-list'))
+            file_names = os.listdir(dump_dir)
+        self.assertEquals(len(file_names), 1)
+        self.assertTrue(file_names[0].startswith('transactions.transactions-list-'))
+
+
+class TestHealth(APITestCase):
+    def test_health(self):
+        response = self.client.get(resolve_url('health'))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json(), {'database': 'ok', 'redis': 'ok'})
+
+    @patch('health.get_redis')
+    def test_redis_is_not_available(self, get_redis):
+        get_redis.return_value.ping.side_effect = RedisConnectionError('Connection refused')
+        response = self.client.get(resolve_url('health'))
+        self.assertEquals(response.status_code, 503)
+        self.assertEquals(response.json()['redis'], 'Connection refused')
+
+    def test_pool_stats_with_threads(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: get_redis().ping(), range(400)))
+        stats = get_pool_stats()
+        self.assertEquals(stats['in_use_connections'], 0)
+        self.assertLessEqual(stats['created_connections'], stats['max_connections'])
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', REDIS_PREFIX='pocketapi-test',
+                   LIST_CACHE_TTL=0, RATE_LIMITS={})
+@patch('transactions.serializers.get_confirmation_transaction_code', return_value='11111')
+class TestTransactionsQueries(QueryCountMixin, APITestCase):
+    fixtures = ['transactions/transactions_pockets.json', ]
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.get(pk=1)
+        self.pocket = self.user.pockets.filter(is_archived=False).first()
+        self.pocket.refill(1000)
+        self.client.force_authenticate(self.user)
+        Site.objects.get_current()
+
+    def add_transactions(self, count, status=TransactionStatus.CREATED):
+        PocketTransaction.objects.bulk_create(
+            PocketTransaction(pocket=self.pocket, action=ActionTransactions.REFILL, sum=10, status=status)
+            for _ in range(count)
+        )
+        self.transaction = PocketTransaction.objects.filter(pocket=self.pocket, status=status).latest('id')
+
+    def test_list_queries(self, *mocks):
+        url = resolve_url('transactions:transactions-list')
+        self.assertConstantQueries(lambda: self.client.get(url), self.add_transactions, num=1)
+
+    def test_export_queries(self, *mocks):
+        url = resolve_url('transactions:export', file_format='csv')
+        self.assertConstantQueries(lambda: self.client.get(url), self.add_transactions, num=1)
+
+    def test_retrieve_queries(self, *mocks):
+        self.assertConstantQueries(
+            lambda: self.client.get(resolve_url('transactions:transactions-detail', uuid=self.transaction.uuid)),
+            self.add_transactions, num=1)
+
+    def test_send_confirm_code_queries(self, *mocks):
+        # select, outbox insert, status update, summary update
+        self.assertConstantQueries(
+            lambda: self.client.get(resolve_url('transactions:send-confirm-code', uuid=self.transaction.uuid)),
+            self.add_transactions, num=4)
+
+    def test_confirm_queries(self, *mocks):
+        self.assertConstantQueries(
+            lambda: self.client.post(resolve_url('transactions:confirm-transaction', uuid=self.transaction.uuid),
+                                     {'code': '11111'}),
+            lambda count: self.add_transactions(count, status=TransactionStatus.IN_PROCESS), num=6)
+
+    def test_destroy_queries(self, *mocks):
+        # select, status update, delete, summary updates of cancel and delete, savepoints of delete and cancel
+        self.assertConstantQueries(
+            lambda: self.client.delete(resolve_url('transactions:transactions-detail', uuid=self.transaction.uuid)),
+            self.add_transactions, num=9)
+
+    def test_explain_runs_once_per_method(self, *mocks):
+        stdout = StringIO()
+        with CaptureQueriesContext(connection) as queries, suppress(CommandError):
+            # seq scans are expected on so few rows, only number of EXPLAIN queries is checked
+            call_command('explain_transactions', users=2, pockets=1, transactions=2, print_plans=True, stdout=stdout)
+        explains = [query for query in queries if query['sql'].startswith('EXPLAIN')]
+        # and keyset page
+        self.assertEquals(len(explains), len(QUERYSET_METHODS) + 1)
+        self.assertIn('actual time=', stdout.getvalue())
+        self.assertIn('keyset page: ', stdout.getvalue())
+        self.assertNotIn('date_created is not index condition', stdout.getvalue())
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', REDIS_PREFIX='pocketapi-test',
+                   RATE_LIMITS={})
+@patch('transactions.serializers.get_confirmation_transaction_code', return_value='11111')
+@patch('transactions.views.generate_code', return_value='11111')
+class TestSummary(APITestCase):
+    fixtures = ['transactions/transactions_pockets.json', ]
+
+    def setUp(self) -> None:
+        # fixtures are loaded without summaries
+        PocketSummary.objects.rebuild()
+        self.user = get_user_model().objects.get(pk=1)
+        self.pocket = self.user.pockets.filter(is_archived=False).first()
+        self.client.force_authenticate(self.user)
+
+    def assertSummariesAreConsistent(self):
+        fields = ('pocket_id', *SUMMARY_AMOUNT_FIELDS, *SUMMARY_COUNT_FIELDS.values())
+        summaries = list(PocketSummary.objects.order_by('pocket_id').values(*fields))
+        PocketSummary.objects.rebuild()
+        self.assertEquals(summaries, list(PocketSummary.objects.order_by('pocket_id').values(*fields)))
+
+    def create_transaction(self, action, transaction_sum):
+        response = self.client.post(resolve_url('transactions:transactions-list'),
+                                    {'pocket': self.pocket.pk, 'action': action, 'sum': transaction_sum},
+                                    format='json')
+        return PocketTransaction.objects.get(uuid=response.json()['uuid'])
+
+    def confirm(self, transaction):
+        self.client.get(resolve_url('transactions:send-confirm-code', uuid=transaction.uuid))
+        return self.client.post(resolve_url('transactions:confirm-transaction', uuid=transaction.uuid),
+                                {'code': '11111'})
+
+    def test_summary_follows_transactions(self, *mocks):
+        refill = self.create_transaction(ActionTransactions.REFILL, 100)
+        debit = self.create_transaction(ActionTransactions.DEBIT, 0)
+        self.assertSummariesAreConsistent()
+        self.confirm(refill)
+        self.confirm(debit)
+        too_big_debit = self.create_transaction(ActionTransactions.DEBIT, 50)
+        self.client.delete(resolve_url('transactions:transactions-detail', uuid=refill.uuid))
+        self.assertEquals(self.confirm(too_big_debit).status_code, 400)
+        self.assertSummariesAreConsistent()
+
+    def test_summary_follows_batches(self, *mocks):
+        response = self.client.post(resolve_url('transactions:bulk-create'), {'transactions': [
+            {'pocket': self.pocket.pk, 'action': ActionTransactions.REFILL, 'sum': 10},
+            {'pocket': self.pocket.pk, 'action': ActionTransactions.REFILL, 'sum': 20},
+        ]}, format='json')
+        uuids = [result['transaction']['uuid'] for result in response.json()['results']]
+        self.assertSummariesAreConsistent()
+        response = self.client.post(resolve_url('transactions:batch-send-confirm-code'), {'transactions': uuids},
+                                    format='json')
+        self.assertSummariesAreConsistent()
+        self.client.post(resolve_url('transactions:batch-confirm', batch_uuid=response.json()['batch_uuid']),
+                         {'code': '11111'})
+        self.assertSummariesAreConsistent()
+        self.assertEquals(self.pocket.summary.refilled, self.pocket.transactions.finished()
+                          .sum_by_action()[ActionTransactions.REFILL])
+
+    def test_summary_endpoints(self, *mocks):
+        self.confirm(self.create_transaction(ActionTransactions.REFILL, 100))
+        self.create_transaction(ActionTransactions.DEBIT, 30)
+        response = self.client.get(resolve_url('transactions:pocket-summary', uuid=self.pocket.uuid))
+        self.assertEquals(response.status_code, 200)
+        summary = PocketSummary.objects.get(pocket=self.pocket)
+        self.assertEquals(response.json()['refilled'], summary.refilled)
+        self.assertEquals(response.json()['pending_debit'], summary.pending_debit)
+
+        response = self.client.get(resolve_url('transactions:summary'))
+        summaries = PocketSummary.objects.filter(pocket__user=self.user, pocket__is_archived=False)
+        self.assertEquals(response.json()['finished_count'], sum(s.finished_count for s in summaries))
+
+        empty_pocket = Pocket.objects.create(user=self.user, name='empty')
+        response = self.client.get(resolve_url('transactions:pocket-summary', uuid=empty_pocket.uuid))
+        self.assertEquals(response.json()['created_count'], 0)
+
+    def test_rebuild_locks_pockets(self, *mocks):
+        with CaptureQueriesContext(connection) as queries:
+            PocketSummary.objects.rebuild([self.pocket.pk])
+        statements = [query['sql'] for query in queries]
+        lock = next(i for i, sql in enumerate(statements) if sql.endswith('FOR UPDATE'))
+        delete = next(i for i, sql in enumerate(statements) if sql.startswith('DELETE'))
+        self.assertLess(lock, delete)
+        self.assertSummariesAreConsistent()
+
+    def test_rebuild_command(self, *mocks):
+        PocketSummary.objects.all().delete()
+        call_command('rebuild_summaries', stdout=StringIO())
+        self.assertEquals(PocketSummary.objects.count(),
+                          PocketTransaction.objects.values('pocket_id').distinct().count())
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', REDIS_PREFIX='pocketapi-test',
+                   RATE_LIMITS={})
+@patch('transactions.serializers.get_confirmation_transaction_code', return_value='11111')
+@patch('transactions.views.generate_code', return_value='11111')
+class TestAnalytics(APITransactionTestCase):
+    """ Transaction test case: analytics are invalidated on commit """
+    fixtures = ['transactions/transactions_pockets.json', ]
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.get(pk=1)
+        self.pocket = self.user.pockets.filter(is_archived=False).first()
+        self.client.force_authenticate(self.user)
+        # database is flushed between tests, but cached results of the same user stay in redis
+        invalidate_analytics([self.user.pk])
+        self.params = {'date_from': '2000-01-01T00:00:00Z', 'granularity': 'month'}
+
+    def get_analytics(self, params=None):
+        return self.client.get(resolve_url('transactions:analytics'), params or self.params)
+
+    def test_buckets(self, *mocks):
+        response = self.get_analytics()
+        self.assertEquals(response.status_code, 200)
+        buckets = response.json()['buckets']
+        transactions = PocketTransaction.objects.finished().filter(pocket__user=self.user)
+        self.assertEquals(sum(bucket['count'] for bucket in buckets), transactions.count())
+        for action in ActionTransactions:
+            self.assertEquals(sum(Decimal(bucket['sum']) for bucket in buckets if bucket['action'] == action),
+                              transactions.sum_by_action()[action])
+        self.assertEquals([bucket['period'] for bucket in buckets],
+                          sorted(bucket['period'] for bucket in buckets))
+
+    def test_cached_until_transactions_are_finished(self, *mocks):
+        count = sum(bucket['count'] for bucket in self.get_analytics().json()['buckets'])
+        with self.assertNumQueries(0):
+            self.assertEquals(sum(bucket['count'] for bucket in self.get_analytics().json()['buckets']), count)
+
+        response = self.client.post(resolve_url('transactions:transactions-list'),
+                                    {'pocket': self.pocket.pk, 'action': ActionTransactions.REFILL, 'sum': 10},
+                                    format='json')
+        transaction_uuid = response.json()['uuid']
+        self.client.get(resolve_url('transactions:send-confirm-code', uuid=transaction_uuid))
+        self.client.post(resolve_url('transactions:confirm-transaction', uuid=transaction_uuid), {'code': '11111'})
+        self.assertEquals(sum(bucket['count'] for bucket in self.get_analytics().json()['buckets']), count + 1)
+
+    def test_too_many_buckets(self, *mocks):
+        date_from = timezone.now() - timezone.timedelta(days=settings.ANALYTICS_MAX_BUCKETS + 1)
+        response = self.get_analytics({'date_from': date_from.isoformat(), 'granularity': 'day'})
+        self.assertEquals(response.status_code, 400)
+        response = self.get_analytics({'date_from': date_from.isoformat(), 'granularity': 'week'})
+        self.assertEquals(response.status_code, 200)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', REDIS_PREFIX='pocketapi-test',
+                   RATE_LIMITS={})
+@patch('transactions.serializers.get_confirmation_transaction_code', return_value='11111')
+@patch('transactions.views.generate_code', return_value='11111')
+class TestConditionalGet(APITransactionTestCase):
+    """ Transaction test case: versions of lists are changed on commit """
+    fixtures = ['transactions/transactions_pockets.json', ]
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.get(pk=1)
+        self.pocket = self.user.pockets.filter(is_archived=False).first()
+        self.client.force_authenticate(self.user)
+        # database is flushed between tests, but cached lists of the same user stay in redis
+        invalidate_lists([Pocket.list_version_name, PocketTransaction.list_version_name], [self.user.pk])
+
+    def assertModified(self, url, etag, modified=True):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200 if modified else 304)
+        return response['ETag']
+
+    def test_lists_follow_transactions(self, *mocks):
+        transactions_url = resolve_url('transactions:transactions-list')
+        pockets_url = resolve_url('pocket:pocket-list')
+        transactions_etag = self.client.get(transactions_url)['ETag']
+        pockets_etag = self.client.get(pockets_url)['ETag']
+
+        response = self.client.post(transactions_url,
+                                    {'pocket': self.pocket.pk, 'action': ActionTransactions.REFILL, 'sum': 10},
+                                    format='json')
+        transaction_uuid = response.json()['uuid']
+        transactions_etag = self.assertModified(transactions_url, transactions_etag)
+        pockets_etag = self.assertModified(pockets_url, pockets_etag, modified=False)
+
+        detail_url = resolve_url('transactions:transactions-detail', uuid=transaction_uuid)
+        detail_etag = self.client.get(detail_url)['ETag']
+        self.client.get(resolve_url('transactions:send-confirm-code', uuid=transaction_uuid))
+        self.client.post(resolve_url('transactions:confirm-transaction', uuid=transaction_uuid), {'code': '11111'})
+        self.assertModified(detail_url, detail_etag)
+        self.assertModified(transactions_url, transactions_etag)
+        # balance of pocket is changed
+        self.assertModified(pockets_url, pockets_etag)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', REDIS_PREFIX='pocketapi-test',
+                   JWT_STATELESS_USER=True, RATE_LIMITS={})
+class TestAsyncViews(APITransactionTestCase):
+    """ Transaction test case: sync part of async views uses other database connection """
+    fixtures = ['transactions/transactions_pockets.json', ]
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.get(pk=1)
+        self.token = AccessToken.for_user(self.user).b64_encoded.decode()
+        self.view = async_view(SendConfirmationCode.as_view(), send_confirmation_code_fast_path)
+
+    def send_code(self, transaction):
+        url = resolve_url('transactions:send-confirm-code', uuid=transaction.uuid)
+        # extra arguments of async factory are headers
+        request = AsyncRequestFactory().get(url, **{'access-token': self.token})
+        return async_to_sync(self.view)(request, **resolve(url).kwargs)
+
+    def test_send_confirmation_code(self):
+        transaction = PocketTransaction.objects.created().filter(pocket__user=self.user).first()
+        with patch.object(SendConfirmationCode, 'get', side_effect=AssertionError('sync view is called')):
+            response = self.send_code(transaction)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(json.loads(response.content), {'message': 'We sent confirmation code to your email'})
+        transaction.refresh_from_db()
+        self.assertEquals(transaction.status, TransactionStatus.IN_PROCESS)
+        self.assertEquals(len(get_confirmation_transaction_code(transaction.uuid)), settings.VALIDATION_CODE_LENGTH)
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_profiling(self):
+        metrics.clear()
+        transaction = PocketTransaction.objects.created().filter(pocket__user=self.user).first()
+        url = resolve_url('transactions:send-confirm-code', uuid=transaction.uuid)
+
+        async def get_response(request):
+            request.resolver_match = match = resolve(url)
+            return await self.view(request, **match.kwargs)
+
+        middleware = ProfilingMiddleware(get_response)
+        response = async_to_sync(middleware)(AsyncRequestFactory().get(url, **{'access-token': self.token}))
+        self.assertEquals(response.status_code, 200)
+        # queries are run in thread pool and redis is called on event loop
+        view = 'transactions:send-confirm-code'
+        self.assertEquals(metrics.get(view, 'request_duration_seconds').count, 1)
+        self.assertGreater(metrics.get(view, 'request_sql_queries').sum, 0)
+        self.assertGreater(metrics.get(view, 'request_redis_calls').sum, 0)
+        self.assertEquals(metrics.get(view, 'request_emails').sum, 1)
+
+    def test_errors_of_sync_view(self):
+        transaction = PocketTransaction.objects.exclude(pocket__user=self.user).first()
+        self.assertEquals(self.send_code(transaction).status_code, 403)
+
+    @override_settings(RATE_LIMITS={'confirmation-code': '1/min'})
+    def test_rate_limit(self):
+        get_redis().delete(make_key(RedisRateThrottle.cache_format % {'scope': 'confirmation-code',
+                                                                      'ident': self.user.pk}))
+        transaction = PocketTransaction.objects.created().filter(pocket__user=self.user).first()
+        self.assertEquals(self.send_code(transaction).status_code, 200)
+        # throttled request is left to sync view, it returns 429
+        response = self.send_code(transaction)
+        self.assertEquals(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', REDIS_PREFIX='pocketapi-test',
+                   RATE_LIMITS={}, JWT_USER_CACHE_TTL=0)
+class TestLoadTest(LiveServerTestCase):
+
+    def test_percentile(self):
+        values = [float(i) for i in range(1, 101)]
+        self.assertEquals(percentile(values, 50), 50.0)
+        self.assertEquals(percentile(values, 99), 99.0)
+        self.assertEquals(percentile(values, 100), 100.0)
+        self.assertEquals(percentile([3.0], 95), 3.0)
+        self.assertEquals(percentile([], 95), 0.0)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('loadtest', url=self.live_server_url, users=2, pockets=2, transactions=5, concurrency=2,
+                         duration=0.3, scenarios=['pocket-list', 'lifecycle', 'cancel-refund'], output=output)
+            with open(output) as file:
+                report = json.load(file)
+        self.assertEquals(report['meta']['scenarios'], ['pocket-list', 'lifecycle', 'cancel-refund'])
+        self.assertEquals(set(report['results']),
+                          {'pocket-list', 'create', 'send-code', 'confirm', 'cancel-refund'})
+        for name, result in report['results'].items():
+            self.assertEquals(result['errors'], 0, name)
+            self.assertGreater(result['requests'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+        # seeded users are deleted
+        self.assertFalse(get_user_model().objects.filter(username__startswith='seed-').exists())
+
+
+# seeded users are rolled back, so their ids can be left in redis user cache by other tests
+@override_settings(JWT_USER_CACHE_TTL=0)
+class TestBenchmark(APITestCase):
+
+    def test_find_regressions(self):
+        baseline = {'fast': {'min_ms': 1.0}, 'slow': {'min_ms': 1.0}}
+        results = {'fast': {'min_ms': 1.2}, 'slow': {'min_ms': 1.5}, 'new': {'min_ms': 100.0}}
+        self.assertEquals(find_regressions(results, baseline, 0.25), {'slow': 1.5})
+
+    def test_command(self):
+        options = {'users': 1, 'pockets': 1, 'transactions': 5, 'rounds': 2, 'warmup': 0, 'stdout': StringIO(),
+                   'benchmarks': ['PocketTransaction.cancel', 'AccessToken.get_user_from_token']}
+        with tempfile.TemporaryDirectory() as directory:
+            baseline_path = os.path.join(directory, 'baseline.json')
+            call_command('benchmark', baseline=baseline_path, save_baseline=True, **options)
+            with open(baseline_path) as file:
+                baseline = json.load(file)['results']
+            self.assertEquals(set(baseline), {'PocketTransaction.cancel', 'AccessToken.get_user_from_token'})
+            self.assertEquals(baseline['PocketTransaction.cancel']['rounds'], 2)
+
+            baseline['PocketTransaction.cancel']['min_ms'] = 0.000001
+            save_baseline(baseline_path, baseline, {})
+            with self.assertRaisesMessage(CommandError, 'PocketTransaction.cancel'):
+                call_command('benchmark', baseline=baseline_path, **options)
+        # benchmarks data is rolled back
+        self.assertFalse(get_user_model().objects.filter(username__startswith='seed-').exists())
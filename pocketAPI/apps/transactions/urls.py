@@ -1,7 +1,12 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework import routers
 
-from transactions.views import TransactionViewSet, ConfirmTransaction, SendConfirmationCode
+from async_helpers import async_urlpatterns, cached_list_fast_path
+from transactions.models import PocketTransaction
+from transactions.views import TransactionViewSet, ConfirmTransaction, SendConfirmationCode, ExportTransactions, \
+    BulkCreateTransactions, SendBatchConfirmationCode, ConfirmTransactionsBatch, TransactionsSummary, \
+    PocketTransactionsSummary, TransactionsAnalytics, send_confirmation_code_fast_path
 
 app_name = 'transactions'
 
@@ -10,8 +15,24 @@ router = routers.SimpleRouter()
 router.register('', TransactionViewSet, basename='transactions')
 
 urlpatterns = [
+    path('bulk/', BulkCreateTransactions.as_view(), name='bulk-create'),
+    path('batch/send-confirm-code/', SendBatchConfirmationCode.as_view(), name='batch-send-confirm-code'),
+    path('batch/<uuid:batch_uuid>/confirm/', ConfirmTransactionsBatch.as_view(), name='batch-confirm'),
+    path('export/<str:file_format>/', ExportTransactions.as_view(), name='export'),
+    path('summary/', TransactionsSummary.as_view(), name='summary'),
+    path('analytics/', TransactionsAnalytics.as_view(), name='analytics'),
+    path('summary/<uuid:uuid>/', PocketTransactionsSummary.as_view(), name='pocket-summary'),
     path('<uuid:uuid>/confirm-transaction/', ConfirmTransaction.as_view(), name='confirm-transaction'),
     path('<uuid:uuid>/send-confirm-code/', SendConfirmationCode.as_view(), name='send-confirm-code'),
 ]
 
 urlpatterns += router.urls
+
+if settings.ASYNC_VIEWS:
+    # streaming export is iterated on event loop by Django 3.1, so it stays sync view of WSGI server
+    urlpatterns = async_urlpatterns(urlpatterns,
+                                    names=('transactions-list', 'transactions-detail', 'send-confirm-code'),
+                                    fast_paths={
+                                        'transactions-list': cached_list_fast_path(PocketTransaction.list_version_name),
+                                        'send-confirm-code': send_confirmation_code_fast_path,
+                                    })
@@ -1,21 +1,40 @@
+import json
+import uuid as uuid_lib
+
 import coreschema
+from django.db import transaction as db_transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import permissions, mixins, status
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.viewsets import GenericViewSet
 from django.conf import settings
 
+from async_helpers import accepts_json, async_allow_request, async_authenticate, async_save_to_redis, \
+    database_sync_to_async
+from export_helpers import csv_lines, ndjson_lines
+from http_cache import ConditionalGetMixin
 from pocket.helpers import generate_code
+from pocket.models import Pocket
 from serializers_helpers import MessageSerializer
+from throttling import RedisRateThrottle
 from transactions.exceptions import TransactionError
-from transactions.helpers import save_confirmation_transaction_code
-from transactions.models import PocketTransaction, TransactionStatus
-from transactions.serializers import TransactionSerializer, ConfirmTransactionSerializer
+from transactions.helpers import save_confirmation_transaction_code, save_confirmation_batch, \
+    get_confirmation_batch, delete_confirmation_batch, get_analytics_key, get_analytics, save_analytics, \
+    get_confirmation_transaction_key
+from transactions.models import PocketSummary, PocketTransaction, TransactionStatus
+from transactions.serializers import TransactionSerializer, ConfirmTransactionSerializer, \
+    ExportTransactionsFilterSerializer, BulkCreateTransactionsSerializer, BatchSendConfirmationCodeSerializer, \
+    BatchMessageSerializer, ConfirmTransactionsBatchSerializer, BatchTransactionResultSerializer, SummarySerializer, \
+    AnalyticsFilterSerializer, AnalyticsSerializer
 import transactions.permissions as transaction_permissions
 
 
-class TransactionViewSet(mixins.CreateModelMixin,
+class TransactionViewSet(ConditionalGetMixin,
+                         mixins.CreateModelMixin,
                          mixins.RetrieveModelMixin,
                          mixins.DestroyModelMixin,
                          mixins.ListModelMixin,
@@ -24,6 +43,7 @@ class TransactionViewSet(mixins.CreateModelMixin,
     serializer_class = TransactionSerializer
     lookup_field = 'uuid'
     lookup_url_kwarg = 'uuid'
+    list_version_name = PocketTransaction.list_version_name
     filter_fields = {
         'pocket__uuid': {
             'description': 'uuid of pocket',
@@ -34,7 +54,8 @@ class TransactionViewSet(mixins.CreateModelMixin,
     }
 
     def get_queryset(self):
-        queryset = PocketTransaction.objects.visible().filter(pocket__user=self.request.user)
+        # pocket is used for cancelling transaction on delete, it is already joined for filter by user
+        queryset = PocketTransaction.objects.visible().filter(pocket__user=self.request.user).select_related('pocket')
         return queryset
 
     def destroy(self, request, *args, **kwargs):
@@ -46,6 +67,29 @@ class TransactionViewSet(mixins.CreateModelMixin,
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class BulkCreateTransactions(GenericAPIView):
+    """
+        Create many transactions in one request.
+        Returns result for every transaction: 201 if all were created, 207 if some of them have errors
+        and 400 if none were created.
+    """
+    permission_classes = [permissions.IsAuthenticated, ]
+    serializer_class = BulkCreateTransactionsSerializer
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        created = serializer.save()
+        results = serializer.results
+        if len(created) == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'results': results}, status=response_status)
+
+
 class ConfirmTransaction(GenericAPIView):
     """
         Confirm transaction with confirmation code from email.
@@ -56,7 +100,8 @@ class ConfirmTransaction(GenericAPIView):
     lookup_url_kwarg = 'uuid'
 
     def get_queryset(self):
-        return PocketTransaction.objects.active()
+        # pocket is checked by permission and changed by activation
+        return PocketTransaction.objects.active().select_related('pocket')
 
     def get_serializer(self, *args, **kwargs):
         return self.serializer_class(*args, **kwargs)
@@ -69,7 +114,7 @@ class ConfirmTransaction(GenericAPIView):
             try:
                 transaction.activate()
             except TransactionError as er:
-                transaction.cancel()
+                # activate cancels transaction itself if balance can not be changed
                 return Response({'error': str(er)}, status=status.HTTP_400_BAD_REQUEST)
             else:
                 message = MessageSerializer({'message': 'Your transaction have confirmed'})
@@ -81,12 +126,15 @@ class SendConfirmationCode(GenericAPIView):
         Send code to user email for confirm transaction.
     """
     permission_classes = [permissions.IsAuthenticated, transaction_permissions.IsOwner]
+    throttle_classes = [RedisRateThrottle]
+    throttle_scope = 'confirmation-code'
     serializer_class = MessageSerializer
     lookup_field = 'uuid'
     lookup_url_kwarg = 'uuid'
 
     def get_queryset(self):
-        return PocketTransaction.objects.active()
+        # email of pocket owner is needed for sending code
+        return PocketTransaction.objects.active().select_related('pocket__user')
 
     def get(self, request, uuid):
         # send confirmation code for confirm transaction
@@ -97,3 +145,215 @@ class SendConfirmationCode(GenericAPIView):
         instance.change_status(TransactionStatus.IN_PROCESS)
         message = self.serializer_class({'message': "We sent confirmation code to your email"})
         return Response(message.data)
+
+
+def _send_confirmation_code(instance, code):
+    instance.send_confirmation_code(code)
+    instance.change_status(TransactionStatus.IN_PROCESS)
+
+
+async def send_confirmation_code_fast_path(request, uuid):
+    """
+        SendConfirmationCode for ASGI: code is saved with async redis client, queries are run in thread pool.
+        Requests of not found or not owned transactions are left to sync view, so errors are the same.
+    """
+    if not accepts_json(request):
+        return None
+    user = await async_authenticate(request)
+    if user is None:
+        return None
+    queryset = PocketTransaction.objects.active().select_related('pocket__user').filter(uuid=uuid, pocket__user=user.pk)
+    instance = await database_sync_to_async(queryset.first)()
+    if instance is None or not await async_allow_request(SendConfirmationCode.throttle_scope, user.pk):
+        return None
+    confirmation_code = generate_code(length=settings.VALIDATION_CODE_LENGTH)
+    await async_save_to_redis(get_confirmation_transaction_key(instance.uuid), confirmation_code,
+                              lifetime=settings.VALIDATION_CODE_LIFETIME)
+    await database_sync_to_async(_send_confirmation_code)(instance, confirmation_code)
+    return JsonResponse(MessageSerializer({'message': "We sent confirmation code to your email"}).data)
+
+
+class SendBatchConfirmationCode(GenericAPIView):
+    """
+        Send one code to user email for confirm many transactions.
+        Returns uuid of batch, which is used for confirmation.
+    """
+    permission_classes = [permissions.IsAuthenticated, ]
+    throttle_classes = [RedisRateThrottle]
+    throttle_scope = 'confirmation-code'
+    serializer_class = BatchSendConfirmationCodeSerializer
+
+    def get_queryset(self):
+        return PocketTransaction.objects.active().filter(pocket__user=self.request.user)
+
+    @swagger_auto_schema(responses={200: BatchMessageSerializer()})
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        transactions_uuids = set(serializer.validated_data['transactions'])
+        transactions = list(self.get_queryset().filter(uuid__in=transactions_uuids))
+        not_found = transactions_uuids - {transaction.uuid for transaction in transactions}
+        if not_found:
+            return Response({'errors': ['Transactions not found: {}'.format(', '.join(map(str, not_found)))]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        batch_uuid = uuid_lib.uuid4()
+        confirmation_code = generate_code(length=settings.VALIDATION_CODE_LENGTH)
+        save_confirmation_batch(batch_uuid=batch_uuid, code=confirmation_code, transaction_uuids=transactions_uuids)
+        PocketTransaction.send_batch_confirmation_code(request.user, batch_uuid, transactions, confirmation_code)
+        created = [transaction for transaction in transactions if transaction.status == TransactionStatus.CREATED]
+        with db_transaction.atomic():
+            self.get_queryset().filter(pk__in=[transaction.pk for transaction in created],
+                                       status=TransactionStatus.CREATED)\
+                .update(status=TransactionStatus.IN_PROCESS, date_updated=timezone.now())
+            PocketTransaction.record_status_changes(
+                (transaction, TransactionStatus.CREATED, TransactionStatus.IN_PROCESS) for transaction in created
+            )
+        message = BatchMessageSerializer({'message': "We sent confirmation code to your email",
+                                          'batch_uuid': batch_uuid})
+        return Response(message.data)
+
+
+class ConfirmTransactionsBatch(GenericAPIView):
+    """
+        Confirm batch of transactions with one confirmation code from email.
+        All transactions are activated in one database transaction.
+    """
+    serializer_class = ConfirmTransactionsBatchSerializer
+    permission_classes = [permissions.IsAuthenticated, ]
+
+    def get_queryset(self):
+        return PocketTransaction.objects.in_progress().filter(pocket__user=self.request.user).select_related('pocket')
+
+    def get_serializer(self, *args, **kwargs):
+        return self.serializer_class(*args, **kwargs)
+
+    @swagger_auto_schema(responses={200: BatchTransactionResultSerializer(many=True)})
+    def post(self, request, batch_uuid):
+        batch = get_confirmation_batch(batch_uuid)
+        if batch is None:
+            raise Http404
+        serializer = self.get_serializer(data=request.data, batch=batch)
+        serializer.is_valid(raise_exception=True)
+        delete_confirmation_batch(batch_uuid)
+
+        with db_transaction.atomic():
+            # concurrent confirmation of the same batch waits for the lock and then sees finished transactions,
+            # which are not in progress anymore, so balances are changed only once
+            transactions = list(self.get_queryset().filter(uuid__in=batch['transactions'])
+                                .select_for_update(of=('self', )))
+            for transaction in transactions:
+                transaction.set_confirmed()
+            errors = PocketTransaction.activate_many(transactions)
+
+        results = [
+            {'uuid': transaction.uuid, 'confirmed': errors[transaction.pk] is None, 'error': errors[transaction.pk]}
+            for transaction in transactions
+        ]
+        processed = {str(transaction.uuid) for transaction in transactions}
+        results.extend(
+            {'uuid': transaction_uuid, 'confirmed': False, 'error': 'Transaction is not in process'}
+            for transaction_uuid in batch['transactions'] if transaction_uuid not in processed
+        )
+        return Response({'results': BatchTransactionResultSerializer(results, many=True).data})
+
+
+class ExportTransactions(GenericAPIView):
+    """
+        Export all transactions of user as ndjson or csv.
+        Rows are read from server-side cursor and streamed, so memory does not depend on history size.
+    """
+    permission_classes = [permissions.IsAuthenticated, ]
+    serializer_class = TransactionSerializer
+    content_types = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+
+    def get_queryset(self):
+        return PocketTransaction.objects.visible().filter(pocket__user=self.request.user)\
+            .order_by('date_created', 'id')
+
+    def get_rows(self, queryset):
+        serializer = self.get_serializer()
+        for transaction in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            yield serializer.to_representation(transaction)
+
+    @swagger_auto_schema(query_serializer=ExportTransactionsFilterSerializer())
+    def get(self, request, file_format):
+        if file_format not in self.content_types:
+            raise Http404
+        filter_serializer = ExportTransactionsFilterSerializer(data=request.query_params)
+        filter_serializer.is_valid(raise_exception=True)
+        rows = self.get_rows(filter_serializer.filter_queryset(self.get_queryset()))
+
+        if file_format == 'csv':
+            lines = csv_lines(rows, fields=self.serializer_class.Meta.fields)
+        else:
+            lines = ndjson_lines(rows)
+        response = StreamingHttpResponse(lines, content_type=self.content_types[file_format])
+        response['Content-Disposition'] = 'attachment; filename="transactions.{}"'.format(file_format)
+        return response
+
+
+class TransactionsSummary(GenericAPIView):
+    """
+        Totals of transactions of all not archived pockets of user.
+    """
+    permission_classes = [permissions.IsAuthenticated, ]
+    serializer_class = SummarySerializer
+
+    def get_queryset(self):
+        return PocketSummary.objects.filter(pocket__user=self.request.user, pocket__is_archived=False)
+
+    def get(self, request):
+        return Response(self.get_serializer(self.get_queryset().total()).data)
+
+
+class PocketTransactionsSummary(GenericAPIView):
+    """
+        Totals of transactions of pocket.
+    """
+    permission_classes = [permissions.IsAuthenticated, ]
+    serializer_class = SummarySerializer
+    lookup_field = 'uuid'
+    lookup_url_kwarg = 'uuid'
+
+    def get_queryset(self):
+        return Pocket.objects.active().filter(user=self.request.user).select_related('summary')
+
+    def get(self, request, uuid):
+        pocket = self.get_object()
+        # pocket without transactions has no summary yet
+        summary = getattr(pocket, 'summary', None) or PocketSummary(pocket=pocket)
+        return Response(self.get_serializer(summary).data)
+
+
+class TransactionsAnalytics(GenericAPIView):
+    """
+        Sums and counts of finished transactions of user per day, week or month.
+        Periods are grouped by database, result is cached in redis until transactions of user are changed.
+    """
+    permission_classes = [permissions.IsAuthenticated, ]
+    serializer_class = AnalyticsSerializer
+
+    def get_queryset(self):
+        return PocketTransaction.objects.finished().filter(pocket__user=self.request.user)
+
+    @swagger_auto_schema(query_serializer=AnalyticsFilterSerializer(), responses={200: AnalyticsSerializer()})
+    def get(self, request):
+        filter_serializer = AnalyticsFilterSerializer(data=request.query_params)
+        filter_serializer.is_valid(raise_exception=True)
+        params = filter_serializer.validated_data
+        key = get_analytics_key(request.user.pk, params)
+        data = get_analytics(key)
+        if data is None:
+            buckets = filter_serializer.filter_queryset(self.get_queryset()).buckets(params['granularity'])
+            data = json.dumps(self.get_serializer({
+                'granularity': params['granularity'],
+                'date_from': params['date_from'],
+                'date_to': params.get('date_to'),
+                'buckets': buckets,
+            }).data, cls=JSONEncoder)
+            save_analytics(key, data)
+        return Response(json.loads(data))
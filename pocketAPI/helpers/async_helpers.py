@@ -0,0 +1,215 @@
+import asyncio
+import functools
+import json
+import time
+import weakref
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+import aioredis
+from aioredis.exceptions import NoScriptError
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import URLPattern
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from http_cache import get_list_version_key, get_list_cache_key, get_version_last_modified, make_etag, \
+    set_conditional_headers
+from jwt_helper.exceptions import TokenException
+from jwt_helper.token import AccessToken
+from jwt_helper.user_cache import get_local_user_data, get_user_cache_key, set_local_user_data
+from profiling import metrics, record_redis_call
+from redis_helper import make_key
+from throttling import RATE_LIMIT_SCRIPT, RATE_LIMIT_SCRIPT_SHA, RedisRateThrottle, get_rate, get_rate_limit_args
+
+JSON_MEDIA_TYPE = 'application/json'
+
+# event loop: redis client, connections can not be shared between loops
+_clients = weakref.WeakKeyDictionary()
+
+
+class ProfiledAsyncRedis(aioredis.Redis):
+    """ Asyncio redis client which records every call for profiling middleware """
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            record_redis_call(time.perf_counter() - start)
+
+
+def get_async_redis() -> aioredis.Redis:
+    """
+        Return asyncio redis client of running event loop.
+        Connection pool is bounded by the same settings as pool of sync client.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = ProfiledAsyncRedis(connection_pool=aioredis.BlockingConnectionPool(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        ))
+    return client
+
+
+async def async_save_to_redis(key, value, lifetime=60):
+    await get_async_redis().set(make_key(key), value, ex=lifetime)
+
+
+async def async_get_from_redis(key):
+    return await get_async_redis().get(make_key(key))
+
+
+async def async_get_version(key) -> str:
+    """ Async variant of redis_helper.get_version """
+    redis_key = make_key(key)
+    client = get_async_redis()
+    version = await client.get(redis_key)
+    if version is None:
+        await client.set(redis_key, time.time_ns(), nx=True)
+        version = await client.get(redis_key)
+    return version.decode('utf-8')
+
+
+async def async_allow_request(scope: str, ident) -> bool:
+    """
+        Async variant of RedisRateThrottle check for fast paths, request is recorded if it is allowed.
+        Throttled requests are left to sync view, which returns 429 response.
+    """
+    rate = get_rate(scope)
+    if rate is None:
+        return True
+    args = get_rate_limit_args(scope, ident, *RedisRateThrottle().parse_rate(rate))
+    client = get_async_redis()
+    try:
+        wait_ms = await client.evalsha(RATE_LIMIT_SCRIPT_SHA, *args)
+    except NoScriptError:
+        wait_ms = await client.eval(RATE_LIMIT_SCRIPT, *args)
+    return wait_ms == 0
+
+
+def _with_connections(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return wrapper
+
+
+def database_sync_to_async(func):
+    """
+        Run function which uses database in thread pool.
+        Django 3.1 runs sync code of ASGI requests in one thread, pool lets slow queries of different requests overlap.
+        Connections are closed by CONN_MAX_AGE rules before and after the call, as at the end of sync request.
+    """
+    return sync_to_async(_with_connections(func), thread_sensitive=False)
+
+
+async def async_authenticate(request):
+    """
+        Return user of access token without database queries or None if user can not be built this way:
+        no or invalid token, user is neither stateless (JWT_STATELESS_USER) nor cached (JWT_USER_CACHE_TTL).
+        Users which are not cached yet are loaded by sync view, which fills the cache.
+    """
+    token = request.headers.get(getattr(settings, 'AUTH_HEADER_NAME', 'access token'), '')
+    if not token:
+        return None
+    try:
+        payload = AccessToken.get_payload_from_token(token)
+        if getattr(settings, 'JWT_STATELESS_USER', False):
+            return AccessToken.get_user_from_payload(payload)
+        if not getattr(settings, 'JWT_USER_CACHE_TTL', 0):
+            return None
+        user_id = payload.get('user_id')
+        data = get_local_user_data(user_id)
+        if data is None:
+            value = await async_get_from_redis(get_user_cache_key(user_id))
+            if value is None:
+                return None
+            data = json.loads(value)
+            set_local_user_data(user_id, data)
+        return AccessToken.get_user_from_cached_data(data, payload.get('username'))
+    except TokenException:
+        return None
+
+
+def accepts_json(request) -> bool:
+    """ True if DRF content negotiation would choose JSONRenderer for request """
+    return 'format' not in request.GET and request.headers.get('Accept', '*/*') in ('*/*', JSON_MEDIA_TYPE)
+
+
+def async_view(view: Callable, fast_path: Optional[Callable[..., Awaitable[Optional[HttpResponse]]]] = None):
+    """
+        Async wrapper of sync (DRF) view for ASGI server.
+        fast_path is awaited on event loop first, if it returns None, view is called in thread pool.
+        Attributes of view are copied, so wrapper is still documented as DRF view.
+    """
+    sync_view = database_sync_to_async(view)
+
+    async def wrapper(request, *args, **kwargs):
+        if fast_path is not None:
+            response = await fast_path(request, *args, **kwargs)
+            if response is not None:
+                return response
+        return await sync_view(request, *args, **kwargs)
+
+    return functools.update_wrapper(wrapper, view)
+
+
+def cached_list_fast_path(list_version_name: str):
+    """
+        Fast path for async_view of ConditionalGetMixin list: 304 and cached responses are built
+        with async redis calls only, other requests are left to sync view.
+    """
+    async def fast_path(request, *args, **kwargs):
+        if request.method != 'GET' or not accepts_json(request):
+            return None
+        user = await async_authenticate(request)
+        if user is None:
+            return None
+        version = await async_get_version(get_list_version_key(list_version_name, user.pk))
+        etag = make_etag(version, request.get_full_path(), JSON_MEDIA_TYPE)
+        last_modified = get_version_last_modified(version)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            if not settings.LIST_CACHE_TTL:
+                return None
+            key = get_list_cache_key(list_version_name, user.pk, version, request.build_absolute_uri(),
+                                     JSON_MEDIA_TYPE)
+            data = await async_get_from_redis(key)
+            if data is None:
+                return None
+            metrics.increment(request.resolver_match.view_name, 'list_cache_hits')
+            response = HttpResponse(data, content_type=JSON_MEDIA_TYPE)
+            patch_vary_headers(response, ('Accept', ))
+        set_conditional_headers(response, etag, last_modified)
+        return response
+
+    return fast_path
+
+
+def async_urlpatterns(urlpatterns: List[URLPattern], names: Iterable[str],
+                      fast_paths: Dict[str, Callable] = None) -> List[URLPattern]:
+    """
+        Replace views of url patterns with async_view.
+        names:          names of url patterns to replace
+        fast_paths:     url name: fast path of view
+    """
+    names = set(names)
+    fast_paths = fast_paths or {}
+    return [
+        URLPattern(pattern.pattern, async_view(pattern.callback, fast_paths.get(pattern.name)),
+                   pattern.default_args, pattern.name) if pattern.name in names else pattern
+        for pattern in urlpatterns
+    ]
@@ -0,0 +1,60 @@
+import json
+import statistics
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+
+def run_benchmark(func: Callable, setup: Optional[Callable[[], Tuple]] = None, rounds: int = 20,
+                  warmup: int = 2) -> Dict[str, float]:
+    """
+        Call func rounds times and return statistics of its time in milliseconds.
+        setup is called before every call and is not timed, it returns arguments of func,
+        so every round can get fresh objects (e.g. transaction with the same status).
+        First warmup calls are not counted: they fill caches of querysets, serializers and imports.
+    """
+    timings = []
+    for i in range(warmup + rounds):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            timings.append(elapsed * 1000)
+    return {
+        'rounds': rounds,
+        'min_ms': round(min(timings), 4),
+        'median_ms': round(statistics.median(timings), 4),
+        'mean_ms': round(statistics.mean(timings), 4),
+        'stdev_ms': round(statistics.stdev(timings), 4) if rounds > 1 else 0.0,
+    }
+
+
+def find_regressions(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> Dict[str, float]:
+    """
+        Return {name: time / baseline time} of benchmarks which are more than threshold slower than baseline.
+        Minimal times are compared: they are least affected by other processes and database noise.
+        Benchmarks which are not in baseline are skipped.
+    """
+    regressions = {}
+    for name, result in results.items():
+        if name not in baseline or not baseline[name]['min_ms']:
+            continue
+        ratio = result['min_ms'] / baseline[name]['min_ms']
+        if ratio > 1 + threshold:
+            regressions[name] = round(ratio, 2)
+    return regressions
+
+
+def load_baseline(path) -> Dict[str, dict]:
+    """ Results of baseline file, empty if there is no file """
+    try:
+        with open(path) as file:
+            return json.load(file)['results']
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results: Dict[str, dict], meta: dict):
+    with open(path, 'w') as file:
+        json.dump({'meta': meta, 'results': results}, file, indent=2, sort_keys=True)
+        file.write('\n')
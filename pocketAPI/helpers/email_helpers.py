@@ -1,5 +1,33 @@
+import threading
+import time
+from typing import Dict, Iterable, List
+
+from django.conf import settings
+from django.core.mail import send_mail
 from django.template.loader import get_template
 
+from profiling import record_email
+
+_render_stats = {}
+_render_stats_lock = threading.Lock()
+
+
+def _record_render_time(template_name, count, seconds):
+    with _render_stats_lock:
+        stats = _render_stats.setdefault(template_name, {'count': 0, 'total_time': 0.0, 'max_time': 0.0})
+        stats['count'] += count
+        stats['total_time'] += seconds
+        stats['max_time'] = max(stats['max_time'], seconds / count)
+
+
+def get_render_stats() -> Dict[str, Dict[str, float]]:
+    """
+        Return render statistics for every template: {template_name: {count, total_time, max_time}}.
+        Time in seconds, max_time is average time of the slowest render call.
+    """
+    with _render_stats_lock:
+        return {name: dict(stats) for name, stats in _render_stats.items()}
+
 
 def create_email_template(template_name, context=None):
     """
@@ -7,6 +35,37 @@ def create_email_template(template_name, context=None):
     """
     if context is None:
         context = {}
+    # compiled templates are kept by cached template loader, it is used when DEBUG is False
     template = get_template(template_name)
+    start = time.perf_counter()
     message = template.render(context)
+    _record_render_time(template_name, 1, time.perf_counter() - start)
     return message
+
+
+def create_email_templates(template_name, contexts: Iterable[dict]) -> List[str]:
+    """
+        Create email messages for many recipients using one template.
+    """
+    template = get_template(template_name)
+    start = time.perf_counter()
+    messages = [template.render(context) for context in contexts]
+    if messages:
+        _record_render_time(template_name, len(messages), time.perf_counter() - start)
+    return messages
+
+
+def send_email(subject, message, recipient_list, from_email=None, html_message=None, fail_silently=False):
+    """
+        Send email.
+        If EMAIL_USE_OUTBOX is True, email is saved to outbox and sent later by send_emails worker,
+        so request does not wait for smtp.
+    """
+    record_email()
+    if getattr(settings, 'EMAIL_USE_OUTBOX', False):
+        from mailing.models import OutgoingEmail
+        OutgoingEmail.objects.enqueue(subject=subject, message=message, recipient_list=recipient_list,
+                                      from_email=from_email, html_message=html_message)
+    else:
+        send_mail(subject, message, from_email, recipient_list, fail_silently=fail_silently,
+                  html_message=html_message)
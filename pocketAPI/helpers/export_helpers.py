@@ -0,0 +1,32 @@
+import csv
+from typing import Any, Dict, Iterable, Sequence
+
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class _Echo:
+    """
+        File-like object which returns written value instead of storing it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows: Iterable[Dict[str, Any]]) -> Iterable[str]:
+    """
+        Yield every row as one line of json.
+    """
+    encoder = JSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def csv_lines(rows: Iterable[Dict[str, Any]], fields: Sequence[str]) -> Iterable[str]:
+    """
+        Yield header and every row as one line of csv.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row.get(field) for field in fields])
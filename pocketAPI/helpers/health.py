@@ -0,0 +1,23 @@
+from django.db import DatabaseError, connection
+from django.http import JsonResponse
+from redis import RedisError
+
+from redis_helper import get_redis
+
+
+def health_view(request):
+    """ Health check for load balancer and docker: worker can reach database and redis """
+    checks = {}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        checks['database'] = 'ok'
+    except DatabaseError as exc:
+        checks['database'] = str(exc)
+    try:
+        get_redis().ping()
+        checks['redis'] = 'ok'
+    except RedisError as exc:
+        checks['redis'] = str(exc)
+    healthy = all(value == 'ok' for value in checks.values())
+    return JsonResponse(checks, status=200 if healthy else 503)
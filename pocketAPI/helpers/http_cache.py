@@ -0,0 +1,116 @@
+import calendar
+import hashlib
+import json
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+
+from profiling import metrics
+from redis_helper import get_version, bump_versions, save_to_redis, get_from_redis
+
+
+def get_list_version_key(name: str, user_id) -> str:
+    key = f'list-version:{name}:{user_id}:{settings.SECRET_KEY}'
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def get_list_version(name: str, user_id) -> str:
+    """ Version of list of user objects. Version is time in nanoseconds when list was changed last time """
+    return get_version(get_list_version_key(name, user_id))
+
+
+def invalidate_lists(names: Iterable[str], user_ids: Iterable):
+    """
+        Change versions of lists of users after current database transaction is committed,
+        so version is not changed before new data can be read.
+    """
+    user_ids = set(user_ids)
+    keys = [get_list_version_key(name, user_id) for name in names for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: bump_versions(keys))
+
+
+def get_list_cache_key(name: str, user_id, version: str, url: str, media_type: str) -> str:
+    key = f'list-response:{name}:{user_id}:{version}:{url}:{media_type}:{settings.SECRET_KEY}'
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def make_etag(*parts) -> str:
+    return 'W/"{}"'.format(hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest())
+
+
+def get_last_modified(modified: datetime) -> int:
+    """
+        Last-Modified of object in whole seconds: HTTP dates have no fractions, so time with microseconds
+        would always be newer than If-Modified-Since sent by client.
+    """
+    return calendar.timegm(modified.utctimetuple())
+
+
+def get_version_last_modified(version: str) -> int:
+    """ Last-Modified of list in whole seconds, version is time in nanoseconds """
+    return int(version) // 10 ** 9
+
+
+def set_conditional_headers(response, etag: str, last_modified: Optional[float]):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # clients can keep response, but have to check it every time
+    patch_cache_control(response, private=True, no_cache=True)
+
+
+class ConditionalGetMixin:
+    """
+        Conditional GET for retrieve and list actions of viewset.
+        Weak ETag and Last-Modified are checked before serialization, so not changed resource costs 304 response.
+        Object is validated by last_modified_field, list by version of list of user (see invalidate_lists).
+        Data of list responses is cached in redis with the same version for LIST_CACHE_TTL seconds.
+    """
+    list_version_name = None
+    last_modified_field = 'date_updated'
+
+    def conditional_response(self, etag: str, last_modified: Optional[float], get_response: Callable) -> Response:
+        response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        set_conditional_headers(response, etag, last_modified)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        modified = getattr(instance, self.last_modified_field)
+        etag = make_etag(instance.pk, modified.isoformat(), request.accepted_media_type)
+        return self.conditional_response(etag, get_last_modified(modified),
+                                         lambda: Response(self.get_serializer(instance).data))
+
+    def list(self, request, *args, **kwargs):
+        version = get_list_version(self.list_version_name, request.user.pk)
+        etag = make_etag(version, request.get_full_path(), request.accepted_media_type)
+        return self.conditional_response(etag, get_version_last_modified(version),
+                                         lambda: self.cached_list(version, request, *args, **kwargs))
+
+    def cached_list(self, version: str, request, *args, **kwargs) -> Response:
+        """ Old data is never read: cache key contains version of list, which is changed with every change """
+        if not settings.LIST_CACHE_TTL:
+            return super().list(request, *args, **kwargs)
+        view = request.resolver_match.view_name
+        # links to other pages are absolute
+        key = get_list_cache_key(self.list_version_name, request.user.pk, version, request.build_absolute_uri(),
+                                 request.accepted_media_type)
+        data = get_from_redis(key)
+        if data is not None:
+            metrics.increment(view, 'list_cache_hits')
+            return Response(json.loads(data))
+        metrics.increment(view, 'list_cache_misses')
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            # rendered as by JSONRenderer, so async views can return it as is
+            save_to_redis(key, JSONRenderer().render(response.data), time=settings.LIST_CACHE_TTL)
+        return response
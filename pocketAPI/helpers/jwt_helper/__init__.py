@@ -0,0 +1 @@
+default_app_config = 'helpers.jwt_helper.apps.JWTHelperConfig'
\ No newline at end of file
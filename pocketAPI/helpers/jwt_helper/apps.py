@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class JWTHelperConfig(AppConfig):
+    name = 'helpers.jwt_helper'
+    label = 'jwt_helper'
+
+    def ready(self):
+        import jwt_helper.user_cache  # noqa: F401 connects signals for cache invalidation
@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import jwt
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from jwt.algorithms import get_default_algorithms
+
+from .exceptions import TokenException
+
+HMAC_ALGORITHMS = ('HS256', 'HS384', 'HS512')
+PUBLIC_KEY_SUFFIX = '.pub.pem'
+PRIVATE_KEY_SUFFIX = '.pem'
+
+
+class SigningKey:
+    """
+        Key of key ring.
+        kid:            key id, it is written to token header
+        algorithm:      algorithm which is used with this key
+        private_key:    key for signing tokens, None if key is only used for verifying old tokens
+        public_key:     key for verifying tokens
+    """
+
+    def __init__(self, kid: Optional[str], algorithm: str, private_key=None, public_key=None):
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = private_key
+        self.public_key = public_key
+
+    @property
+    def can_sign(self) -> bool:
+        return self.private_key is not None
+
+    def to_jwk(self) -> Dict[str, str]:
+        jwk = json.loads(get_default_algorithms()[self.algorithm].to_jwk(self.public_key))
+        jwk.update({'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'})
+        return jwk
+
+
+class KeyRing:
+    """
+        Keys for signing and verifying tokens.
+        For HS* algorithms ring contains only SECRET_KEY.
+        For asymmetric algorithms keys are loaded from JWT_KEYS_DIR:
+            <kid>.pem       private key, can sign and verify
+            <kid>.pub.pem   public key of retired key, can only verify tokens which are still alive
+        New tokens are signed with JWT_SIGNING_KID or with the last (by name) private key,
+        so key is rotated by adding new file, e.g. 2021-04.pem after 2021-03.pem.
+    """
+
+    def __init__(self, algorithm: str, keys: List[SigningKey], signing_kid: Optional[str] = None):
+        self.algorithm = algorithm
+        self.keys = {key.kid: key for key in keys}
+        signing_keys = [key for key in keys if key.can_sign]
+        if signing_kid is not None:
+            signing_keys = [key for key in signing_keys if key.kid == signing_kid]
+        if not signing_keys:
+            raise TokenException('there is no key for signing tokens with {}'.format(algorithm))
+        self.signing_key = signing_keys[-1]
+        self._jwks = None
+
+    @classmethod
+    def from_settings(cls) -> 'KeyRing':
+        algorithm = getattr(settings, 'JWT_ALGORITHM', 'HS256')
+        if algorithm in HMAC_ALGORITHMS:
+            return cls(algorithm, [SigningKey(None, algorithm, settings.SECRET_KEY, settings.SECRET_KEY)])
+        keys_dir = getattr(settings, 'JWT_KEYS_DIR', None)
+        if not keys_dir:
+            raise ImproperlyConfigured('JWT_KEYS_DIR must be set for JWT_ALGORITHM {}'.format(algorithm))
+        return cls(algorithm, load_keys(keys_dir, algorithm), getattr(settings, 'JWT_SIGNING_KID', None))
+
+    def get_verifying_key(self, kid: Optional[str]) -> SigningKey:
+        key = self.keys.get(kid)
+        if key is None:
+            raise TokenException('Unknown token key')
+        return key
+
+    def encode(self, payload: Dict[str, Any]) -> str:
+        key = self.signing_key
+        headers = {'kid': key.kid} if key.kid is not None else None
+        return jwt.encode(payload=payload, key=key.private_key, algorithm=key.algorithm, headers=headers)
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+        except jwt.InvalidTokenError:
+            raise TokenException('Can not decode token')
+        key = self.get_verifying_key(kid)
+        try:
+            return jwt.decode(token, key=key.public_key, algorithms=(key.algorithm,))
+        except jwt.InvalidTokenError:
+            raise TokenException('Invalid token')
+
+    def jwks(self) -> Dict[str, List[Dict[str, str]]]:
+        """ Public keys in JWKS format. Empty for HS* algorithms, secret is never published """
+        if self._jwks is None:
+            self._jwks = {'keys': [key.to_jwk() for key in self.keys.values() if key.kid is not None]}
+        return self._jwks
+
+
+def load_keys(keys_dir: str, algorithm: str) -> List[SigningKey]:
+    """ Load keys from PEM files sorted by kid """
+    from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+
+    keys = {}
+    for file_name in sorted(os.listdir(keys_dir)):
+        path = os.path.join(keys_dir, file_name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if file_name.endswith(PUBLIC_KEY_SUFFIX):
+            kid = file_name[:-len(PUBLIC_KEY_SUFFIX)]
+            keys.setdefault(kid, SigningKey(kid, algorithm, public_key=load_pem_public_key(data)))
+        elif file_name.endswith(PRIVATE_KEY_SUFFIX):
+            kid = file_name[:-len(PRIVATE_KEY_SUFFIX)]
+            private_key = load_pem_private_key(data, password=None)
+            keys[kid] = SigningKey(kid, algorithm, private_key, private_key.public_key())
+    return [keys[kid] for kid in sorted(keys)]
+
+
+_key_ring = None
+_key_ring_state = None
+_key_ring_checked_at = 0.0
+_key_ring_lock = threading.Lock()
+
+
+def _keys_dir_state():
+    algorithm = getattr(settings, 'JWT_ALGORITHM', 'HS256')
+    keys_dir = getattr(settings, 'JWT_KEYS_DIR', None)
+    if not keys_dir or algorithm in HMAC_ALGORITHMS:
+        return algorithm
+    files = tuple(sorted((name, os.stat(os.path.join(keys_dir, name)).st_mtime) for name in os.listdir(keys_dir)))
+    return algorithm, keys_dir, files
+
+
+def get_key_ring() -> KeyRing:
+    """
+        Return process-wide key ring.
+        Keys directory is checked at most once per JWT_KEYS_RELOAD_INTERVAL seconds
+        and ring is reloaded if files were added, removed or changed.
+    """
+    global _key_ring, _key_ring_state, _key_ring_checked_at
+    now = time.monotonic()
+    if _key_ring is not None and now - _key_ring_checked_at < getattr(settings, 'JWT_KEYS_RELOAD_INTERVAL', 60):
+        return _key_ring
+    with _key_ring_lock:
+        state = _keys_dir_state()
+        if _key_ring is None or state != _key_ring_state:
+            _key_ring = KeyRing.from_settings()
+            _key_ring_state = state
+        _key_ring_checked_at = now
+    return _key_ring
+
+
+def reset_key_ring():
+    """ Drop current key ring. Next call of get_key_ring() will load keys again """
+    global _key_ring, _key_ring_state
+    with _key_ring_lock:
+        _key_ring = None
+        _key_ring_state = None
@@ -13,13 +13,14 @@ class JWTSerializer(serializers.Serializer):
     refresh_token = serializers.CharField(read_only=True)
 
     @classmethod
-    def for_user(cls, user) -> JWTSerializer:
+    def for_user(cls, user, refresh_token: Token = None) -> JWTSerializer:
         """
             Get serializer with jwt tokens for user
-            user:   current user model
+            user:           current user model
+            refresh_token:  already generated refresh token, new session is started if not passed
         """
         access_token = AccessToken.for_user(user).b64_encoded
-        refresh_token = RefreshToken.for_user(user).b64_encoded
+        refresh_token = (refresh_token or RefreshToken.for_user(user)).b64_encoded
         return cls({'access_token': access_token.decode(),
                     'refresh_token': refresh_token.decode()})
 
@@ -50,9 +51,21 @@ class UpdateTokensSerializer(serializers.Serializer):
     def validate(self, attrs):
         token = attrs['refresh_token']
         try:
-            user = RefreshToken.get_user_from_token(token)
+            user, refresh_token = RefreshToken.rotate(token)
         except TokenException as te:
             raise ValidationError(str(te))
-        return JWTSerializer.for_user(user).data
+        return JWTSerializer.for_user(user, refresh_token=refresh_token).data
+
+
+class RevokeTokensSerializer(serializers.Serializer):
+    refresh_token = serializers.CharField()
+    all_sessions = serializers.BooleanField(default=False, help_text='revoke refresh tokens of all devices')
+
+    def validate(self, attrs):
+        try:
+            RefreshToken.revoke(attrs['refresh_token'], all_sessions=attrs['all_sessions'])
+        except TokenException as te:
+            raise ValidationError(str(te))
+        return attrs
 
 
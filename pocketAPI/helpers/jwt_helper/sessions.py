@@ -0,0 +1,115 @@
+import hashlib
+import uuid
+from typing import List
+
+from django.conf import settings
+
+from redis_helper import get_redis, make_key, pipeline
+
+from .exceptions import TokenException
+
+# KEYS[1] - session key, ARGV: old token id, new token id, lifetime
+# 1 - token rotated, 0 - old token is reused (session is revoked), -1 - session does not exist
+ROTATE_SCRIPT = '''
+local current = redis.call('HGET', KEYS[1], 'jti')
+if not current then
+    return -1
+end
+if current ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+'''
+
+_rotate_script = None
+
+
+def _session_key(session_id) -> str:
+    key = f'refresh-session:{session_id}:{settings.SECRET_KEY}'
+    return make_key(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
+def _user_sessions_key(user_id) -> str:
+    key = f'refresh-sessions:{user_id}:{settings.SECRET_KEY}'
+    return make_key(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
+def new_token_id() -> str:
+    return uuid.uuid4().hex
+
+
+def start_session(user_id, token_id: str, lifetime: int) -> str:
+    """
+        Start new device session with refresh token token_id.
+        Return session id.
+    """
+    session_id = uuid.uuid4().hex
+    pipe = pipeline()
+    pipe.hset(_session_key(session_id), mapping={'user_id': user_id, 'jti': token_id})
+    pipe.expire(_session_key(session_id), lifetime)
+    pipe.sadd(_user_sessions_key(user_id), session_id)
+    pipe.expire(_user_sessions_key(user_id), lifetime)
+    pipe.execute()
+    return session_id
+
+
+def check_session(session_id, token_id: str):
+    """ Raises TokenException if refresh token is not the current token of session """
+    if get_redis().hget(_session_key(session_id), 'jti') != token_id.encode('utf-8'):
+        raise TokenException('Refresh token invalid')
+
+
+def rotate_session(session_id, user_id, token_id: str, new_token_id: str, lifetime: int):
+    """
+        Replace current refresh token of session with new one.
+        Reuse of already rotated token means that token was stolen, so the whole session is revoked.
+        Raises TokenException if token can not be rotated.
+    """
+    global _rotate_script
+    redis = get_redis()
+    if _rotate_script is None:
+        _rotate_script = redis.register_script(ROTATE_SCRIPT)
+    result = _rotate_script(keys=[_session_key(session_id)], args=[token_id, new_token_id, lifetime], client=redis)
+    if result == 0:
+        redis.srem(_user_sessions_key(user_id), session_id)
+        raise TokenException('Refresh token was already used, session is revoked')
+    if result != 1:
+        raise TokenException('Refresh token invalid')
+    redis.expire(_user_sessions_key(user_id), lifetime)
+
+
+def get_user_sessions(user_id) -> List[str]:
+    """ Return ids of alive sessions of user """
+    redis = get_redis()
+    session_ids = [session_id.decode() for session_id in redis.smembers(_user_sessions_key(user_id))]
+    if not session_ids:
+        return []
+    pipe = pipeline(transaction=False)
+    for session_id in session_ids:
+        pipe.exists(_session_key(session_id))
+    alive = pipe.execute()
+    dead = [session_id for session_id, exists in zip(session_ids, alive) if not exists]
+    if dead:
+        redis.srem(_user_sessions_key(user_id), *dead)
+    return [session_id for session_id, exists in zip(session_ids, alive) if exists]
+
+
+def revoke_session(session_id, user_id):
+    pipe = pipeline()
+    pipe.delete(_session_key(session_id))
+    pipe.srem(_user_sessions_key(user_id), session_id)
+    pipe.execute()
+
+
+def revoke_user_sessions(user_id):
+    """ Revoke refresh tokens of all devices of user """
+    redis = get_redis()
+    session_ids = redis.smembers(_user_sessions_key(user_id))
+    pipe = pipeline()
+    for session_id in session_ids:
+        pipe.delete(_session_key(session_id.decode()))
+    pipe.delete(_user_sessions_key(user_id))
+    pipe.execute()
@@ -1,14 +1,18 @@
 import binascii
 import hashlib
 import base64
-from typing import Dict, Union
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Union
 
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.conf import settings
-import jwt
 
+from . import sessions
 from .exceptions import TokenException
+from .keys import HMAC_ALGORITHMS, KeyRing, SigningKey, get_key_ring
+from .user_cache import get_cached_user_data, make_token_user
 
 UserModel = get_user_model()
 
@@ -30,6 +34,81 @@ ALGORITHMS = (
 )
 
 
+class DecodedTokenCache:
+    """
+        LRU cache of verified token payloads.
+        Key is sha256 digest of token, value is payload. Payload is kept until its expired_time,
+        so signature of token which is used again and again is verified only once.
+        max_size:   how many tokens can be stored, 0 disables cache
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = self._key(token)
+        with self._lock:
+            payload = self._payloads.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            if payload['expired_time'] < timezone.now().timestamp():
+                del self._payloads[key]
+                self.misses += 1
+                return None
+            self._payloads.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def set(self, token: str, payload: Dict[str, Any]):
+        if self.max_size <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._payloads[key] = payload
+            self._payloads.move_to_end(key)
+            while len(self._payloads) > self.max_size:
+                self._payloads.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, token: str):
+        with self._lock:
+            self._payloads.pop(self._key(token), None)
+
+    def invalidate_user(self, user_id):
+        """ Remove all tokens of user """
+        with self._lock:
+            for key in [key for key, payload in self._payloads.items() if payload.get('user_id') == user_id]:
+                del self._payloads[key]
+
+    def clear(self):
+        with self._lock:
+            self._payloads.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self._payloads),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+decoded_tokens = DecodedTokenCache(max_size=getattr(settings, 'JWT_DECODED_TOKEN_CACHE_SIZE', 10000))
+
+
 class Token:
     def __init__(self, value):
         self._value = value
@@ -58,8 +137,10 @@ class TokenGenerator:
     """
     TOKEN_CLASS = Token
 
-    def __init__(self, algorithm: str = 'HS256', lifetime: int = 60 * 60):
+    def __init__(self, algorithm: str = None, lifetime: int = 60 * 60):
         self.lifetime = lifetime
+        if algorithm is None:
+            algorithm = getattr(settings, 'JWT_ALGORITHM', 'HS256')
         self._validate_algorithm(algorithm)
         self.algorithm = algorithm
 
@@ -68,32 +149,46 @@ class TokenGenerator:
         if algorithm not in ALGORITHMS:
             raise TokenException('algorithm {} is not valid'.format(algorithm))
 
-    def decode_token(self, token: str) -> Dict[str, any]:
-        return jwt.decode(token, key=settings.SECRET_KEY, algorithms=(self.algorithm,))
+    def get_key_ring(self) -> KeyRing:
+        """ Return keys for algorithm: configured key ring or SECRET_KEY for other HS* algorithm """
+        key_ring = get_key_ring()
+        if key_ring.algorithm == self.algorithm:
+            return key_ring
+        if self.algorithm in HMAC_ALGORITHMS:
+            return KeyRing(self.algorithm, [SigningKey(None, self.algorithm, settings.SECRET_KEY, settings.SECRET_KEY)])
+        raise TokenException('there are no keys for algorithm {}'.format(self.algorithm))
+
+    def decode_token(self, token: str) -> Dict[str, Any]:
+        return self.get_key_ring().decode(token)
 
-    def get_payload(self) -> Dict[str, any]:
+    def get_payload(self) -> Dict[str, Any]:
         return {
             'expired_time': (timezone.now() + timezone.timedelta(seconds=self.lifetime)).timestamp()
         }
 
     def generate_token(self):
-        token = jwt.encode(payload=self.get_payload(), key=settings.SECRET_KEY, algorithm=self.algorithm)
+        token = self.get_key_ring().encode(self.get_payload())
         return self.TOKEN_CLASS(token)
 
 
 class UserTokenGenerator(TokenGenerator):
     """ Token generator for creating token with user info """
-    def __init__(self, user_id: str or int, username: str, **kwargs):
+    def __init__(self, user_id: str or int, username: str, is_confirmed: bool = False,
+                 claims: Dict[str, Any] = None, **kwargs):
         super().__init__(**kwargs)
         self.user_id = user_id
         self.username = username
+        self.is_confirmed = is_confirmed
+        self.claims = claims or {}
 
     def get_payload(self) -> dict:
         payload = super(UserTokenGenerator, self).get_payload()
         payload.update({
             'user_id': self.user_id,
-            'username': self.username
+            'username': self.username,
+            'is_confirmed': self.is_confirmed,
         })
+        payload.update(self.claims)
         return payload
 
 
@@ -103,59 +198,148 @@ class AccessToken:
 
     @classmethod
     def for_user(cls, user: UserModel) -> Token:
-        """ Generate token for user with info: user_id and username """
-        generator = UserTokenGenerator(user_id=user.id, username=user.username, lifetime=cls.lifetime)
+        """ Generate token for user with info: user_id, username and is_confirmed """
+        generator = UserTokenGenerator(user_id=user.id, username=user.username, is_confirmed=user.is_confirmed,
+                                       lifetime=cls.lifetime)
         return generator.generate_token()
 
     @classmethod
-    def get_user_from_token(cls, token: str) -> Union[UserModel, None]:
+    def get_payload_from_token(cls, token: str) -> Dict[str, Any]:
         """
-            Return user from base64 encoded token and encoded token.
-            Raises TokenException if token invalid.
+            Return payload from base64 encoded token.
+            Raises TokenException if token invalid or expired.
         """
-        try:
-            token = base64.b64decode(token).decode()
-        except binascii.Error:
-            raise TokenException('Can not decode token')
-
-        token = TokenGenerator().decode_token(token)
+        payload = decoded_tokens.get(token)
+        if payload is None:
+            try:
+                decoded_token = base64.b64decode(token).decode()
+            except binascii.Error:
+                raise TokenException('Can not decode token')
+            payload = TokenGenerator().decode_token(decoded_token)
+            decoded_tokens.set(token, payload)
 
-        if token['expired_time'] < timezone.now().timestamp():
+        if payload['expired_time'] < timezone.now().timestamp():
             raise TokenException('Lifetime of token expired')
+        return payload
 
-        user_id, username = token.get('user_id'), token.get('username')
+    @classmethod
+    def get_user_from_db(cls, user_id, username) -> UserModel:
+        try:
+            return UserModel.objects.get(username=username, id=user_id)
+        except UserModel.DoesNotExist:
+            raise TokenException('Invalid token')
 
-        if user_id and username:
-            try:
-                user = UserModel.objects.get(username=username, id=user_id)
-            except UserModel.DoesNotExist:
-                raise TokenException('Invalid token')
-            else:
-                return user
-        else:
+    @classmethod
+    def get_user_from_payload(cls, payload: Dict[str, Any]) -> UserModel:
+        """
+            Return user for token payload.
+            JWT_STATELESS_USER:     user is built from signed claims, without any query
+            JWT_USER_CACHE_TTL:     user fields are cached in memory and redis
+            otherwise user is loaded from database.
+        """
+        user_id, username = payload.get('user_id'), payload.get('username')
+        if not (user_id and username):
             raise TokenException('Token does not provide user info')
 
+        if getattr(settings, 'JWT_STATELESS_USER', False):
+            return make_token_user({
+                'id': user_id,
+                'username': username,
+                'is_confirmed': payload.get('is_confirmed', False),
+            })
+        if getattr(settings, 'JWT_USER_CACHE_TTL', 0):
+            return cls.get_user_from_cached_data(get_cached_user_data(user_id), username)
+        return cls.get_user_from_db(user_id, username)
+
+    @classmethod
+    def get_user_from_cached_data(cls, data: Optional[Dict[str, Any]], username: str) -> UserModel:
+        """ User from cached fields, deleted, renamed and deactivated users are rejected """
+        if data is None or data['username'] != username or not data['is_active']:
+            raise TokenException('Invalid token')
+        return make_token_user(data)
+
+    @classmethod
+    def get_user_from_token(cls, token: str) -> Union[UserModel, None]:
+        """
+            Return user from base64 encoded token and encoded token.
+            Raises TokenException if token invalid.
+        """
+        return cls.get_user_from_payload(cls.get_payload_from_token(token))
+
 
 class RefreshToken(AccessToken):
-    """ Refresh Token for updating access and refresh tokens """
+    """
+        Refresh Token for updating access and refresh tokens.
+        Every login starts new device session (sid claim) in redis, session keeps id of its current token (jti claim).
+        Token can be used only once: on update it is replaced with new token of the same session.
+    """
     lifetime = getattr(settings, 'REFRESH_TOKEN_LIFETIME', 60*60*3)
 
     @classmethod
-    def for_user(cls, user: UserModel) -> Token:
-        token = super().for_user(user)
-        user.set_refresh_token(token)
-        user.save()
-        return token
+    def for_user(cls, user: UserModel, session_id: str = None, token_id: str = None) -> Token:
+        """ Generate refresh token. New device session is started if session_id is not passed """
+        if token_id is None:
+            token_id = sessions.new_token_id()
+        if session_id is None:
+            session_id = sessions.start_session(user.id, token_id, cls.lifetime)
+        generator = UserTokenGenerator(user_id=user.id, username=user.username, is_confirmed=user.is_confirmed,
+                                       lifetime=cls.lifetime, claims={'sid': session_id, 'jti': token_id})
+        return generator.generate_token()
+
+    @classmethod
+    def get_session_claims(cls, payload: Dict[str, Any]) -> Tuple[str, str]:
+        session_id, token_id = payload.get('sid'), payload.get('jti')
+        if not (session_id and token_id):
+            raise TokenException('Refresh token invalid')
+        return session_id, token_id
+
+    @classmethod
+    def get_user_from_payload(cls, payload: Dict[str, Any]) -> UserModel:
+        """ Refresh token is used rarely, so user is always loaded from database """
+        user_id, username = payload.get('user_id'), payload.get('username')
+        if not (user_id and username):
+            raise TokenException('Token does not provide user info')
+        return cls.get_user_from_db(user_id, username)
 
     @classmethod
     def get_user_from_token(cls, token: str) -> Union[UserModel, None]:
         """
-            Return user from base64 encoded token and encoded token.
+            Return user from base64 encoded token if token is current token of its session.
             Raises TokenException if token invalid.
         """
-        user = super().get_user_from_token(token)
-        token = base64.b64decode(token.encode('utf-8'))
-        if hashlib.md5(token).hexdigest() != user.refresh_token_hash:
-            raise TokenException('Refresh token invalid')
+        payload = cls.get_payload_from_token(token)
+        session_id, token_id = cls.get_session_claims(payload)
+        user = cls.get_user_from_payload(payload)
+        sessions.check_session(session_id, token_id)
         return user
 
+    @classmethod
+    def rotate(cls, token: str) -> Tuple[UserModel, Token]:
+        """
+            Replace base64 encoded refresh token with new token of the same session.
+            Reused token revokes the session.
+            Raises TokenException if token invalid.
+        """
+        payload = cls.get_payload_from_token(token)
+        session_id, token_id = cls.get_session_claims(payload)
+        user = cls.get_user_from_payload(payload)
+        new_token_id = sessions.new_token_id()
+        try:
+            sessions.rotate_session(session_id, user.id, token_id, new_token_id, cls.lifetime)
+        finally:
+            decoded_tokens.invalidate(token)
+        return user, cls.for_user(user, session_id=session_id, token_id=new_token_id)
+
+    @classmethod
+    def revoke(cls, token: str, all_sessions: bool = False) -> UserModel:
+        """
+            Revoke session of base64 encoded refresh token or all sessions of its user.
+            Raises TokenException if token invalid.
+        """
+        user = cls.get_user_from_token(token)
+        if all_sessions:
+            sessions.revoke_user_sessions(user.id)
+        else:
+            sessions.revoke_session(cls.get_session_claims(cls.get_payload_from_token(token))[0], user.id)
+        decoded_tokens.invalidate(token)
+        return user
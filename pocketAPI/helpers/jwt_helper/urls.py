@@ -1,9 +1,11 @@
 from django.urls import path
 
-from .views import UpdateTokensView
+from .views import KeySetView, RevokeTokensView, UpdateTokensView
 
 app_name = 'jwt_helper'
 
 urlpatterns = [
     path('update-tokens/', UpdateTokensView.as_view(), name='update-tokens'),
+    path('revoke-tokens/', RevokeTokensView.as_view(), name='revoke-tokens'),
+    path('keys/', KeySetView.as_view(), name='keys'),
 ]
\ No newline at end of file
@@ -0,0 +1,85 @@
+import json
+import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from redis_helper import delete_from_redis, get_from_redis, save_to_redis
+
+UserModel = get_user_model()
+
+CACHED_USER_FIELDS = ('id', 'username', 'email', 'is_confirmed', 'is_active')
+
+# user_id: (expiration time, user data)
+_local_cache = {}
+
+
+def make_token_user(data: Dict[str, Any]) -> UserModel:
+    """
+        Create user instance from known fields without querying database.
+        Other fields are deferred and will be loaded from database on first access.
+    """
+    return UserModel.from_db(DEFAULT_DB_ALIAS, list(data.keys()), list(data.values()))
+
+
+def get_user_cache_key(user_id) -> str:
+    return f'jwt-user:{user_id}'
+
+
+def get_local_user_data(user_id) -> Optional[Dict[str, Any]]:
+    """ User fields from memory of current process, None if they are not cached or expired """
+    cached = _local_cache.get(user_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+def set_local_user_data(user_id, data: Dict[str, Any]):
+    if len(_local_cache) >= settings.JWT_USER_LOCAL_CACHE_SIZE:
+        _local_cache.clear()
+    _local_cache[user_id] = (time.monotonic() + settings.JWT_USER_LOCAL_CACHE_TTL, data)
+
+
+def get_cached_user_data(user_id) -> Optional[Dict[str, Any]]:
+    """
+        Return user fields needed for authentication.
+        Data is taken from process memory, then from redis and only then from database.
+        Return None if user does not exist.
+    """
+    data = get_local_user_data(user_id)
+    if data is not None:
+        return data
+
+    value = get_from_redis(get_user_cache_key(user_id))
+    if value is not None:
+        data = json.loads(value)
+    else:
+        data = UserModel.objects.filter(pk=user_id).values(*CACHED_USER_FIELDS).first()
+        if data is None:
+            return None
+        save_to_redis(get_user_cache_key(user_id), json.dumps(data), time=settings.JWT_USER_CACHE_TTL)
+
+    set_local_user_data(user_id, data)
+    return data
+
+
+def invalidate_cached_user(user_id):
+    """
+        Remove user from redis and from memory of current process.
+        Other processes will see changes after JWT_USER_LOCAL_CACHE_TTL.
+    """
+    _local_cache.pop(user_id, None)
+    delete_from_redis(get_user_cache_key(user_id))
+
+
+@receiver(post_save, sender=UserModel, dispatch_uid='jwt_helper.invalidate_cached_user.save')
+@receiver(post_delete, sender=UserModel, dispatch_uid='jwt_helper.invalidate_cached_user.delete')
+def invalidate_cached_user_handler(sender, instance, **kwargs):
+    # before commit concurrent request still reads old row and would cache it again
+    if getattr(settings, 'JWT_USER_CACHE_TTL', 0):
+        user_id = instance.pk
+        transaction.on_commit(lambda: invalidate_cached_user(user_id))
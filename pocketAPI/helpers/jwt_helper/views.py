@@ -1,8 +1,13 @@
+from django.conf import settings
+from django.utils.cache import patch_cache_control
 from drf_yasg.utils import swagger_auto_schema
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from jwt_helper.serializers import JWTSerializer, UpdateTokensSerializer
+from jwt_helper.keys import get_key_ring
+from jwt_helper.serializers import JWTSerializer, RevokeTokensSerializer, UpdateTokensSerializer
+from serializers_helpers import MessageSerializer
 
 
 class UpdateTokensView(APIView):
@@ -19,3 +24,38 @@ class UpdateTokensView(APIView):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid(raise_exception=True):
             return Response(serializer.validated_data)
+
+
+class RevokeTokensView(APIView):
+    """
+        Logout: revoke refresh token of current device or of all devices.
+        Access tokens stay valid until their lifetime is expired.
+    """
+    serializer_class = RevokeTokensSerializer
+
+    def get_serializer(self):
+        return self.serializer_class()
+
+    @swagger_auto_schema(
+        operation_description='Revoke refresh token',
+        responses={200: MessageSerializer()}
+    )
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'message': 'Refresh token is revoked'})
+
+
+class KeySetView(APIView):
+    """
+        Public keys for verifying tokens in JWKS format.
+        Other services can cache it and verify tokens locally, token header kid points to key.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(operation_description='Public keys for verifying jwt tokens')
+    def get(self, request):
+        response = Response(get_key_ring().jwks())
+        patch_cache_control(response, public=True, max_age=settings.JWT_KEYS_CACHE_MAX_AGE)
+        return response
@@ -0,0 +1,31 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from rest_framework import serializers
+
+# money is stored as numeric(14, 2): up to 999 999 999 999.99 roubles
+MONEY_MAX_DIGITS = 14
+MONEY_DECIMAL_PLACES = 2
+MONEY_QUANT = Decimal(1).scaleb(-MONEY_DECIMAL_PLACES)
+
+
+def to_money(value) -> Decimal:
+    """
+        Convert value to Decimal with money precision.
+        Floats are converted through str, so 0.1 becomes Decimal('0.10'), not 0.1000000000000000055...
+    """
+    if isinstance(value, float):
+        value = str(value)
+    return Decimal(value).quantize(MONEY_QUANT, rounding=ROUND_HALF_UP)
+
+
+class MoneySerializerField(serializers.DecimalField):
+    """
+        Serializer field for money values.
+        Value is rendered in json as number (not string) to keep api format.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_digits', MONEY_MAX_DIGITS)
+        kwargs.setdefault('decimal_places', MONEY_DECIMAL_PLACES)
+        kwargs.setdefault('coerce_to_string', False)
+        super().__init__(**kwargs)
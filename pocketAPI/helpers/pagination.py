@@ -0,0 +1,156 @@
+from collections import OrderedDict
+
+import coreapi
+import coreschema
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+        Keyset (cursor) pagination.
+        Page is selected with WHERE date_created <= x AND (date_created < x OR (date_created = x AND id < y)),
+        where x, y are values of the last object, instead of OFFSET. Bound on the first ordering field is used
+        as range condition of (pocket, date_created, id) index, so the cost of a page does not depend on how deep it is.
+        Cursor is signed list of ordering values of the last object on the page.
+        Count of all objects is calculated only if client asks for it with ?count=true.
+    """
+    ordering = ('-date_created', '-id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+    cursor_salt = 'pagination.keyset'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'REST_FRAMEWORK', {}).get('PAGE_SIZE') or 50
+        self.max_page_size = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', 500)
+
+    def get_ordering(self, view):
+        return getattr(view, 'pagination_ordering', self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True,
+                                 cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def is_count_requested(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def encode_cursor(self, position):
+        return signing.dumps(position, salt=self.cursor_salt, compress=True)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is None:
+            return None
+        try:
+            position = signing.loads(cursor, salt=self.cursor_salt)
+        except signing.BadSignature:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    @staticmethod
+    def get_position_filter(ordering, position):
+        """
+            Build filter for objects after position:
+            (a, b) > (x, y)  <=>  a >= x AND (a > x OR (a = x AND b > y))
+            Redundant a >= x is needed because database does not use OR as index range condition.
+        """
+        filters = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            filters |= Q(**equal, **{'{}__{}'.format(name, lookup): value})
+            equal[name] = value
+        first_field = ordering[0]
+        bound = {'{}__{}'.format(first_field.lstrip('-'), 'lte' if first_field.startswith('-') else 'gte'): position[0]}
+        return Q(**bound) & filters
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        self.count = queryset.count() if self.is_count_requested(request) else None
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(self.ordering, position))
+
+        # one more object for checking if there is next page
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [str(getattr(last, field.lstrip('-'))) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('first', self.get_first_link()),
+        ])
+        if self.count is not None:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'first': {'type': 'string'},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_fields(self, view):
+        assert (
+            coreapi is not None
+        ), "coreapi must be installed to use `get_schema_fields()`"
+        assert (
+            coreschema is not None
+        ), "coreschema must be installed to use `get_schema_fields()`"
+        return [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(description='The pagination cursor value.'),
+            ),
+            coreapi.Field(
+                name=self.page_size_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.Integer(description='Number of results to return per page.'),
+            ),
+            coreapi.Field(
+                name=self.count_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.Boolean(description='Return count of all results.'),
+            ),
+        ]
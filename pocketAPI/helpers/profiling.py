@@ -0,0 +1,239 @@
+import asyncio
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, PermissionDenied
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+
+class RequestStats:
+    """ Cost of one request: SQL queries, redis calls and emails """
+
+    def __init__(self):
+        self.sql_queries = 0
+        self.sql_time = 0.0
+        self.redis_calls = 0
+        self.redis_time = 0.0
+        self.emails = 0
+
+
+# stats of current request, context variable is copied to threads of sync_to_async and to tasks,
+# so queries of async views which are run in thread pool are recorded to the same request
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+def record_sql(execute, sql, params, many, context):
+    """ Database execute wrapper, it is installed to every connection and records queries of current request """
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_queries += 1
+        stats.sql_time += time.perf_counter() - start
+
+
+def install_sql_recorder(connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+def record_redis_call(seconds: float):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.redis_calls += 1
+        stats.redis_time += seconds
+
+
+def record_email():
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.emails += 1
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+class Metrics:
+    """
+        Histograms and counters per URL name, aggregated in process memory.
+        Every worker process has its own metrics.
+    """
+    HISTOGRAMS = (
+        ('request_duration_seconds', 'Wall time of request', DURATION_BUCKETS),
+        ('request_sql_queries', 'Number of SQL queries per request', COUNT_BUCKETS),
+        ('request_sql_duration_seconds', 'Time of SQL queries per request', DURATION_BUCKETS),
+        ('request_redis_calls', 'Number of redis calls per request', COUNT_BUCKETS),
+        ('request_redis_duration_seconds', 'Time of redis calls per request', DURATION_BUCKETS),
+        ('request_emails', 'Number of emails sent per request', COUNT_BUCKETS),
+    )
+
+    COUNTERS = (
+        ('list_cache_hits', 'Number of list responses read from cache'),
+        ('list_cache_misses', 'Number of list responses built and saved to cache'),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = defaultdict(int)
+
+    def observe(self, view: str, duration: float, stats: RequestStats):
+        values = (duration, stats.sql_queries, stats.sql_time, stats.redis_calls, stats.redis_time, stats.emails)
+        with self._lock:
+            histograms = self._histograms.get(view)
+            if histograms is None:
+                histograms = self._histograms[view] = [Histogram(buckets) for _, _, buckets in self.HISTOGRAMS]
+            for histogram, value in zip(histograms, values):
+                histogram.observe(value)
+
+    def increment(self, view: str, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name, view] += value
+
+    def get(self, view: str, name: str) -> Histogram:
+        index = [metric for metric, _, _ in self.HISTOGRAMS].index(name)
+        return self._histograms[view][index]
+
+    def get_counter(self, view: str, name: str) -> int:
+        return self._counters.get((name, view), 0)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def to_prometheus(self, prefix: str = 'pocketapi') -> str:
+        lines = []
+        with self._lock:
+            for index, (name, description, buckets) in enumerate(self.HISTOGRAMS):
+                metric = f'{prefix}_{name}'
+                lines.append(f'# HELP {metric} {description}')
+                lines.append(f'# TYPE {metric} histogram')
+                for view, histograms in sorted(self._histograms.items()):
+                    lines.extend(_histogram_lines(metric, view, histograms[index]))
+            for name, description in self.COUNTERS:
+                metric = f'{prefix}_{name}'
+                lines.append(f'# HELP {metric} {description}')
+                lines.append(f'# TYPE {metric} counter')
+                for (counter, view), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f'{metric}_total{{view="{view}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(metric: str, view: str, histogram: Histogram) -> Iterable[str]:
+    cumulative = 0
+    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+        cumulative += count
+        yield f'{metric}_bucket{{view="{view}",le="{bound}"}} {cumulative}'
+    yield f'{metric}_sum{{view="{view}"}} {histogram.sum}'
+    yield f'{metric}_count{{view="{view}"}} {histogram.count}'
+
+
+metrics = Metrics()
+
+
+class ProfilingMiddleware:
+    """
+        Record cost of every request per resolved URL name.
+        Enabled with PROFILING_ENABLED setting. With PROFILING_SAMPLE_RATE > 0 part of requests is run
+        under cProfile and stats are dumped to PROFILING_DUMP_DIR.
+        Under ASGI middleware is async, requests are not sampled by cProfile there: it profiles whole thread
+        and event loop runs other requests at the same time.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # handler awaits middleware which looks like coroutine function, as django.utils.deprecation does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        # connections of other threads (e.g. thread pool of async views) get recorder when they are connected
+        connection_created.connect(install_sql_recorder, dispatch_uid='profiling.install_sql_recorder')
+        for connection in connections.all():
+            install_sql_recorder(connection)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        profile = None
+        if random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 0):
+            profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            if profile is not None:
+                response = profile.runcall(self.get_response, request)
+            else:
+                response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        view = self.observe(request, time.perf_counter() - start, stats)
+        if profile is not None:
+            self.dump_profile(profile, view)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self.observe(request, time.perf_counter() - start, stats)
+        return response
+
+    @staticmethod
+    def observe(request, duration: float, stats: RequestStats) -> str:
+        view = request.resolver_match.view_name if request.resolver_match else 'unresolved'
+        metrics.observe(view, duration, stats)
+        return view
+
+    @staticmethod
+    def dump_profile(profile: cProfile.Profile, view: str):
+        dump_dir = settings.PROFILING_DUMP_DIR
+        os.makedirs(dump_dir, exist_ok=True)
+        file_name = '{}-{}-{}.prof'.format(view.replace(':', '.'), int(time.time() * 1000), os.getpid())
+        profile.dump_stats(os.path.join(dump_dir, file_name))
+
+
+def metrics_view(request):
+    """ Metrics in Prometheus text format, available only from PROFILING_METRICS_ALLOWED_IPS """
+    if request.META.get('REMOTE_ADDR') not in settings.PROFILING_METRICS_ALLOWED_IPS:
+        raise PermissionDenied()
+    return HttpResponse(metrics.to_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
@@ -1,16 +1,223 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
 import redis
 from django.conf import settings
 
+from profiling import record_redis_call
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+class CountingConnectionPool(redis.BlockingConnectionPool):
+    """
+        Bounded connection pool which counts created connections, connections in use
+        and how many times a caller had to wait for a free connection.
+        Counters are changed by threads of worker, so they are updated under lock.
+    """
+
+    def reset(self):
+        super().reset()
+        self._counters_lock = threading.Lock()
+        self.created_connections = 0
+        self.in_use_connections = 0
+        self.waits = 0
+
+    def make_connection(self):
+        connection = super().make_connection()
+        with self._counters_lock:
+            self.created_connections += 1
+        return connection
+
+    def get_connection(self, command_name, *keys, **options):
+        if self.pool.empty():
+            with self._counters_lock:
+                self.waits += 1
+        connection = super().get_connection(command_name, *keys, **options)
+        with self._counters_lock:
+            self.in_use_connections += 1
+        return connection
+
+    def release(self, connection):
+        if connection.pid == self.pid:
+            with self._counters_lock:
+                self.in_use_connections -= 1
+        super().release(connection)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._counters_lock:
+            return {
+                'max_connections': self.max_connections,
+                'created_connections': self.created_connections,
+                'in_use_connections': self.in_use_connections,
+                'waits': self.waits,
+            }
+
+
+class ProfiledPipeline(redis.client.Pipeline):
+    """ Pipeline which is recorded as one redis call of current request """
+
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            record_redis_call(time.perf_counter() - start)
+
+
+class ProfiledRedis(redis.StrictRedis):
+    """ Redis client which records every call for profiling middleware """
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            record_redis_call(time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return ProfiledPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def _create_pool() -> CountingConnectionPool:
+    return CountingConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+    )
+
+
+def get_connection_pool() -> CountingConnectionPool:
+    """
+        Return process-wide connection pool.
+        Pool is created lazily and re-created in child process after fork,
+        so pre-fork workers never share sockets with the master.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = _create_pool()
+                _pool_pid = pid
+    return _pool
+
+
+def reset_connection_pool():
+    """
+        Drop current pool. Next call of get_redis() will create new one.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.disconnect()
+        _pool = None
+        _pool_pid = None
+
+
+def _forget_pool_after_fork():
+    # sockets of the parent must not be closed or reused by the child
+    global _pool, _pool_pid
+    _pool = None
+    _pool_pid = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pool_after_fork)
+
+
+def get_redis() -> redis.StrictRedis:
+    """
+        Return redis client which uses shared connection pool.
+    """
+    return ProfiledRedis(connection_pool=get_connection_pool())
+
+
+def make_key(key) -> str:
+    return f'{settings.REDIS_PREFIX}-{key}'
+
+
+def pipeline(transaction: bool = True):
+    """
+        Return pipeline for sending several commands in one round trip.
+        Keys passed to pipeline must be prefixed with make_key().
+    """
+    return get_redis().pipeline(transaction=transaction)
+
 
 def save_to_redis(key, value, time=60):
-    key = f'{settings.REDIS_PREFIX}-{key}'
-    redis_instance = redis.StrictRedis(host=settings.REDIS_HOST,
-                                       port=settings.REDIS_PORT)
-    redis_instance.set(key, value, time)
+    get_redis().set(make_key(key), value, time)
 
 
 def get_from_redis(key):
-    key = f'{settings.REDIS_PREFIX}-{key}'
-    redis_instance = redis.StrictRedis(host=settings.REDIS_HOST,
-                                       port=settings.REDIS_PORT)
-    return redis_instance.get(key)
+    return get_redis().get(make_key(key))
+
+
+def delete_from_redis(*keys):
+    if keys:
+        get_redis().delete(*(make_key(key) for key in keys))
+
+
+def save_many_to_redis(mapping: Dict[str, Any], time=60):
+    """
+        Save several values with the same lifetime using one pipeline.
+    """
+    if not mapping:
+        return
+    pipe = pipeline()
+    for key, value in mapping.items():
+        pipe.set(make_key(key), value, time)
+    pipe.execute()
+
+
+def get_many_from_redis(keys: Iterable[str]) -> List[Optional[bytes]]:
+    """
+        Get several values with one MGET. Missed keys are returned as None.
+    """
+    keys = [make_key(key) for key in keys]
+    if not keys:
+        return []
+    return get_redis().mget(keys)
+
+
+def get_version(key) -> str:
+    """
+        Return current version of cached data, e.g. of all cached results of one user.
+        Missed version is created from current time, so it never matches version of old cached values.
+    """
+    redis_key = make_key(key)
+    client = get_redis()
+    version = client.get(redis_key)
+    if version is None:
+        client.set(redis_key, time.time_ns(), nx=True)
+        version = client.get(redis_key)
+    return version.decode('utf-8')
+
+
+def bump_versions(keys: Iterable[str]):
+    """
+        Set new versions, so values cached with old versions are not used anymore.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    version = time.time_ns()
+    pipe = pipeline(transaction=False)
+    for key in keys:
+        pipe.set(make_key(key), version)
+    pipe.execute()
+
+
+def get_pool_stats() -> Dict[str, int]:
+    """
+        Return counters of current process pool: to see pool saturation.
+    """
+    return get_connection_pool().get_stats()
@@ -0,0 +1,35 @@
+from typing import Callable, Iterable, Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountMixin:
+    """
+        Mixin for TestCase: check that endpoint makes fixed number of queries, however many rows it returns.
+    """
+
+    def assertConstantQueries(self, request: Callable, add_rows: Optional[Callable[[int], None]] = None,
+                              num: Optional[int] = None, sizes: Iterable[int] = (1, 10), using=DEFAULT_DB_ALIAS):
+        """
+            Call request after adding every number of rows from sizes and compare numbers of queries.
+            Streaming response is read inside the check. Per-process caches (e.g. current site) should be warmed up.
+            request:    function which makes request and returns response
+            add_rows:   function which creates rows for endpoint
+            num:        expected number of queries
+        """
+        counts = []
+        context = None
+        for size in sizes:
+            if add_rows is not None:
+                add_rows(size)
+            with CaptureQueriesContext(connections[using]) as context:
+                response = request()
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400)
+            counts.append(len(context))
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertEqual(len(set(counts)), 1, 'Number of queries depends on rows {}:\n{}'.format(counts, queries))
+        if num is not None:
+            self.assertEqual(counts[0], num, '{} queries executed, {} expected:\n{}'.format(counts[0], num, queries))
@@ -0,0 +1,78 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from redis.exceptions import NoScriptError
+from rest_framework.throttling import ScopedRateThrottle
+
+from redis_helper import get_redis, make_key
+
+# Sliding window log: sorted set of times of allowed requests in last window.
+# Returns 0 if request is allowed (and records it), otherwise milliseconds until the oldest request leaves window.
+# Time of redis is used, so all workers share one clock. Denied requests are not recorded.
+RATE_LIMIT_SCRIPT = """
+redis.replicate_commands()
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return 0
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return math.max(tonumber(oldest[2]) + window - now, 1)
+"""
+RATE_LIMIT_SCRIPT_SHA = hashlib.sha1(RATE_LIMIT_SCRIPT.encode('utf-8')).hexdigest()
+
+
+def get_rate_limit_args(scope: str, ident, limit: int, duration: int) -> list:
+    """ Arguments of RATE_LIMIT_SCRIPT for EVALSHA: number of keys, key, limit, window in ms, unique member """
+    key = make_key(RedisRateThrottle.cache_format % {'scope': scope, 'ident': ident})
+    return [1, key, limit, duration * 1000, uuid.uuid4().hex]
+
+
+def check_rate(scope: str, ident, limit: int, duration: int) -> int:
+    """
+        Record request of ident to scope if less than limit requests were recorded in last duration seconds.
+        Return 0 if request is allowed, otherwise milliseconds to wait.
+    """
+    args = get_rate_limit_args(scope, ident, limit, duration)
+    client = get_redis()
+    try:
+        return client.evalsha(RATE_LIMIT_SCRIPT_SHA, *args)
+    except NoScriptError:
+        # script cache of redis is empty after restart
+        return client.eval(RATE_LIMIT_SCRIPT, *args)
+
+
+def get_rate(scope: str):
+    """ Rate of scope from RATE_LIMITS ('5/min'), None if scope is not limited """
+    return settings.RATE_LIMITS.get(scope)
+
+
+class RedisRateThrottle(ScopedRateThrottle):
+    """
+        Throttle of views with throttle_scope, rates are taken from RATE_LIMITS setting.
+        Requests are counted per user, anonymous requests per IP, in sliding window which is checked and
+        updated atomically by lua script, so limit is shared by all workers.
+        DRF returns 429 response with Retry-After header if request is throttled.
+    """
+
+    def get_rate(self):
+        return get_rate(self.scope)
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        self.rate = self.get_rate() if self.scope else None
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        ident = request.user.pk if request.user and request.user.is_authenticated else self.get_ident(request)
+        self.wait_ms = check_rate(self.scope, ident, self.num_requests, self.duration)
+        return self.wait_ms == 0
+
+    def wait(self):
+        return self.wait_ms / 1000
@@ -6,9 +6,27 @@ REST_FRAMEWORK = {
         'helpers.jwt_helper.authentication.JWTAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': ['helpers.filters.CustomFilterBackend'],
+    'DEFAULT_PAGINATION_CLASS': 'helpers.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
     'NON_FIELD_ERRORS_KEY': 'errors',
+    # how many proxies add X-Forwarded-For before the app, 0 - client address is REMOTE_ADDR,
+    # otherwise clients could choose IP which their requests are rate limited by
+    'NUM_PROXIES': int(environ.get('NUM_PROXIES', 0)),
 }
+PAGINATION_MAX_PAGE_SIZE = 500
 AUTH_HEADER_NAME = 'Access-Token'
+# build request.user from access token claims, without query to users table. Deactivated or deleted user stays
+# authenticated until access token expires, so it is turned on only if this is acceptable
+JWT_STATELESS_USER = environ.get('JWT_STATELESS_USER') == 'True'
+JWT_USER_CACHE_TTL = 60  # if not stateless: seconds to keep user in redis, 0 to query database on every request
+JWT_USER_LOCAL_CACHE_TTL = 5  # seconds to keep user in process memory
+JWT_USER_LOCAL_CACHE_SIZE = 10000
+JWT_DECODED_TOKEN_CACHE_SIZE = 10000  # how many verified tokens are kept in process memory, 0 to disable
+JWT_ALGORITHM = environ.get('JWT_ALGORITHM', 'HS256')  # HS* uses SECRET_KEY, others use keys from JWT_KEYS_DIR
+JWT_KEYS_DIR = environ.get('JWT_KEYS_DIR')  # <kid>.pem private keys and <kid>.pub.pem retired public keys
+JWT_SIGNING_KID = environ.get('JWT_SIGNING_KID')  # key for new tokens, default is the last private key by name
+JWT_KEYS_RELOAD_INTERVAL = 60  # seconds between checks of JWT_KEYS_DIR for new keys
+JWT_KEYS_CACHE_MAX_AGE = 60 * 10  # seconds clients can cache key set
 
 # Swagger
 SWAGGER_SETTINGS = {
@@ -0,0 +1,39 @@
+"""
+Gunicorn config of production server.
+
+    gunicorn -c project/gunicorn.conf.py project.wsgi:application
+
+For ASGI set GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker and run project.asgi:application.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:80')
+chdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+raw_env = ['DJANGO_SETTINGS_MODULE={}'.format(os.environ.get('DJANGO_SETTINGS_MODULE', 'project.production_settings'))]
+
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# restart worker after number of requests to limit memory leaks, 0 - never
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# application is imported once by master, workers share its memory copy-on-write
+preload_app = True
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def when_ready(server):
+    # import all urls, views and serializers before fork, otherwise every worker imports them on first request
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+
+
+def pre_fork(server, worker):
+    # worker must open its own database connections, socket of master can not be shared
+    from django.db import connections
+    connections.close_all()
@@ -0,0 +1,27 @@
+from .api_settings import *
+
+DEBUG = False
+ALLOWED_HOSTS = environ.get('ALLOWED_HOSTS', '0.0.0.0,localhost').split(',')
+
+# keep database connection of worker between requests (seconds), 0 - new connection for every request
+DATABASES['default']['CONN_MAX_AGE'] = int(environ.get('DB_CONN_MAX_AGE', 60))
+
+# static files (swagger ui) are served by whitenoise from STATIC_ROOT, it is filled by `manage.py collectstatic`
+STATIC_ROOT = environ.get('STATIC_ROOT', str(BASE_DIR / 'static'))
+STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
+MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                  'whitenoise.middleware.WhiteNoiseMiddleware')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': environ.get('LOG_LEVEL', 'WARNING'),
+    },
+}
@@ -27,7 +27,7 @@ sys.path.insert(0, os.path.join(BASE_DIR, 'helpers'))
 SECRET_KEY = environ.get('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = environ.get('DEBUG')
+DEBUG = environ.get('DEBUG') == 'True'
 SITE_ID = 1
 ALLOWED_HOSTS = [
     '0.0.0.0',
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
     'apps.accounts',
     'apps.pocket',
     'apps.transactions',
+    'apps.mailing',
 
     # helpers
     'helpers.jwt_helper',
@@ -68,8 +69,19 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Profiling: cost of requests per URL name, metrics in Prometheus format on /metrics/
+PROFILING_ENABLED = environ.get('PROFILING_ENABLED') == 'True'
+PROFILING_SAMPLE_RATE = float(environ.get('PROFILING_SAMPLE_RATE', 0))  # part of requests to run under cProfile
+PROFILING_DUMP_DIR = environ.get('PROFILING_DUMP_DIR', '/tmp/pocketapi-profiles')
+PROFILING_METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+if PROFILING_ENABLED:
+    MIDDLEWARE.insert(0, 'profiling.ProfilingMiddleware')
+
 ROOT_URLCONF = 'project.urls'
 
+# read and confirmation code endpoints are served by async views, it is turned on by project.asgi
+ASYNC_VIEWS = environ.get('ASYNC_VIEWS') == 'True'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -150,12 +162,45 @@ EMAIL_PORT = os.environ['EMAIL_PORT']
 EMAIL_USE_SSL = os.environ['EMAIL_USE_SSL']
 EMAIL_HOST_USER = os.environ['EMAIL_HOST_USER']
 EMAIL_HOST_PASSWORD = os.environ['EMAIL_HOST_PASSWORD']
+EMAIL_USE_OUTBOX = True  # put emails to outbox and send them with `manage.py send_emails` worker
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 30  # seconds before second attempt, doubled after every failed attempt
+EMAIL_OUTBOX_POLL_INTERVAL = 2  # seconds
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 300  # seconds before emails of stopped worker are sent again
 
 # redis
 REDIS_HOST = os.environ['REDIS_HOST']
 REDIS_PORT = os.environ['REDIS_PORT']
 REDIS_PREFIX = 'pocketapi'
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+REDIS_POOL_TIMEOUT = int(os.environ.get('REDIS_POOL_TIMEOUT', 5))  # seconds to wait for free connection from pool
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 2))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 2))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
 
 # validation codes settings
 VALIDATION_CODE_LENGTH = 5
 VALIDATION_CODE_LIFETIME = 60*5  # how many seconds will be save confirmation code in redis
+
+# bulk operations settings
+BULK_TRANSACTIONS_MAX_SIZE = 500  # how many transactions can be sent in one bulk request
+
+# export settings
+EXPORT_CHUNK_SIZE = 2000  # how many rows are fetched from server-side cursor at once
+
+# http cache settings
+LIST_CACHE_TTL = int(environ.get('LIST_CACHE_TTL', 60*5))  # how many seconds list response is kept in redis, 0 - off
+
+# rate limits of endpoints which send emails or check passwords: {throttle_scope: 'requests/period'},
+# requests are counted per user, anonymous requests per IP
+RATE_LIMITS = {
+    'confirmation-code': '5/min',
+    'deletion-code': '5/min',
+    'login': '10/min',
+    'email-token': '3/min',
+} if environ.get('RATE_LIMITS_ENABLED', 'True') == 'True' else {}
+
+# analytics settings
+ANALYTICS_CACHE_TTL = 60*10  # how many seconds analytics result is kept in redis
+ANALYTICS_MAX_BUCKETS = 400  # how many periods can be requested at once
@@ -1,9 +1,13 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
 
+from health import health_view
+from profiling import metrics_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Pocket API",
@@ -19,8 +23,12 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('', schema_view.with_ui()),
     path('admin/', admin.site.urls),
+    path('health/', health_view, name='health'),
     path('accounts/', include('accounts.urls', namespace='accounts')),
     path('tokens/', include('jwt_helper.urls', namespace='jwt')),
     path('pocket/', include('pocket.urls', namespace='pocket')),
     path('transactions/', include('transactions.urls', namespace='transactions')),
-]
\ No newline at end of file
+]
+
+if settings.PROFILING_ENABLED:
+    urlpatterns.append(path('metrics/', metrics_view, name='metrics'))
\ No newline at end of file